@@ -0,0 +1,242 @@
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CONDICOES = [
+    (800, 'Clear', 'clear sky', '01d'),
+    (801, 'Clouds', 'few clouds', '02d'),
+    (803, 'Clouds', 'broken clouds', '04d'),
+    (500, 'Rain', 'light rain', '10d'),
+    (501, 'Rain', 'moderate rain', '10d'),
+    (211, 'Thunderstorm', 'thunderstorm', '11d'),
+]
+
+
+def cidades_sinteticas(n, seed=42):
+    """
+    Generate n Brazilian cities in the OpenWeather city.list.json format.
+
+    Args:
+        n (int): Number of cities.
+        seed (int, optional): Random seed, so every run uses the same list.
+
+    Returns:
+        list: City dicts with id, name, state, country and coord.
+    """
+    rnd = random.Random(seed)
+    return [{
+        'id': 3400000 + i,
+        'name': f'Cidade {i}',
+        'state': '',
+        'country': 'BR',
+        'coord': {'lon': round(rnd.uniform(-73.0, -35.0), 4), 'lat': round(rnd.uniform(-33.0, 5.0), 4)},
+    } for i in range(n)]
+
+
+def clima_payload(city_id, now=None):
+    """
+    A current-weather response shaped like OpenWeather's /data/2.5/weather,
+    deterministic per city. Rain and gusts appear only for some cities, as in the real API.
+    """
+    rnd = random.Random(city_id)
+    now = int(now or time.time())
+    cond_id, main, description, icon = rnd.choice(CONDICOES)
+    temp = rnd.uniform(283.0, 308.0)
+    payload = {
+        'coord': {'lon': round(rnd.uniform(-73.0, -35.0), 4), 'lat': round(rnd.uniform(-33.0, 5.0), 4)},
+        'weather': [{'id': cond_id, 'main': main, 'description': description, 'icon': icon}],
+        'base': 'stations',
+        'main': {
+            'temp': round(temp, 2),
+            'feels_like': round(temp + rnd.uniform(-2, 3), 2),
+            'temp_min': round(temp - rnd.uniform(0, 3), 2),
+            'temp_max': round(temp + rnd.uniform(0, 3), 2),
+            'pressure': rnd.randint(1000, 1025),
+            'humidity': rnd.randint(30, 100),
+            'sea_level': rnd.randint(1000, 1025),
+            'grnd_level': rnd.randint(900, 1020),
+        },
+        'visibility': 10000,
+        'wind': {'speed': round(rnd.uniform(0, 12), 2), 'deg': rnd.randint(0, 359)},
+        'clouds': {'all': rnd.randint(0, 100)},
+        'dt': now - rnd.randint(0, 600),
+        'sys': {'type': 2, 'id': rnd.randint(1000, 99999), 'country': 'BR',
+                'sunrise': now - rnd.randint(20000, 30000), 'sunset': now + rnd.randint(10000, 20000)},
+        'timezone': -10800,
+        'id': city_id,
+        'name': f'Cidade {city_id}',
+        'cod': 200,
+    }
+    if rnd.random() < 0.6:
+        payload['wind']['gust'] = round(payload['wind']['speed'] * rnd.uniform(1.1, 1.8), 2)
+    if main in ('Rain', 'Thunderstorm'):
+        payload['rain'] = {'1h': round(rnd.uniform(0.1, 8.0), 2)}
+    return payload
+
+
+def _haversine_km(origem, destino):
+    lat1, lon1 = map(math.radians, origem)
+    lat2, lon2 = map(math.radians, destino)
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+def directions_payload(origin, destination, passos=8):
+    """
+    A response shaped like Google's /maps/api/directions/json for one route between two 'lat,lon' points.
+    """
+    origem = tuple(float(v) for v in origin.split(','))
+    destino = tuple(float(v) for v in destination.split(','))
+    metros = int(_haversine_km(origem, destino) * 1000 * 1.3)  # Estradas são ~30% mais longas que a linha reta
+    segundos = int(metros / 22)  # ~80 km/h
+
+    def ponto(fracao):
+        return {'lat': origem[0] + (destino[0] - origem[0]) * fracao, 'lng': origem[1] + (destino[1] - origem[1]) * fracao}
+
+    steps = [{
+        'distance': {'text': f'{metros / passos / 1000:.1f} km', 'value': metros // passos},
+        'duration': {'text': f'{segundos // passos // 60} mins', 'value': segundos // passos},
+        'start_location': ponto(k / passos),
+        'end_location': ponto((k + 1) / passos),
+        'html_instructions': f'Siga pela <b>BR-{100 + k}</b>',
+        'polyline': {'points': 'a~l~Fjk~uOwHJy@P'},
+        'travel_mode': 'DRIVING',
+    } for k in range(passos)]
+    horas, minutos = divmod(segundos // 60, 60)
+    return {
+        'geocoded_waypoints': [{'geocoder_status': 'OK', 'place_id': 'fake', 'types': ['locality', 'political']}] * 2,
+        'routes': [{
+            'bounds': {'northeast': ponto(1), 'southwest': ponto(0)},
+            'copyrights': 'Map data',
+            'legs': [{
+                'distance': {'text': f'{metros / 1000:,.0f} km', 'value': metros},
+                'duration': {'text': f'{horas} hours {minutos} mins' if horas else f'{minutos} mins', 'value': segundos},
+                'start_address': f'{origin}, Brasil',
+                'end_address': f'{destination}, Brasil',
+                'start_location': ponto(0),
+                'end_location': ponto(1),
+                'steps': steps,
+                'traffic_speed_entry': [],
+                'via_waypoint': [],
+            }],
+            'overview_polyline': {'points': 'a~l~Fjk~uOwHJy@P' * passos},
+            'summary': 'BR-116',
+            'warnings': [],
+            'waypoint_order': [],
+        }],
+        'status': 'OK',
+    }
+
+
+class FakeApiServer:
+    """
+    Local HTTP stand-in for the OpenWeather and Directions APIs.
+
+    Serves /data/2.5/weather and /maps/api/directions/json on 127.0.0.1 from a
+    background thread, one thread per connection, with keep-alive. Each
+    request waits latency_ms (+/- jitter_ms) and fails with HTTP 500 with
+    probability error_rate. A fraction tail_rate of the requests takes an extra
+    tail_ms, the slow tail that dominates runs with many concurrent calls.
+    With rate_limit set, requests above that many per second get HTTP 429 with
+    a Retry-After header, like the real quotas.
+
+    Usage:
+        with FakeApiServer(latency_ms=30, error_rate=0.01) as api:
+            os.environ['OPENWEATHER_BASE_URL'] = api.url
+    """
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_limit=None, tail_ms=0.0, tail_rate=0.0,
+                 seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.tail_ms = tail_ms
+        self.tail_rate = tail_rate
+        self.rate_limit = rate_limit
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self._window = (0, 0)  # (segundo atual, requisições nele)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _sorteio(self):
+        with self._lock:
+            self.requests += 1
+            if self.rate_limit:
+                segundo = int(time.monotonic())
+                atual, quantidade = self._window
+                quantidade = quantidade + 1 if segundo == atual else 1
+                self._window = (segundo, quantidade)
+                if quantidade > self.rate_limit:
+                    self.throttled += 1
+                    return 0.0, 429
+            atraso = max(self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms), 0) / 1000
+            if self._random.random() < self.tail_rate:
+                atraso += self.tail_ms / 1000
+            falha = 500 if self._random.random() < self.error_rate else None
+            self.errors += falha is not None
+        return atraso, falha
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                atraso, falha = api._sorteio()
+                if atraso:
+                    time.sleep(atraso)
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+                if falha == 429:
+                    status, body = 429, {'cod': 429, 'message': 'Too many requests'}
+                elif falha:
+                    status, body = 500, {'cod': 500, 'message': 'Internal error'}
+                elif url.path == '/data/2.5/weather' and 'id' in query:
+                    status, body = 200, clima_payload(int(query['id']))
+                elif url.path == '/maps/api/directions/json' and 'origin' in query and 'destination' in query:
+                    status, body = 200, directions_payload(query['origin'], query['destination'])
+                else:
+                    status, body = 404, {'cod': 404, 'message': 'Not found'}
+
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                if status == 429:
+                    self.send_header('Retry-After', '1')
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
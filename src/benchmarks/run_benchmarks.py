@@ -0,0 +1,266 @@
+"""
+Benchmarks offline do pipeline.
+
+Sobe servidores HTTP locais no lugar das APIs do OpenWeather e do Directions
+(benchmarks/fake_apis.py), roda ClimateData, TrafficData e IntegracaoSilver de
+ponta a ponta sobre o backend SQLite em várias escalas e reporta vazão,
+percentis de latência HTTP e memória. Os resultados podem ser gravados em JSON
+e comparados com uma execução anterior para acusar regressões.
+
+Uso (a partir de src/):
+    python -m benchmarks.run_benchmarks --cidades 5,500,5000 --pares 10,1000,100000
+    python -m benchmarks.run_benchmarks --cidades 500 --pares 1000 --baseline ../data/benchmarks/base.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+
+import numpy as np
+
+from benchmarks.fake_apis import FakeApiServer, cidades_sinteticas
+
+
+def lista_inteiros(valor):
+    return [int(v) for v in valor.split(',') if v.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks offline do pipeline com APIs locais e SQLite.')
+    parser.add_argument('--cidades', type=lista_inteiros, default=[5, 500, 5000],
+                        help='escalas de cidades para bronze_clima e silver_clima (padrão: 5,500,5000)')
+    parser.add_argument('--pares', type=lista_inteiros, default=[10, 1000, 100000],
+                        help='escalas de pares para bronze_transito (padrão: 10,1000,100000)')
+    parser.add_argument('--workers', type=int, default=32, help='requisições simultâneas (padrão: 32)')
+    parser.add_argument('--latencia-ms', type=float, default=20.0, help='latência média das APIs locais (padrão: 20)')
+    parser.add_argument('--jitter-ms', type=float, default=10.0, help='variação da latência, +/- (padrão: 10)')
+    parser.add_argument('--taxa-erro', type=float, default=0.01, help='fração de respostas HTTP 500 (padrão: 0.01)')
+    parser.add_argument('--cauda-ms', type=float, default=0.0,
+                        help='atraso extra da fração --taxa-cauda das respostas (padrão: 0)')
+    parser.add_argument('--taxa-cauda', type=float, default=0.01, help='fração de respostas lentas (padrão: 0.01)')
+    parser.add_argument('--hedge', action='store_true',
+                        help='duplica requisições mais lentas que o p95 e usa a primeira resposta')
+    parser.add_argument('--limite-api', type=int, default=None, metavar='RPS',
+                        help='requisições por segundo aceitas pelas APIs locais; o excedente recebe HTTP 429')
+    parser.add_argument('--limitador', action='store_true',
+                        help='usa o limitador adaptativo das APIs (desligado por padrão nos benchmarks)')
+    parser.add_argument('--sem-checkpoint', action='store_true', help='roda as etapas sem checkpoints')
+    parser.add_argument('--dir', default=None, help='diretório de trabalho (padrão: temporário, apagado ao final)')
+    parser.add_argument('--saida', default=None,
+                        help='arquivo JSON com os resultados (padrão: ../data/benchmarks/bench-<data>.json)')
+    parser.add_argument('--baseline', default=None, help='resultados anteriores para comparar a vazão')
+    parser.add_argument('--tolerancia', type=float, default=0.2,
+                        help='queda de vazão aceita em relação ao baseline antes de acusar regressão (padrão: 0.2)')
+    parser.add_argument('--verbose', action='store_true', help='mostra a saída das etapas')
+    return parser.parse_args(argv)
+
+
+class LatencyRecorder:
+    """
+    Collects the latency of every response of the shared HTTP session through a requests response hook.
+    """
+    def __init__(self):
+        self.samples = []
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, response, *args, **kwargs):
+        with self._lock:
+            self.samples.append(response.elapsed.total_seconds() * 1000)
+            self.errors += response.status_code != 200
+        return response
+
+    def reset(self):
+        with self._lock:
+            self.samples, self.errors = [], 0
+
+    def summary(self):
+        with self._lock:
+            samples, errors = np.array(self.samples), self.errors
+        if not len(samples):
+            return {'http': 0, 'erros_http': 0}
+        p50, p90, p99, p999 = np.percentile(samples, [50, 90, 99, 99.9])
+        return {'http': len(samples), 'erros_http': errors, 'lat_p50_ms': round(p50, 2), 'lat_p90_ms': round(p90, 2),
+                'lat_p99_ms': round(p99, 2), 'lat_p999_ms': round(p999, 2), 'lat_max_ms': round(float(samples.max()), 2)}
+
+
+class Bench:
+    def __init__(self, args, workdir, latencias):
+        self.args = args
+        self.workdir = workdir
+        self.latencias = latencias
+        self.data_referencia = date.today()
+
+    def preparar(self, nome, cidades):
+        """
+        Cria um diretório e um banco SQLite isolados para o cenário e a lista de cidades.
+        """
+        root = os.path.join(self.workdir, nome)
+        os.makedirs(root, exist_ok=True)
+        os.environ['SQLITE_DIR'] = os.path.join(root, 'sqlite')
+        caminho = os.path.join(root, 'city_list.json')
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump(cidades_sinteticas(cidades), f)
+        return root, caminho
+
+    def medir(self, cenario, escala, itens, func):
+        """
+        Executa func e mede duração, vazão, latência HTTP e memória.
+        """
+        from utils.memory import MemoryTracker
+
+        tracker = MemoryTracker(enabled=True)
+        self.latencias.reset()
+        saida = contextlib.nullcontext() if self.args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with saida, tracker.track(cenario) as memoria:
+            inicio = time.perf_counter()
+            resultado = func()
+            segundos = time.perf_counter() - inicio
+
+        linha = {
+            'cenario': cenario,
+            'escala': escala,
+            'ok': resultado is not False,
+            'segundos': round(segundos, 3),
+            'itens': itens,
+            'itens_por_s': round(itens / segundos, 2) if segundos else None,
+            **self.latencias.summary(),
+            'rss_pico_mb': memoria.get('rss_peak_mb'),
+            'rss_delta_mb': memoria.get('rss_delta_mb'),
+        }
+        print(formatar(linha), flush=True)
+        return linha
+
+    def clima(self, cidades):
+        from features.feat_bronze_clima import ClimateData
+        from features.feat_silver_clima import IntegracaoSilver
+
+        root, lista = self.preparar(f'clima-{cidades}', cidades)
+        bronze = ClimateData(json_cities=lista, tamanho_amostral=None, insert_method='upsert',
+                             data_referencia=self.data_referencia, storage_root=root,
+                             workers=self.args.workers, checkpoint=not self.args.sem_checkpoint)
+        silver = IntegracaoSilver(insert_method='upsert', data_referencia=self.data_referencia, storage_root=root)
+        return [self.medir('bronze_clima', cidades, cidades, bronze.pipeline),
+                self.medir('silver_clima', cidades, cidades, silver.pipeline)]
+
+    def transito(self, pares):
+        from features.feat_bronze_clima import ClimateData
+        from features.feat_bronze_transito import TrafficData
+        from utils.bronze_reader import BronzeReader
+
+        # Menor quantidade de cidades cujas combinações cobrem os pares pedidos
+        cidades = max(math.ceil((1 + math.sqrt(1 + 8 * pares)) / 2), 2)
+        root, lista = self.preparar(f'transito-{pares}', cidades)
+        with contextlib.redirect_stdout(io.StringIO()):
+            ClimateData(json_cities=lista, tamanho_amostral=None, insert_method='upsert',
+                        data_referencia=self.data_referencia, storage_root=root,
+                        workers=self.args.workers, checkpoint=False).pipeline()
+        trafego = TrafficData(insert_method='upsert', data_referencia=self.data_referencia, storage_root=root,
+                              workers=self.args.workers, checkpoint=not self.args.sem_checkpoint)
+        # Cidades cuja coleta falhou na preparação (taxa de erro) não entram nos pares
+        try:
+            cidades = BronzeReader(root).read_arrow('city_information', self.data_referencia, columns=['id_city']).num_rows
+        except FileNotFoundError:
+            cidades = 0
+        total = cidades * (cidades - 1) // 2
+        return [self.medir('bronze_transito', pares, total, trafego.pipeline)]
+
+
+def formatar(linha):
+    latencia = (f"p50 {linha['lat_p50_ms']:>7.1f}ms p99 {linha['lat_p99_ms']:>7.1f}ms"
+                if 'lat_p50_ms' in linha else ' ' * 29)
+    return (f"{linha['cenario']:<16} {linha['escala']:>7} {'ok' if linha['ok'] else 'ERRO':<4} "
+            f"{linha['segundos']:>9.2f}s {linha['itens_por_s'] or 0:>10.1f}/s {latencia} "
+            f"http {linha.get('http', 0):>7} rss pico {linha['rss_pico_mb'] or 0:>8.1f}MB")
+
+
+def comparar(resultados, baseline_path, tolerancia):
+    """
+    Compara a vazão de cada cenário com o baseline.
+
+    Returns:
+        list: Cenários cuja vazão caiu mais que a tolerância.
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        anteriores = {(r['cenario'], r['escala']): r for r in json.load(f)['resultados']}
+
+    regressoes = []
+    print('\nComparação com o baseline:')
+    for linha in resultados:
+        anterior = anteriores.get((linha['cenario'], linha['escala']))
+        if not anterior or not anterior.get('itens_por_s') or not linha['itens_por_s']:
+            continue
+        variacao = linha['itens_por_s'] / anterior['itens_por_s'] - 1
+        regressao = variacao < -tolerancia
+        print(f"  {linha['cenario']:<16} {linha['escala']:>7} {variacao:+7.1%}{'  REGRESSÃO' if regressao else ''}")
+        if regressao:
+            regressoes.append(linha)
+    return regressoes
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.dir or tempfile.mkdtemp(prefix='zebrinha-bench-')
+    os.makedirs(workdir, exist_ok=True)
+
+    with FakeApiServer(latency_ms=args.latencia_ms, jitter_ms=args.jitter_ms, error_rate=args.taxa_erro,
+                       rate_limit=args.limite_api, tail_ms=args.cauda_ms, tail_rate=args.taxa_cauda) as api:
+        # Configuração lida pelas etapas e pelos módulos utils, antes de importá-los
+        os.environ.update({
+            'OPENWEATHER_BASE_URL': api.url,
+            'DIRECTIONS_BASE_URL': api.url,
+            'STORAGE_BACKEND': 'sqlite',
+            'HTTP_POOL_SIZE': str(args.workers),
+            'METRICS_PATH': os.path.join(workdir, 'metrics.jsonl'),
+            'STORAGE_ROOT': workdir,  # Cotas diárias do limitador ficam no diretório de trabalho
+            'RATE_LIMIT_ENABLED': '1' if args.limitador else '0',
+            'HTTP_HEDGE': '1' if args.hedge else '0',
+        })
+        from utils import http_client
+        from utils.metrics import metrics
+        from utils.database_operations import dispose_engines
+
+        metrics.configure(jsonl_path=os.path.join(workdir, 'metrics.jsonl'))
+        latencias = LatencyRecorder()
+        http_client.session().hooks['response'].append(latencias)
+        bench = Bench(args, workdir, latencias)
+
+        print(f"APIs locais em {api.url} (latência {args.latencia_ms:g}±{args.jitter_ms:g}ms, "
+              f"erro {args.taxa_erro:.1%}, cauda +{args.cauda_ms:g}ms em {args.taxa_cauda:.1%}, "
+              f"limite {args.limite_api or '-'} rps), {args.workers} workers, "
+              f"limitador {'ligado' if args.limitador else 'desligado'}, hedge {'ligado' if args.hedge else 'desligado'}, "
+              f"trabalho em {workdir}\n")
+        resultados = []
+        try:
+            for cidades in args.cidades:
+                resultados += bench.clima(cidades)
+            for pares in args.pares:
+                resultados += bench.transito(pares)
+        finally:
+            http_client.close()
+            dispose_engines()
+            if not args.dir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    saida = args.saida or os.path.join('..', 'data', 'benchmarks', f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump({'data': datetime.now().isoformat(), 'parametros': vars(args),
+                   'resultados': resultados}, f, indent=2, default=str)
+    print(f'\nResultados gravados em {saida}')
+
+    falhas = [linha for linha in resultados if not linha['ok']]
+    regressoes = comparar(resultados, args.baseline, args.tolerancia) if args.baseline else []
+    return 1 if falhas or regressoes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,32 +4,91 @@ import json
 import os
 import sys
 import pytz
+import functools
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Importar a classe DatabaseOps do módulo utils.database_operations
 src_dir = os.path.join(os.getcwd().split('src')[0], 'src','utils')
 sys.path.insert(0, src_dir)
 from utils.database_operations import DatabaseOps
+from utils.table_schemas import natural_keys
+from utils.metrics import metrics
+from utils.profiling import profiled
+from utils.memory import memory
+from utils.storage_paths import bronze_dir, storage_root
+from utils import http_client
+from utils.checkpoint import Checkpoint
+from utils.dead_letter import get_queue
+from utils.fingerprints import fingerprint, get_store
+from utils import bronze_store
+from utils.bronze_reader import BronzeReader
+from utils.city_index import CityIndex, get_index
+
+@functools.lru_cache(maxsize=4)
+def carregar_cidades_br(json_cities, modificado_em):
+    """
+    Lê a lista de cidades e mantém apenas as brasileiras. O resultado fica em
+    memória entre execuções no mesmo processo e é relido quando o arquivo muda
+    (modificado_em faz parte da chave do cache).
+
+    Args:
+        json_cities (str): Caminho do arquivo JSON de cidades.
+        modificado_em (int): Data de modificação do arquivo, em nanossegundos.
+
+    Returns:
+        tuple: (quantidade total de cidades, DataFrame com as cidades brasileiras).
+    """
+    with open(json_cities, encoding='utf-8') as my_json:
+        city_data = json.load(my_json)
+    df_id_list = pd.DataFrame(city_data)
+
+    df_id_list['id'] = df_id_list['id'].astype(int)
+    br_citys = df_id_list[df_id_list['country'] == 'BR'].reset_index(drop=True)
+    return len(df_id_list), br_citys
+
 
 class ClimateData:
     """
     Classe para manipulação de dados climáticos.
 
     Attributes:
-        today (datetime.date): Data atual.
+        today (datetime.date): Data de referência (data atual por padrão).
         ref_month (int): Mês de referência.
         ref_day (int): Dia de referência.
         local_dir (str): Diretório local onde os dados serão armazenados.
+        storage_root (str): Raiz dos arquivos locais (STORAGE_ROOT ou ../data por padrão).
+        workers (int): Quantidade de requisições simultâneas à API de clima.
+        checkpoint (Checkpoint): Progresso da etapa na data de referência, ou None se desativado.
+        fila_falhas (DeadLetterQueue): Cidades cuja coleta falhou, para o reprocessamento.
+        impressoes (FingerprintStore): Impressões das observações já carregadas, ou None sem detecção de mudanças.
+        chaves_naturais (dict): Chaves naturais de cada tabela, usadas no insert_method='upsert'.
     """
-    def __init__(self, json_cities: str, tamanho_amostral: int, insert_method: str='append'):
-        self.today = datetime.now().date()
+    chaves_naturais = natural_keys('bronze')
+    # Campos da resposta que definem uma observação: o horário (dt) e os valores medidos
+    CAMPOS_OBSERVACAO = ('dt', 'main', 'wind', 'weather', 'clouds', 'visibility', 'rain', 'snow')
+
+    def __init__(self, json_cities: str, tamanho_amostral: int=None, insert_method: str='append',
+                 data_referencia=None, storage_root: str=None, workers: int=1, checkpoint: bool=True,
+                 detectar_mudancas: bool=False, execucao: str=None):
+        self.today = data_referencia or datetime.now().date()
         self.ref_month = self.today.month
         self.ref_day = self.today.day
         self.local_dir = None  # Diretório local onde os dados serão armazenados
         self.json_cities = json_cities
-        self.tamanho_amostral = tamanho_amostral # quantidade de amostras que iremos extrair
+        self.tamanho_amostral = tamanho_amostral # quantidade de amostras que iremos extrair (None para todas)
+        self.storage_root = storage_root
+        self.workers = workers
+        # Cidades sorteadas, respostas da API e arquivos já gravados, para retomar uma execução interrompida;
+        # com execucao, apenas o checkpoint dessa mesma execução é retomado
+        self.checkpoint = Checkpoint('bronze_clima', self.today, storage_root, execucao) if checkpoint else None
+        self._respostas_salvas = None  # Respostas do checkpoint, lidas uma vez por execução
+        self.fila_falhas = get_queue(storage_root)  # Cidades que falharam ficam registradas até serem reprocessadas
+        # Com detecção de mudanças, observações iguais às já carregadas no dia não são gravadas de novo
+        self.impressoes = get_store(storage_root) if detectar_mudancas else None
         self.insert_method = insert_method # metodo de inserção no banco de dados
+        self.database = DatabaseOps() # conexão aberta sob demanda, no primeiro insert
 
     # Criação do diretório local para armazenar os dados meteorológicos
     def create_local_directory(self, ref_month, ref_day):
@@ -43,8 +102,7 @@ class ClimateData:
         Returns:
             str: Caminho completo para o diretório local criado.
         """
-        BRONZE_DIR = r'..\data\bronze'
-        local_dir = os.path.join(BRONZE_DIR, f'{ref_month}\{ref_day}')
+        local_dir = bronze_dir(ref_month, ref_day, self.storage_root)
         os.makedirs(local_dir, exist_ok=True)
         self.local_dir = local_dir  # Define o diretório local
         return local_dir
@@ -57,16 +115,57 @@ class ClimateData:
         Returns:
             DataFrame: DataFrame contendo informações das cidades brasileiras.
         """
-        with open(self.json_cities, encoding='utf-8') as my_json:
-            city_data = json.load(my_json)
-            df_id_list = pd.DataFrame(city_data)
-
-            df_id_list['id'] = df_id_list['id'].astype(int)
-            br_citys = df_id_list[df_id_list['country'] == 'BR']  
-            br_cidades = br_citys.sample(n=self.tamanho_amostral)  # Seleciona aleatoriamente 5 cidades
+        with metrics.step('bronze_clima.carregar_cidades') as m:
+            hits = carregar_cidades_br.cache_info().hits
+            total, br_citys = carregar_cidades_br(self.json_cities, os.stat(self.json_cities).st_mtime_ns)
+            m.set(cache_hits=carregar_cidades_br.cache_info().hits - hits)
+            selecionadas = self.checkpoint.state.get('cidades') if self.checkpoint else None
+            if selecionadas is not None:
+                # Retomada: reutiliza a mesma amostra, na mesma ordem, da execução interrompida
+                posicao = {city_id: i for i, city_id in enumerate(selecionadas)}
+                br_cidades = br_citys[br_citys['id'].isin(posicao)]
+                br_cidades = br_cidades.iloc[br_cidades['id'].map(posicao).argsort()]
+            elif self.tamanho_amostral is None:
+                br_cidades = br_citys  # Todas as cidades
+            else:
+                br_cidades = br_citys.sample(n=min(self.tamanho_amostral, len(br_citys)))  # Seleciona aleatoriamente a amostra
+            if self.checkpoint and selecionadas is None:
+                self.checkpoint.save_state(cidades=[int(city_id) for city_id in br_cidades['id']])
+            m.set(rows_in=total, rows_out=len(br_cidades))
             return br_cidades
 
+    # Índice espacial das cidades, para encontrar a cidade mais próxima de uma coordenada
+    def city_index(self):
+        """
+        Função para obter o índice espacial (KD-tree) das cidades lidas por load_city_list.
+
+        O índice é gravado em <storage_root>/state/city_index.npz e reaproveitado
+        enquanto o arquivo de cidades não muda; no mesmo processo, fica em memória.
+
+        Returns:
+            CityIndex: Índice das cidades brasileiras da lista.
+        """
+        with metrics.step('bronze_clima.indice_cidades') as m:
+            modificado_em = os.stat(self.json_cities).st_mtime_ns
+            origem = f'{os.path.abspath(self.json_cities)}:{modificado_em}'
+            caminho = os.path.join(storage_root(self.storage_root), 'state', 'city_index.npz')
+            indice = get_index(caminho, origem,
+                               lambda: CityIndex.from_cities(carregar_cidades_br(self.json_cities, modificado_em)[1]))
+            m.set(rows_out=len(indice))
+            return indice
+
+    def _mapear(self, func, itens):
+        """
+        Aplica func a cada item, mantendo a ordem. Com mais de um worker as chamadas
+        são simultâneas; com um, rodam na própria thread, onde o @profiled as enxerga.
+        """
+        if self.workers <= 1:
+            return [func(item) for item in itens]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(func, itens))
+
     # Coleta os dados meteorológicos para as cidades selecionadas
+    @profiled
     def fetch_weather_data(self, br_cidades):
         """
         Função para coletar dados meteorológicos para as cidades selecionadas.
@@ -75,26 +174,135 @@ class ClimateData:
             br_cidades (DataFrame): DataFrame contendo informações das cidades brasileiras.
 
         Returns:
-            DataFrame: DataFrame contendo os dados meteorológicos coletados.
+            DataFrame: DataFrame contendo os dados meteorológicos coletados. As cidades obtidas
+            (coluna 'id') só deixam a fila de falhas com resolver_falhas(), depois da carga.
         """
         API_CLIMA_KEY = os.getenv('API_CLIMA_KEY')  # Chave de API para acesso aos dados meteorológicos
+        API_CLIMA_URL = os.getenv('OPENWEATHER_BASE_URL', 'https://api.openweathermap.org')  # Sobrescrita nos benchmarks
+
+        # Respostas já obtidas por uma execução interrompida não são buscadas de novo
+        if self._respostas_salvas is None:
+            self._respostas_salvas = self.checkpoint.responses() if self.checkpoint else {}
+        salvas = self._respostas_salvas
+
+        with metrics.step('bronze_clima.fetch', api='openweather', workers=self.workers) as m:
+            def buscar(city_id):
+                if str(city_id) in salvas:
+                    m.add('cache_hits')
+                    return salvas[str(city_id)]
+                memory.check('bronze_clima')  # Falha cedo se o orçamento de memória estourar
+                url = f"{API_CLIMA_URL}/data/2.5/weather?id={city_id}&appid={API_CLIMA_KEY}"
+                try:
+                    # Respeita a taxa e a cota diária da API; com o circuito aberto falha sem chamar a rede
+                    response = http_client.get(url, api='openweather', root=self.storage_root, step=m)
+                except requests.RequestException as e:
+                    motivo = f"{type(e).__name__}: {e}"
+                else:
+                    m.add('http_calls')
+                    if response.status_code == 200:
+                        dados = response.json()
+                        if self.checkpoint:
+                            self.checkpoint.save_response(str(city_id), dados)
+                        return dados
+                    motivo = f"HTTP {response.status_code}"
+                m.add('failures')
+                print(f"Falhou!: {city_id} ({motivo})")  # Exibe mensagem se a solicitação falhar
+                # A cidade fica na fila de falhas, com o motivo, até um reprocessamento buscá-la
+                self.fila_falhas.record('bronze_clima', self.today, city_id, {'id': int(city_id)}, motivo)
+                return None
+
+            m.set(rows_in=len(br_cidades))
+            # As respostas mantêm a ordem das cidades, mesmo com várias requisições simultâneas
+            respostas = self._mapear(buscar, br_cidades['id'])
+            df_vazio = [dados for dados in respostas if dados is not None]
+            m.set(rows_out=len(df_vazio))
+            m.set(**http_client.snapshot('openweather', self.storage_root))  # Latências p50/p99/p999, circuito e limitador
 
-        df_vazio = []
+        return pd.DataFrame(df_vazio)
 
-        for city_id in br_cidades['id']:
-            url = f"https://api.openweathermap.org/data/2.5/weather?id={city_id}&appid={API_CLIMA_KEY}"
-            response = requests.get(url)
+    def filtrar_inalterados(self, weather_data):
+        """
+        Remove as cidades cuja observação é igual à última carregada no dia.
 
-            if response.status_code == 200:
-                city_clima_date = response.json()
-                df_vazio.append(city_clima_date)
-            else:
-                print(f"Falhou!: {city_id}")  # Exibe mensagem se a solicitação falhar
+        A impressão de cada cidade é um hash de 64 bits do horário da observação
+        (dt) e dos valores medidos. A API atualiza as observações a cada ~10
+        minutos, então coletas mais frequentes repetem a maior parte das linhas.
 
-        return pd.DataFrame(df_vazio)
+        Args:
+            weather_data (DataFrame): Respostas da API de clima.
+
+        Returns:
+            tuple: (DataFrame apenas com as cidades que mudaram, impressões delas),
+            as impressões para registrar_impressoes() depois da carga.
+        """
+        if self.impressoes is None or weather_data.empty:
+            return weather_data, {}
+        with metrics.step('bronze_clima.mudancas') as m:
+            impressoes = {str(registro['id']): fingerprint(registro, self.CAMPOS_OBSERVACAO)
+                          for registro in weather_data.to_dict('records')}
+            mudaram = self.impressoes.changed('bronze_clima', self.today, impressoes)
+            alteradas = weather_data[weather_data['id'].astype(str).isin(mudaram)].reset_index(drop=True)
+            m.set(rows_in=len(weather_data), rows_out=len(alteradas), inalteradas=len(weather_data) - len(alteradas))
+        return alteradas, {chave: impressoes[chave] for chave in mudaram}
+
+    def registrar_impressoes(self, impressoes):
+        """
+        Guarda as impressões das cidades carregadas. Chamado só depois da carga no
+        banco, para que uma carga que falhou seja repetida por completo.
+        """
+        if self.impressoes is not None:
+            self.impressoes.commit('bronze_clima', self.today, impressoes)
+
+    def resolver_falhas(self, city_ids):
+        """
+        Retira da fila de falhas as cidades obtidas. Chamado só depois da carga no
+        banco, para que uma cidade cuja carga falhou continue na fila.
+
+        Args:
+            city_ids (iterable): Ids das cidades obtidas.
+
+        Returns:
+            int: Quantidade de cidades que deixaram a fila.
+        """
+        with metrics.step('bronze_clima.falhas_resolvidas') as m:
+            city_ids = [int(city_id) for city_id in city_ids]
+            resolvidas = self.fila_falhas.resolve('bronze_clima', self.today, city_ids)
+            m.set(rows_in=len(city_ids), rows_out=resolvidas)
+        return resolvidas
+
+    def salvar_parquet(self, df, nome_arquivo, tabela=None):
+        """
+        Função para salvar um DataFrame da camada Bronze no diretório local em formato Parquet.
+
+        Com detecção de mudanças, o arquivo do dia guarda todas as observações
+        carregadas no dia: as linhas novas são acrescentadas como mais uma parte,
+        em vez de substituir o arquivo.
+
+        Args:
+            df (DataFrame): DataFrame a ser salvo.
+            nome_arquivo (str): Nome do arquivo Parquet.
+            tabela (str, opcional): Tabela bronze declarada, para o esquema das partes.
+
+        Returns:
+            str: Caminho do arquivo salvo.
+        """
+        with metrics.step('bronze_clima.parquet', arquivo=nome_arquivo) as m:
+            # Cria o diretório local e salva os dados no formato Parquet
+            self.create_local_directory(self.ref_month, self.ref_day)
+            caminho = os.path.join(self.local_dir, nome_arquivo)
+            if self.impressoes is not None:
+                parte = bronze_store.append_part(df, caminho, 'bronze', tabela)
+                m.set(rows_in=len(df), bytes_written=os.path.getsize(parte))
+            else:
+                bronze_store.reset(caminho)  # Remove partes gravadas por uma execução em micro-lotes
+                df.to_parquet(caminho, index=False)
+                m.set(rows_in=len(df), bytes_written=os.path.getsize(caminho))
+        if self.checkpoint:
+            self.checkpoint.save_state(arquivos={**self.checkpoint.state.get('arquivos', {}), nome_arquivo: caminho})
+        return caminho
 
     # Cria e armazena informações básicas da cidade em um arquivo Parquet
-    def bronze_city_information(self, df, ref_month, ref_day):
+    def bronze_city_information(self, df, ref_month, ref_day, salvar=True):
         """
         Função para extrair e armazenar informações básicas da cidade em um arquivo Parquet.
 
@@ -102,27 +310,29 @@ class ClimateData:
             df (DataFrame): DataFrame contendo os dados meteorológicos.
             ref_month (int): Mês de referência.
             ref_day (int): Dia de referência.
+            salvar (bool): Grava o arquivo Parquet (False no modo em micro-lotes, que grava partes).
 
         Returns:
             DataFrame: DataFrame contendo as informações básicas da cidade.
         """
-        df_information = df[['name', 'id']]
-        df_sistema = pd.json_normalize(df['sys'])
-        df_sys = df_sistema[['country','sunrise','sunset']]
-        df_coord = pd.json_normalize(df['coord'])
+        with metrics.step('bronze_clima.normalizar', tabela='city_information') as m:
+            df_information = df[['name', 'id']]
+            df_sistema = pd.json_normalize(df['sys'])
+            df_sys = df_sistema[['country','sunrise','sunset']]
+            df_coord = pd.json_normalize(df['coord'])
 
-        df_concat = pd.concat([df_information, df_coord, df_sys, df['timezone']], ignore_index=False, axis=1)
-        df_resulted = df_concat.rename(columns={'name': 'city', 'country': 'sigla', 'id':'id_city'})
-        df_resultados = df_resulted[['city','lon','lat', 'sigla', 'id_city','sunrise','sunset','timezone']] 
+            df_concat = pd.concat([df_information, df_coord, df_sys, df['timezone']], ignore_index=False, axis=1)
+            df_resulted = df_concat.rename(columns={'name': 'city', 'country': 'sigla', 'id':'id_city'})
+            df_resultados = df_resulted[['city','lon','lat', 'sigla', 'id_city','sunrise','sunset','timezone']] 
+            m.set(rows_in=len(df), rows_out=len(df_resultados))
 
-        # Cria o diretório local e salva os dados no formato Parquet
-        self.create_local_directory(self.ref_month, self.ref_day)
-        df_resultados.to_parquet(os.path.join(self.local_dir, 'city_information.parquet'), index=False)
+        if salvar:
+            self.salvar_parquet(df_resultados, 'city_information.parquet', 'city_information')
 
         return df_resultados
 
     # Extrai e armazena informações de temperatura em um arquivo Parquet
-    def bronze_temperatures_information(self, df, ref_month, ref_day):
+    def bronze_temperatures_information(self, df, ref_month, ref_day, salvar=True):
         """
         Função para extrair e armazenar informações de temperatura em um arquivo Parquet.
 
@@ -130,26 +340,26 @@ class ClimateData:
             df (DataFrame): DataFrame contendo os dados meteorológicos.
             ref_month (int): Mês de referência.
             ref_day (int): Dia de referência.
+            salvar (bool): Grava o arquivo Parquet (False no modo em micro-lotes, que grava partes).
 
         Returns:
             DataFrame: DataFrame contendo as informações de temperatura.
         """
-        df_city_information = self.bronze_city_information(df, ref_month, ref_day)
+        with metrics.step('bronze_clima.normalizar', tabela='temperatures_information') as m:
+            df_main = pd.json_normalize(df['main'])
+            df_weather = pd.json_normalize(df['weather'])
+            df_weather = pd.json_normalize(df_weather[0])
 
-        df_main = pd.json_normalize(df['main'])
-        df_weather = pd.json_normalize(df['weather'])
-        df_weather = pd.json_normalize(df_weather[0])
+            df_resultados = pd.concat([df['id'].rename('id_city'), df_main[['temp','feels_like','temp_min', 'temp_max','pressure']], df_weather['id'], df['dt']], ignore_index=False, axis=1) 
+            m.set(rows_in=len(df), rows_out=len(df_resultados))
 
-        df_resultados = pd.concat([df_city_information['id_city'], df_main[['temp','feels_like','temp_min', 'temp_max','pressure']], df_weather['id']], ignore_index=False, axis=1) 
-        
-        # Cria o diretório local e salva os dados no formato Parquet
-        self.create_local_directory(self.ref_month, self.ref_day)
-        df_resultados.to_parquet(os.path.join(self.local_dir, 'temperatures_information.parquet'), index=False)
+        if salvar:
+            self.salvar_parquet(df_resultados, 'temperatures_information.parquet', 'temperatures_information')
 
         return df_resultados
 
     # Extrai e armazena informações meteorológicas do dia em um arquivo Parquet
-    def bronze_weather_of_the_day(self, df, ref_month, ref_day):
+    def bronze_weather_of_the_day(self, df, ref_month, ref_day, salvar=True):
         """
         Função para extrair e armazenar informações meteorológicas do dia em um arquivo Parquet.
 
@@ -157,33 +367,35 @@ class ClimateData:
             df (DataFrame): DataFrame contendo os dados meteorológicos.
             ref_month (int): Mês de referência.
             ref_day (int): Dia de referência.
+            salvar (bool): Grava o arquivo Parquet (False no modo em micro-lotes, que grava partes).
 
         Returns:
             DataFrame: DataFrame contendo as informações meteorológicas do dia.
         """
-        df_weather = pd.json_normalize(df['weather'])
-        df_weather = pd.json_normalize(df_weather[0])
-
-        # Verifica se a coluna 'rain' está presente no DataFrame
-        if 'rain' in df.columns:
-            df_rain = pd.json_normalize(df['rain'])
-            df_rain = df_rain.rename(columns={'1h': 'rain'})
-            # Substitui valores nulos por 0 na coluna 'rain'
-            df_rain['rain'].fillna(0, inplace=True)
-        else:
-            # Se a coluna 'rain' não existe, cria uma coluna 'rain' preenchida com 0
-            df_rain = pd.DataFrame({'rain': [0] * len(df)})
-            
-        df_resultados = pd.concat([df_weather[['id','main','description']], df['dt'], df_rain], axis=1)
-
-        # Cria o diretório local e salva os dados no formato Parquet
-        self.create_local_directory(self.ref_month, self.ref_day)
-        df_resultados.to_parquet(os.path.join(self.local_dir, 'weather_of_day.parquet'), index=False)
+        with metrics.step('bronze_clima.normalizar', tabela='weather_of_the_day') as m:
+            df_weather = pd.json_normalize(df['weather'])
+            df_weather = pd.json_normalize(df_weather[0])
+
+            # Verifica se a coluna 'rain' está presente no DataFrame
+            if 'rain' in df.columns:
+                df_rain = pd.json_normalize(df['rain'])
+                df_rain = df_rain.rename(columns={'1h': 'rain'})
+                # Substitui valores nulos por 0 na coluna 'rain'
+                df_rain['rain'].fillna(0, inplace=True)
+            else:
+                # Se a coluna 'rain' não existe, cria uma coluna 'rain' preenchida com 0
+                df_rain = pd.DataFrame({'rain': [0] * len(df)})
+                
+            df_resultados = pd.concat([df['id'].rename('id_city'), df_weather[['id','main','description']], df['dt'], df_rain], axis=1)
+            m.set(rows_in=len(df), rows_out=len(df_resultados))
+
+        if salvar:
+            self.salvar_parquet(df_resultados, 'weather_of_day.parquet', 'weather_of_the_day')
         
         return df_resultados
 
     # Cria e armazena informações de vento em um arquivo Parquet
-    def bronze_wind_information(self, df, ref_month, ref_day):
+    def bronze_wind_information(self, df, ref_month, ref_day, salvar=True):
         """
         Função para extrair e armazenar informações de vento em um arquivo Parquet.
 
@@ -191,43 +403,25 @@ class ClimateData:
             df (DataFrame): DataFrame contendo os dados meteorológicos.
             ref_month (int): Mês de referência.
             ref_day (int): Dia de referência.
+            salvar (bool): Grava o arquivo Parquet (False no modo em micro-lotes, que grava partes).
 
         Returns:
             DataFrame: DataFrame contendo as informações de vento.
         """
-        # Normaliza os dados de vento para um DataFrame
-        df_wind = pd.json_normalize(df['wind'])
-        
-        # Combina os dados de vento com os IDs das cidades
-        df_concat = pd.concat([df_wind, df['id']], ignore_index=False, axis=1)
-        df_resultados = df_concat.rename(columns={'id':'id_city'})
+        with metrics.step('bronze_clima.normalizar', tabela='wind_information') as m:
+            # Normaliza os dados de vento para um DataFrame
+            df_wind = pd.json_normalize(df['wind'])
+            
+            # Combina os dados de vento com os IDs das cidades
+            df_concat = pd.concat([df_wind, df['id'], df['dt']], ignore_index=False, axis=1)
+            df_resultados = df_concat.rename(columns={'id':'id_city'})
+            m.set(rows_in=len(df), rows_out=len(df_resultados))
 
-        # Cria o diretório local e salva os dados no formato Parquet
-        self.create_local_directory(self.ref_month, self.ref_day)
-        df_resultados.to_parquet(os.path.join(self.local_dir, 'wind_information.parquet'), index=False)
+        if salvar:
+            self.salvar_parquet(df_resultados, 'wind_information.parquet', 'wind_information')
         
         return df_resultados
 
-    def connect_databases():
-        """
-        Função para estabelecer a conexão com o banco de dados.
-
-        Esta função cria uma instância da classe DatabaseOps e estabelece uma conexão com o banco de dados.
-
-        Returns:
-            None
-        """
-        global database, database_connection
-
-        # Cria uma instância da classe DatabaseOps
-        database = DatabaseOps()
-
-        # Estabelece uma conexão com o banco de dados
-        database_connection = database.connect_db()
-
-    # Chamada da função para estabelecer a conexão com o banco de dados
-    connect_databases()
-
     def insert_database(self, df, schema, tabela):
         """
         Função para inserir os dados de um DataFrame em uma tabela do banco de dados.
@@ -242,12 +436,34 @@ class ClimateData:
         """
         try:
             # Inserir os dados no banco de dados
-            database.insert(dataframe=df, schema=schema, table=tabela, if_exists=self.insert_method)
+            self.database.insert(dataframe=df, schema=schema, table=tabela, if_exists=self.insert_method,
+                                 keys=self.chaves_naturais.get(tabela))
             return True  # Retornar True se a inserção for bem-sucedida
         except Exception as e:
             # Se ocorrer um erro durante a inserção, imprimir mensagem de erro e retornar False
             print(f"[erro][feat_bronze_clima][def: insert_database]\nErro durante a inserção no banco de dados: {e}")
             return False 
+
+    def insert_stage(self, tabelas, schema, if_exists=None):
+        """
+        Função para inserir as tabelas de uma etapa de forma concorrente e atômica.
+
+        Args:
+            tabelas (dict): Nome da tabela -> DataFrame com os dados a serem inseridos.
+            schema (str): Nome do esquema onde as tabelas estão localizadas.
+            if_exists (str, opcional): Modo de inserção; por padrão o insert_method da instância.
+
+        Returns:
+            dict: Latência de carga por tabela e total, ou False em caso de erro.
+        """
+        try:
+            with metrics.step('bronze_clima.insert', schema=schema) as m:
+                m.set(rows_in=sum(len(df) for df in tabelas.values()))
+                return self.database.load_stage([(schema, tabela, df) for tabela, df in tabelas.items()],
+                                                 if_exists=if_exists or self.insert_method, keys=self.chaves_naturais)
+        except Exception as e:
+            print(f"[erro][feat_bronze_clima][def: insert_stage]\nErro durante a inserção no banco de dados: {e}")
+            return False
     
     # Executa o pipeline completo
     def pipeline(self):
@@ -259,31 +475,115 @@ class ClimateData:
             bool: False se ocorrer algum erro durante o processo.
         """
         try:
-            # Carrega a lista de cidades
-            br_cidades = self.load_city_list()
-
-            # Coleta dados meteorológicos para as cidades selecionadas
-            weather_data = self.fetch_weather_data(br_cidades)
-
-            # Extrai e insere informações básicas da cidade no banco de dados
-            city_info = self.bronze_city_information(weather_data, self.ref_month, self.ref_day)
-            self.insert_database(city_info, 'bronze', 'city_information')
-
-            # Extrai e insere informações de temperatura no banco de dados
-            temperatures_info = self.bronze_temperatures_information(weather_data, self.ref_month, self.ref_day)
-            self.insert_database(temperatures_info, 'bronze', 'temperatures_information')
-
-            # Extrai e insere informações meteorológicas do dia no banco de dados
-            weather_info = self.bronze_weather_of_the_day(weather_data, self.ref_month, self.ref_day)
-            self.insert_database(weather_info, 'bronze', 'weather_of_the_day')
-
-            # Extrai e insere informações de vento no banco de dados
-            wind_info = self.bronze_wind_information(weather_data, self.ref_month, self.ref_day)
-            self.insert_database(wind_info, 'bronze', 'wind_information')
-
+            arquivos = self.checkpoint.state.get('arquivos', {}) if self.checkpoint else {}
+            bronze = {
+                'city_information': (self.bronze_city_information, 'city_information.parquet'),
+                'temperatures_information': (self.bronze_temperatures_information, 'temperatures_information.parquet'),
+                'weather_of_the_day': (self.bronze_weather_of_the_day, 'weather_of_day.parquet'),
+                'wind_information': (self.bronze_wind_information, 'wind_information.parquet'),
+            }
+
+            impressoes = {}
+            obtidas = []  # Cidades obtidas da API, que deixam a fila de falhas depois da carga
+            if all(os.path.exists(arquivos.get(nome_arquivo, '')) for _, nome_arquivo in bronze.values()):
+                # Retomada após a gravação dos arquivos bronze: falta apenas a inserção
+                leitor = BronzeReader(self.storage_root)
+                tabelas = {tabela: leitor.read(tabela, self.today) for tabela in bronze}
+                obtidas = tabelas['city_information']['id_city']
+            else:
+                # Carrega a lista de cidades
+                br_cidades = self.load_city_list()
+
+                # Coleta dados meteorológicos para as cidades selecionadas
+                weather_data = self.fetch_weather_data(br_cidades)
+                obtidas = weather_data['id'] if not weather_data.empty else []
+
+                # Com detecção de mudanças, segue apenas o que mudou desde a última carga
+                weather_data, impressoes = self.filtrar_inalterados(weather_data)
+                if self.impressoes is not None and weather_data.empty:
+                    print('[mudancas][bronze_clima] nenhuma observação mudou desde a última carga')
+                    self.resolver_falhas(obtidas)  # Observações iguais às já carregadas
+                    if self.checkpoint:
+                        self.checkpoint.clear()
+                    return None
+
+                # Extrai as informações da cidade, de temperatura, meteorológicas do dia e de vento
+                tabelas = {tabela: extrair(weather_data, self.ref_month, self.ref_day)
+                           for tabela, (extrair, _) in bronze.items()}
+
+            # Insere as quatro tabelas no banco de dados em uma única carga atômica
+            if self.insert_stage(tabelas, 'bronze') is False:
+                return False
+            self.registrar_impressoes(impressoes)
+            self.resolver_falhas(obtidas)
+
+            if self.checkpoint:
+                self.checkpoint.clear()  # Etapa concluída: a próxima execução começa do zero
             return None  # Retorna None se o pipeline for executado com sucesso
 
         except Exception as e:
             # Se ocorrer um erro durante o pipeline, imprimir mensagem de erro e retornar False
             print(f"[erro][feat_bronze_clima][def: pipeline]\nErro durante a execução do pipeline: {e}")
             return False 
+
+    def reprocessar_falhas(self, max_tentativas=None):
+        """
+        Busca novamente apenas as cidades da fila de falhas da data de referência
+        e mescla as que forem obtidas à partição bronze do dia (arquivos e banco),
+        sem repetir a coleta completa.
+
+        Args:
+            max_tentativas (int, opcional): Ignora cidades que já falharam essa quantidade de vezes.
+
+        Retorna:
+            None: Se o reprocessamento for executado com sucesso (mesmo que alguma cidade falhe de novo).
+            bool: False se ocorrer algum erro durante o processo.
+        """
+        try:
+            pendentes = self.fila_falhas.pending('bronze_clima', self.today, max_tentativas)
+            print(f"[reprocessar][bronze_clima] {len(pendentes)} cidades na fila de falhas")
+            if not pendentes:
+                return None
+
+            weather_data = self.fetch_weather_data(pd.DataFrame([item['payload'] for item in pendentes]))
+            print(f"[reprocessar][bronze_clima] {len(weather_data)} cidades recuperadas")
+            if weather_data.empty:
+                return None
+
+            self.create_local_directory(self.ref_month, self.ref_day)
+            try:
+                cidades_do_dia = BronzeReader(self.storage_root).read('city_information', self.today,
+                                                                      columns=['id_city', 'lat', 'lon'])
+            except FileNotFoundError:
+                cidades_do_dia = pd.DataFrame(columns=['id_city', 'lat', 'lon'])
+            tabelas = {}
+            for tabela, extrair, nome_arquivo in (
+                ('city_information', self.bronze_city_information, 'city_information.parquet'),
+                ('temperatures_information', self.bronze_temperatures_information, 'temperatures_information.parquet'),
+                ('weather_of_the_day', self.bronze_weather_of_the_day, 'weather_of_day.parquet'),
+                ('wind_information', self.bronze_wind_information, 'wind_information.parquet'),
+            ):
+                tabelas[tabela] = extrair(weather_data, self.ref_month, self.ref_day, salvar=False)
+                bronze_store.append(tabelas[tabela], os.path.join(self.local_dir, nome_arquivo), 'bronze', tabela)
+
+            # As linhas recuperadas se somam às do dia; 'replace' apagaria as demais
+            if self.insert_stage(tabelas, 'bronze', 'append' if self.insert_method == 'replace' else None) is False:
+                return False
+            self.resolver_falhas(weather_data['id'])  # Só deixam a fila depois de gravadas
+
+            # Os pares de trânsito das cidades recuperadas nunca foram buscados: entram na fila do trânsito,
+            # na mesma ordem (cidades do dia antes das recuperadas) e com as mesmas chaves da coleta completa
+            novas = tabelas['city_information'][['id_city', 'lat', 'lon']]
+            todas = pd.concat([cidades_do_dia, novas], ignore_index=True)
+            for j in range(len(cidades_do_dia), len(todas)):
+                for i in range(j):
+                    origem, destino = todas.iloc[i], todas.iloc[j]
+                    self.fila_falhas.record('bronze_transito', self.today, f"{int(origem['id_city'])}-{int(destino['id_city'])}", {
+                        'origin': f"{origem['lat']},{origem['lon']}", 'destination': f"{destino['lat']},{destino['lon']}",
+                        'id_city_origem': int(origem['id_city']), 'id_city_destino': int(destino['id_city']),
+                    }, 'cidade recuperada no reprocessamento')
+            return None
+
+        except Exception as e:
+            print(f"[erro][feat_bronze_clima][def: reprocessar_falhas]\nErro durante o reprocessamento: {e}")
+            return False
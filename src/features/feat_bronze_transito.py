@@ -4,12 +4,23 @@ import json
 import os
 import sys
 import pytz
+import threading
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 src_dir = os.path.join(os.getcwd().split('src')[0], 'src','utils')
 sys.path.insert(0, src_dir)
 from utils.database_operations import DatabaseOps
+from utils.table_schemas import natural_keys
+from utils.metrics import metrics
+from utils.profiling import profiled
+from utils.memory import memory
+from utils.bronze_reader import BronzeReader
+from utils import http_client
+from utils.checkpoint import Checkpoint
+from utils.dead_letter import get_queue
+from utils import latest
 
 
 
@@ -17,12 +28,14 @@ class TrafficData:
     """
     Classe para coleta e processamento de dados de tráfego entre cidades usando a API do Google Maps.
     """
+    chaves_naturais = natural_keys('bronze')
 
-    def __init__(self, insert_method: str='append'):
+    def __init__(self, insert_method: str='append', data_referencia=None, storage_root: str=None, workers: int=1,
+                 checkpoint: bool=True, execucao: str=None):
         """
-        Inicializa a instância da classe TrafficData com data atual e outras variáveis necessárias para a integração dos dados.
+        Inicializa a instância da classe TrafficData com a data de referência (data atual por padrão) e outras variáveis necessárias para a integração dos dados.
         """
-        self.today = datetime.now().date()  # Define a data atual
+        self.today = data_referencia or datetime.now().date()  # Define a data de referência
         self.ref_month = self.today.month  # Define o mês de referência
         self.ref_day = self.today.day  # Define o dia de referência
         self.directions_results = []  # Lista para armazenar os resultados das direções
@@ -30,6 +43,18 @@ class TrafficData:
         self.cidades_destino = []  # Lista para armazenar as cidades de destino
         self.df_trafego = pd.DataFrame()  # DataFrame para armazenar os dados de tráfego
         self.insert_method = insert_method # metodo de inserção no banco de dados
+        self.chamadas_http = 0  # Quantidade de requisições feitas à API de Directions
+        self.falhas = 0  # Quantidade de pares sem dados de direção
+        self.pares_retomados = 0  # Pares reaproveitados do checkpoint
+        self.falhas_resolvidas = 0  # Pares da fila de falhas obtidos nesta execução
+        self.storage_root = storage_root  # Raiz dos arquivos locais (STORAGE_ROOT ou ../data por padrão)
+        self.workers = workers  # Quantidade de requisições simultâneas à API de Directions
+        self._lock = threading.Lock()  # Protege os contadores quando há várias requisições simultâneas
+        # Pares já consultados, para retomar uma execução interrompida sem repetir chamadas à API;
+        # com execucao, apenas o checkpoint dessa mesma execução é retomado
+        self.checkpoint = Checkpoint('bronze_transito', self.today, storage_root, execucao) if checkpoint else None
+        self.fila_falhas = get_queue(storage_root)  # Pares que falharam ficam registrados até serem reprocessados
+        self.database = DatabaseOps() # conexão aberta sob demanda, no primeiro insert
 
 
     # Função para obter dados da API de Directions
@@ -44,41 +69,115 @@ class TrafficData:
         Retorna:
         dict: Dados JSON com informações de direção das cidades.
         """
+        return self._buscar_direcoes(origin, destination)[0]
+
+    def _buscar_direcoes(self, origin, destination, etapa=None):
+        """
+        Como get_directions_data, mas devolve também o motivo da falha.
+
+        Parâmetros:
+        etapa (StepMetrics, opcional): Etapa de métricas que conta as retentativas da requisição.
+
+        Retorna:
+        tuple: (dados JSON ou None, motivo da falha ou None).
+        """
         API_TRANSITO_KEY = os.getenv('API_TRANSITO_KEY')  # Chave da API de tráfego
+        API_TRANSITO_URL = os.getenv('DIRECTIONS_BASE_URL', 'https://maps.googleapis.com')  # Sobrescrita nos benchmarks
 
         # Monta a URL da API
-        url = f"https://maps.googleapis.com/maps/api/directions/json?origin={origin}&destination={destination}&key={API_TRANSITO_KEY}"
-        response = requests.get(url)  # Faz a requisição GET
+        url = f"{API_TRANSITO_URL}/maps/api/directions/json?origin={origin}&destination={destination}&key={API_TRANSITO_KEY}"
+        try:
+            response = http_client.get(url, api='directions', root=self.storage_root, step=etapa)  # Faz a requisição GET pela sessão compartilhada, respeitando a taxa e a cota da API
+        except requests.RequestException as e:
+            return None, f"{type(e).__name__}: {e}"  # Inclui o circuito aberto, que falha sem chamar a rede
+        with self._lock:
+            self.chamadas_http += 1
 
         if response.status_code == 200:  # Verifica se a requisição foi bem-sucedida
-            return response.json()  # Retorna os dados JSON
+            return response.json(), None  # Retorna os dados JSON
         else:
-            return None  # Retorna None em caso de falha na requisição
+            return None, f"HTTP {response.status_code}"  # Retorna None em caso de falha na requisição
+
+    def _mapear(self, func, itens):
+        """
+        Aplica func a cada item, mantendo a ordem. Com mais de um worker as chamadas
+        são simultâneas; com um, rodam na própria thread, onde o @profiled as enxerga.
+        """
+        if self.workers <= 1:
+            return [func(item) for item in itens]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(func, itens))
 
-    def collect_directions(self):
+    @profiled
+    def collect_directions(self, etapa=None):
         """
         Coleta dados de direção para todas as combinações de cidades.
+
+        Parâmetros:
+        etapa (StepMetrics, opcional): Etapa de métricas que conta as retentativas das requisições.
+
+        Retorna:
+        list: Chaves dos pares obtidos, que deixam a fila de falhas só depois da carga (resolver_falhas).
         """
         # Carrega os dados de cidades da camada Bronze
-        BRONZE_DIR = os.path.join(fr'..\data\bronze\{self.ref_month}\{self.ref_day}')
-        dir_information = pd.read_parquet(os.path.join(BRONZE_DIR, 'city_information.parquet'), columns=['city','id_city','lon','lat'])
-
-        # Loop para todas as combinações de cidades
-        for i in range(len(dir_information)):
-            for j in range(i + 1, len(dir_information)):
-                origin = f"{dir_information.iloc[i]['lat']},{dir_information.iloc[i]['lon']}"  # Coordenadas de origem
-                destination = f"{dir_information.iloc[j]['lat']},{dir_information.iloc[j]['lon']}"  # Coordenadas de destino
-                directions_data = self.get_directions_data(origin, destination)  # Obtém os dados de direção
-                
-                if directions_data:  # Verifica se os dados foram obtidos com sucesso
-                    # Adiciona os resultados às listas
-                    self.directions_results.append({'directions': directions_data})
-                    self.cidades_origem.append(dir_information.iloc[i]['id_city'])
-                    self.cidades_destino.append(dir_information.iloc[j]['id_city'])
-                else:
-                    # Imprime uma mensagem de erro se os dados não puderem ser obtidos
-                    print(f"Não foi possível obter os dados de direção para o par {dir_information.iloc[i]['city']} -> {dir_information.iloc[j]['city']}.")
+        dir_information = BronzeReader(self.storage_root).read('city_information', self.today, columns=['city','id_city','lon','lat'])
+
+        # Todas as combinações de cidades
+        pares = [(i, j) for i in range(len(dir_information)) for j in range(i + 1, len(dir_information))]
+        salvos = self.checkpoint.responses() if self.checkpoint else {}
+
+        def buscar(par):
+            i, j = par
+            chave = f"{dir_information.iloc[i]['id_city']}-{dir_information.iloc[j]['id_city']}"
+            if chave in salvos:
+                with self._lock:
+                    self.pares_retomados += 1
+                return salvos[chave]
+            memory.check('bronze_transito')  # Falha cedo se o orçamento de memória estourar
+            origin = f"{dir_information.iloc[i]['lat']},{dir_information.iloc[i]['lon']}"  # Coordenadas de origem
+            destination = f"{dir_information.iloc[j]['lat']},{dir_information.iloc[j]['lon']}"  # Coordenadas de destino
+            directions_data, motivo = self._buscar_direcoes(origin, destination, etapa)  # Obtém os dados de direção
+            if directions_data and self.checkpoint:
+                self.checkpoint.save_response(chave, directions_data)
+            if not directions_data:
+                # O par fica na fila de falhas, com o motivo, até um reprocessamento buscá-lo
+                self.fila_falhas.record('bronze_transito', self.today, chave, {
+                    'origin': origin, 'destination': destination,
+                    'id_city_origem': int(dir_information.iloc[i]['id_city']),
+                    'id_city_destino': int(dir_information.iloc[j]['id_city']),
+                }, motivo or 'resposta vazia')
+            return directions_data
+
+        # Os resultados voltam na ordem dos pares, mesmo com várias requisições simultâneas
+        obtidos = []
+        for (i, j), directions_data in zip(pares, self._mapear(buscar, pares)):
+            if directions_data:  # Verifica se os dados foram obtidos com sucesso
+                # Adiciona os resultados às listas
+                self.directions_results.append({'directions': directions_data})
+                self.cidades_origem.append(dir_information.iloc[i]['id_city'])
+                self.cidades_destino.append(dir_information.iloc[j]['id_city'])
+                obtidos.append(f"{dir_information.iloc[i]['id_city']}-{dir_information.iloc[j]['id_city']}")
+            else:
+                self.falhas += 1
+                # Imprime uma mensagem de erro se os dados não puderem ser obtidos
+                print(f"Não foi possível obter os dados de direção para o par {dir_information.iloc[i]['city']} -> {dir_information.iloc[j]['city']}.")
+        return obtidos
+
+    def resolver_falhas(self, obtidos):
+        """
+        Retira da fila de falhas os pares obtidos. Chamado só depois da carga no
+        banco, para que um par cuja carga falhou continue na fila.
 
+        Parâmetros:
+        obtidos (list): Chaves 'origem-destino' dos pares obtidos.
+
+        Retorna:
+        int: Quantidade de pares que deixaram a fila.
+        """
+        self.falhas_resolvidas += self.fila_falhas.resolve('bronze_transito', self.today, obtidos)
+        return self.falhas_resolvidas
+
+    @profiled
     def process_directions(self):
         """
         Processa os dados de direção coletados e os organiza em um DataFrame.
@@ -109,18 +208,7 @@ class TrafficData:
         self.df_trafego['id_city_destino'] = self.cidades_destino  # Adiciona a cidade de destino
         self.df_trafego['dt_ingestao'] = self.today  # Adiciona a data de ingestão
 
-    def connect_databases():
-        """
-        Método para conectar ao banco de dados.
-        """
-        global database, database_connection
-
-        database = DatabaseOps()
-        database_connection = database.connect_db()
-    
-    connect_databases()
-
-    def insert_database(self, df, schmea, tabela):
+    def insert_database(self, df, schmea, tabela, if_exists=None):
         """
         Método para inserir dados no banco de dados.
 
@@ -128,17 +216,37 @@ class TrafficData:
         df (DataFrame): DataFrame contendo os dados a serem inseridos.
         schema (str): Nome do schema no banco de dados.
         table (str): Nome da tabela no banco de dados.
+        if_exists (str, opcional): Modo de inserção; por padrão o insert_method da instância.
 
         Retorna:
         bool: True se a inserção for bem-sucedida, False caso contrário.
         """
         try:
-            database.insert(dataframe=df, schema=schmea, table=tabela, if_exists=self.insert_method)
+            self.database.insert(dataframe=df, schema=schmea, table=tabela, if_exists=if_exists or self.insert_method,
+                                 keys=self.chaves_naturais.get(tabela))
             return True  # Retorna True se a inserção for bem-sucedida
         except Exception as e:
             print(f"[erro][feat_bronze_transito][def: insert_database]\nErro durante a inserção no banco de dados: {e}")
             return False  # Retorna False em caso de erro na inserção
 
+    def publicar_ultimas(self):
+        """
+        Publica a distância e a duração mais recentes de cada par de cidades para o serviço de leitura.
+
+        Retorna:
+        int: Quantidade de pares no snapshot, ou False em caso de erro (os dados já estão no banco).
+        """
+        try:
+            with metrics.step('bronze_transito.publicar_ultimas') as m:
+                # Data como texto ISO, como nas tabelas silver de clima
+                ultimas = self.df_trafego.assign(dt_ingestao=self.df_trafego['dt_ingestao'].astype(str))
+                total = latest.publish('transito', ultimas, self.storage_root)
+                m.set(rows_in=len(self.df_trafego), rows_out=total)
+                return total
+        except Exception as e:
+            print(f"[erro][feat_bronze_transito][def: publicar_ultimas]\nErro ao publicar o snapshot de leitura: {e}")
+            return False
+
     def pipeline(self):
         """
         Executa a coleta e o processamento dos dados de tráfego.
@@ -147,12 +255,78 @@ class TrafficData:
         DataFrame: Dados de tráfego processados.
         """
         try:
-            self.collect_directions()  # Coleta os dados de direção
-            self.process_directions()  # Processa os dados de direção
-            self.insert_database(self.df_trafego, 'bronze', 'traffic_direction')  # Insere os dados no banco de dados
+            with metrics.step('bronze_transito.fetch', api='directions', workers=self.workers) as m:
+                obtidos = self.collect_directions(m)  # Coleta os dados de direção
+                m.set(rows_out=len(self.directions_results), http_calls=self.chamadas_http, failures=self.falhas,
+                      cache_hits=self.pares_retomados)
+                m.set(**http_client.snapshot('directions', self.storage_root))  # Latências p50/p99/p999, circuito e limitador
 
+            with metrics.step('bronze_transito.normalizar', tabela='traffic_direction') as m:
+                self.process_directions()  # Processa os dados de direção
+                m.set(rows_in=len(self.directions_results), rows_out=len(self.df_trafego))
+
+            with metrics.step('bronze_transito.insert', schema='bronze') as m:
+                m.set(rows_in=len(self.df_trafego))
+                if self.insert_database(self.df_trafego, 'bronze', 'traffic_direction') is False:  # Insere os dados no banco de dados
+                    return False
+                m.set(falhas_resolvidas=self.resolver_falhas(obtidos))  # Só deixam a fila depois de gravados
+            self.publicar_ultimas()  # Depois do banco: o serviço de leitura só vê o que já foi gravado
+
+            if self.checkpoint:
+                self.checkpoint.clear()  # Etapa concluída: a próxima execução começa do zero
             return self.df_trafego  # Retorna os dados de tráfego processados
 
         except Exception as e:
             print(f"[erro][feat_bronze_transito][def: pipeline]\nErro durante a inserção no banco de dados: {e}")
             return False  # Retorna False em caso de erro durante o pipeline
+
+    def reprocessar_falhas(self, max_tentativas=None):
+        """
+        Busca novamente apenas os pares da fila de falhas da data de referência e
+        acrescenta os que forem obtidos à tabela bronze do dia, sem repetir a
+        coleta de todas as combinações de cidades.
+
+        Parâmetros:
+        max_tentativas (int, opcional): Ignora pares que já falharam essa quantidade de vezes.
+
+        Retorna:
+        DataFrame: Dados de tráfego recuperados (vazio se nenhum par foi obtido), ou False em caso de erro.
+        """
+        try:
+            pendentes = self.fila_falhas.pending('bronze_transito', self.today, max_tentativas)
+            print(f"[reprocessar][bronze_transito] {len(pendentes)} pares na fila de falhas")
+
+            obtidos = []
+            with metrics.step('bronze_transito.reprocessar', api='directions', workers=self.workers) as m:
+                def buscar(item):
+                    par = item['payload']
+                    directions_data, motivo = self._buscar_direcoes(par['origin'], par['destination'], m)
+                    if not directions_data:
+                        self.fila_falhas.record('bronze_transito', self.today, item['key'], par, motivo or 'resposta vazia')
+                    return directions_data
+
+                for item, directions_data in zip(pendentes, self._mapear(buscar, pendentes)):
+                    if directions_data:
+                        self.directions_results.append({'directions': directions_data})
+                        self.cidades_origem.append(item['payload']['id_city_origem'])
+                        self.cidades_destino.append(item['payload']['id_city_destino'])
+                        obtidos.append(item['key'])
+                    else:
+                        self.falhas += 1
+                m.set(rows_in=len(pendentes), rows_out=len(obtidos), http_calls=self.chamadas_http, failures=self.falhas)
+            print(f"[reprocessar][bronze_transito] {len(obtidos)} pares recuperados")
+            if not obtidos:
+                return self.df_trafego
+
+            self.process_directions()
+            # Os pares recuperados se somam aos do dia; 'replace' apagaria os demais
+            if self.insert_database(self.df_trafego, 'bronze', 'traffic_direction',
+                                    'append' if self.insert_method == 'replace' else None) is False:
+                return False
+            self.resolver_falhas(obtidos)  # Só deixam a fila depois de gravados
+            self.publicar_ultimas()
+            return self.df_trafego
+
+        except Exception as e:
+            print(f"[erro][feat_bronze_transito][def: reprocessar_falhas]\nErro durante o reprocessamento: {e}")
+            return False
@@ -10,36 +10,77 @@ from dotenv import load_dotenv
 # Importando DatabaseOps para operações de banco de dados
 src_dir = os.path.join(os.getcwd().split('src')[0], 'src','utils')
 sys.path.insert(0, src_dir)
-from utils.database_operations import DatabaseOps  
+from utils.database_operations import DatabaseOps
+from utils.table_schemas import natural_keys
+from utils.metrics import metrics
+from utils.profiling import profiled
+from utils.memory import memory
+from utils.bronze_reader import BronzeReader
+from utils import timeseries
+from utils import latest
 
 class IntegracaoSilver:
     """
     Classe para integração e transformação de dados da camada Silver.
 
     Attributes:
-        today (datetime.date): Data atual.
+        today (datetime.date): Data de referência (data atual por padrão).
         ref_month (int): Mês de referência.
         ref_day (int): Dia de referência.
+        storage_root (str): Raiz dos arquivos locais (STORAGE_ROOT ou ../data por padrão).
+        chaves_naturais (dict): Chaves naturais de cada tabela, usadas no insert_method='upsert'.
+        colunas_bronze (dict): Colunas lidas de cada tabela bronze (None lê todas).
+        series (TimeSeriesStore): Séries temporais por cidade alimentadas a cada carga, ou None se desativadas.
     """
-
-    def __init__(self, insert_method: str='append'):
+    chaves_naturais = natural_keys('silver')
+    # Apenas as colunas usadas pelas transformações são lidas dos arquivos bronze
+    colunas_bronze = {
+        'temperatures_information': ['id_city', 'temp', 'feels_like', 'temp_min', 'temp_max', 'pressure', 'id', 'dt'],
+        'wind_information': ['id_city', 'speed', 'gust', 'dt'],
+    }
+
+    def __init__(self, insert_method: str='append', data_referencia=None, storage_root: str=None,
+                 serie_temporal: bool=False):
         """
         Método construtor da classe IntegracaoSilver.
         """
-        self.today = datetime.now().date()  # Define a data atual
+        self.today = data_referencia or datetime.now().date()  # Define a data de referência
         self.ref_month = self.today.month  # Define o mês de referência
         self.ref_day = self.today.day  # Define o dia de referência
         self.insert_method = insert_method # metodo de inserção no banco de dados
+        self.storage_root = storage_root
+        self.leitor = BronzeReader(storage_root)
+        # Medições de cada cidade ao longo do tempo, em arquivos mapeados em memória para leituras rápidas por cidade
+        self.series = timeseries.get_store(storage_root) if serie_temporal else None
+        self.database = DatabaseOps() # conexão aberta sob demanda, no primeiro insert
+
+    def ler_bronze(self, tabela):
+        """
+        Lê uma tabela bronze da partição do dia, apenas com as colunas usadas pela camada Silver.
+
+        Args:
+            tabela (str): Nome da tabela bronze.
+
+        Returns:
+            DataFrame: Dados bronze do dia.
+        """
+        return self.leitor.read(tabela, self.today, columns=self.colunas_bronze.get(tabela))
 
-    def silver_city_information(self):
+    @profiled
+    def silver_city_information(self, df=None):
         """
         Função para extrair e transformar informações das cidades da camada Bronze.
 
+        Args:
+            df (DataFrame, optional): Dados bronze já em memória (um micro-lote). Por padrão, lidos do arquivo do dia.
+
         Returns:
             DataFrame: DataFrame contendo informações das cidades.
         """
-        BRONZE_DIR = os.path.join(fr'..\data\bronze\{self.ref_month}\{self.ref_day}')
-        dir_city = pd.read_parquet(os.path.join(BRONZE_DIR, 'city_information.parquet'))
+        if df is None:
+            dir_city = self.ler_bronze('city_information')
+        else:
+            dir_city = df.copy()
 
         # Convertendo os segundos para objetos datetime
         dir_city['sunrise'] = pd.to_datetime(dir_city['sunrise'], unit='s').dt.strftime('%H:%M:%S')
@@ -48,19 +89,25 @@ class IntegracaoSilver:
         # Convertendo para o fuso horário de São Paulo
         fuso_horario_atual = pytz.timezone('America/Sao_Paulo')
         dir_city['timezone'] = datetime.now(fuso_horario_atual).strftime('%H:%M:%S')
-        dir_city['ref'] = datetime.now().strftime('%Y/%m')
+        dir_city['ref'] = self.today.strftime('%Y/%m')
 
         return dir_city
 
-    def silver_temperatures_information(self):
+    @profiled
+    def silver_temperatures_information(self, df=None):
         """
         Função para extrair e transformar informações de temperatura da camada Bronze.
 
+        Args:
+            df (DataFrame, optional): Dados bronze já em memória (um micro-lote). Por padrão, lidos do arquivo do dia.
+
         Returns:
             DataFrame: DataFrame contendo informações de temperatura.
         """
-        BRONZE_DIR = os.path.join(fr'..\data\bronze\{self.ref_month}\{self.ref_day}')
-        dir_temperatures = pd.read_parquet(os.path.join(BRONZE_DIR, 'temperatures_information.parquet'))
+        if df is None:
+            dir_temperatures = self.ler_bronze('temperatures_information')
+        else:
+            dir_temperatures = df.copy()
 
         dir_temperatures['temp_celsius'] = round(dir_temperatures['temp'] - 273.15, 2)
         dir_temperatures['temp_fahrenheit'] = round((dir_temperatures['temp_celsius'] * 9/5) + 32, 2)
@@ -76,20 +123,26 @@ class IntegracaoSilver:
         dir_temperatures['feels_like_celsius'] = round(dir_temperatures['feels_like'] - 273.15, 2)
         dir_temperatures['feels_like_fahrenheit'] = round((dir_temperatures['feels_like_celsius'] * 9/5) + 32, 2)
 
-        dir_temperatures['dt_ingestao'] = datetime.now().strftime('%Y-%m-%d')
+        dir_temperatures['dt_ingestao'] = self.today.strftime('%Y-%m-%d')
 
-        df_resultado = dir_temperatures[['id_city','temp_celsius','temp_fahrenheit', 'feels_like_celsius','feels_like_fahrenheit', 'temp_min_celsius','temp_max_celsius','temp_min_fahrenheit','temp_max_fahrenheit','pressure','id','dt_ingestao']]
+        df_resultado = dir_temperatures[['id_city','temp_celsius','temp_fahrenheit', 'feels_like_celsius','feels_like_fahrenheit', 'temp_min_celsius','temp_max_celsius','temp_min_fahrenheit','temp_max_fahrenheit','pressure','id','dt','dt_ingestao']]
         return df_resultado
 
-    def silver_weather_of_the_day(self):
+    @profiled
+    def silver_weather_of_the_day(self, df=None):
         """
         Função para extrair e transformar informações meteorológicas do dia da camada Bronze.
 
+        Args:
+            df (DataFrame, optional): Dados bronze já em memória (um micro-lote). Por padrão, lidos do arquivo do dia.
+
         Returns:
             DataFrame: DataFrame contendo informações meteorológicas do dia.
         """
-        BRONZE_DIR = os.path.join(fr'..\data\bronze\{self.ref_month}\{self.ref_day}')
-        dir_weather = pd.read_parquet(os.path.join(BRONZE_DIR, 'weather_of_day.parquet'))
+        if df is None:
+            dir_weather = self.ler_bronze('weather_of_the_day')
+        else:
+            dir_weather = df.copy()
 
         # Remover o deslocamento do fuso horário
         fuso_horario = pytz.timezone('America/Sao_Paulo')
@@ -100,15 +153,21 @@ class IntegracaoSilver:
 
         return dir_weather
 
-    def silver_wind_information(self):
+    @profiled
+    def silver_wind_information(self, df=None):
         """
         Função para extrair e transformar informações de vento da camada Bronze.
 
+        Args:
+            df (DataFrame, optional): Dados bronze já em memória (um micro-lote). Por padrão, lidos do arquivo do dia.
+
         Returns:
             DataFrame: DataFrame contendo informações de vento.
         """
-        BRONZE_DIR = os.path.join(fr'..\data\bronze\{self.ref_month}\{self.ref_day}')
-        dir_wind = pd.read_parquet(os.path.join(BRONZE_DIR, 'wind_information.parquet'))
+        if df is None:
+            dir_wind = self.ler_bronze('wind_information')
+        else:
+            dir_wind = df.copy()
 
         dir_wind['speed_km_h'] = round(dir_wind['speed'] * 3.6, 2)
         dir_wind['speed_mph'] = round(dir_wind['speed'] * 2.23694, 2)
@@ -117,20 +176,10 @@ class IntegracaoSilver:
 
         dir_wind[['speed_km_h', 'speed_mph', 'gust_km_h', 'gust_mph']] = dir_wind[['speed_km_h', 'speed_mph', 'gust_km_h', 'gust_mph']].fillna(0)
 
-        dir_wind.drop(['speed','deg','gust'], axis=1, inplace=True)
+        dir_wind.drop(['speed','deg','gust'], axis=1, inplace=True, errors='ignore')
 
         return dir_wind
 
-    def connect_databases():
-        """
-        Método para conectar ao banco de dados.
-        """
-        global database, database_connection
-
-        database = DatabaseOps()
-        database_connection = database.connect_db()
-    connect_databases()
-
     def insert_database(self, df, schema, table):
         """
         Método para inserir dados no banco de dados.
@@ -144,35 +193,123 @@ class IntegracaoSilver:
             bool: True se a inserção for bem-sucedida, False caso contrário.
         """
         try:
-            database.insert(dataframe=df, schema=schema, table=table, if_exists=self.insert_method)
+            self.database.insert(dataframe=df, schema=schema, table=table, if_exists=self.insert_method,
+                                 keys=self.chaves_naturais.get(table))
             return True 
         except Exception as e:
             print(f"[erro][feat_silver_clima][def: insert_database]\nErro durante a inserção no banco de dados: {e}")
             return False 
 
-    def pipeline(self):
+    def insert_stage(self, tabelas, schema):
         """
-        Método para executar o pipeline de integração de dados.
+        Método para inserir as tabelas de uma etapa de forma concorrente e atômica.
+
+        Args:
+            tabelas (dict): Nome da tabela -> DataFrame com os dados a serem inseridos.
+            schema (str): Nome do schema no banco de dados.
 
         Returns:
-            bool: True se o pipeline for concluído com sucesso, False caso contrário.
+            dict: Latência de carga por tabela e total, ou False em caso de erro.
         """
         try:
-            # Obter e inserir informações das cidades
-            silver_city = self.silver_city_information()
-            self.insert_database(silver_city, 'silver', 'city_information')
+            with metrics.step('silver_clima.insert', schema=schema) as m:
+                m.set(rows_in=sum(len(df) for df in tabelas.values()))
+                return self.database.load_stage([(schema, table, df) for table, df in tabelas.items()],
+                                                 if_exists=self.insert_method, keys=self.chaves_naturais)
+        except Exception as e:
+            print(f"[erro][feat_silver_clima][def: insert_stage]\nErro durante a inserção no banco de dados: {e}")
+            return False
 
-            # Obter e inserir informações de temperatura
-            silver_temperature = self.silver_temperatures_information()
-            self.insert_database(silver_temperature, 'silver', 'temperatures_information')
+    def medicoes(self, tabelas):
+        """
+        Método para juntar temperatura, vento e condição do tempo de cada observação (id_city, dt).
 
-            # Obter e inserir informações meteorológicas do dia
-            silver_weather = self.silver_weather_of_the_day()
-            self.insert_database(silver_weather, 'silver', 'weather_of_the_day')
+        Args:
+            tabelas (dict): Nome da tabela -> DataFrame silver.
 
-            # Obter e inserir informações de vento
-            silver_wind = self.silver_wind_information()
-            self.insert_database(silver_wind, 'silver', 'wind_information')
+        Returns:
+            DataFrame: Uma linha por observação, com as medidas das três tabelas.
+        """
+        medidas = tabelas['temperatures_information'][['id_city', 'dt', 'temp_celsius', 'feels_like_celsius',
+                                                       'temp_min_celsius', 'temp_max_celsius', 'pressure', 'dt_ingestao']]
+        vento = tabelas['wind_information'][['id_city', 'dt', 'speed_km_h', 'gust_km_h']]
+
+        # A tabela do dia guarda o horário como texto no fuso de São Paulo: volta para segundos para cruzar com as demais
+        tempo = tabelas['weather_of_the_day'][['id_city', 'date', 'main', 'description', 'rain']]
+        instantes = pd.to_datetime(tempo['date']).dt.tz_localize('America/Sao_Paulo', ambiguous='NaT', nonexistent='NaT')
+        tempo = tempo[instantes.notna()].assign(dt=instantes.dropna().astype('int64') // 10**9).drop(columns='date')
+
+        return (medidas.merge(vento.drop_duplicates(['id_city', 'dt']), on=['id_city', 'dt'], how='left')
+                       .merge(tempo.drop_duplicates(['id_city', 'dt']), on=['id_city', 'dt'], how='left'))
+
+    def alimentar_serie_temporal(self, tabelas):
+        """
+        Método para acrescentar as medições carregadas às séries temporais de cada cidade.
+
+        Args:
+            tabelas (dict): Nome da tabela -> DataFrame silver já inserido no banco.
+
+        Returns:
+            int: Quantidade de linhas acrescentadas às séries (0 se desativadas).
+        """
+        if self.series is None:
+            return 0
+        with metrics.step('silver_clima.serie_temporal') as m:
+            serie = self.medicoes(tabelas)
+            linhas = self.series.append_frame(serie)
+            m.set(rows_in=len(serie), rows_out=linhas)
+            return linhas
+
+    def publicar_ultimas(self, tabelas):
+        """
+        Método para publicar a observação mais recente de cada cidade para o serviço de leitura.
+
+        Args:
+            tabelas (dict): Nome da tabela -> DataFrame silver já inserido no banco.
+
+        Returns:
+            int: Quantidade de cidades no snapshot, ou False em caso de erro (os dados já estão no banco).
+        """
+        try:
+            with metrics.step('silver_clima.publicar_ultimas') as m:
+                cidades = tabelas['city_information'][['id_city', 'city', 'sigla', 'lat', 'lon']].drop_duplicates('id_city', keep='last')
+                ultimas = cidades.merge(self.medicoes(tabelas), on='id_city', how='inner')
+                total = latest.publish('clima', ultimas, self.storage_root)
+                m.set(rows_in=len(ultimas), rows_out=total)
+                return total
+        except Exception as e:
+            print(f"[erro][feat_silver_clima][def: publicar_ultimas]\nErro ao publicar o snapshot de leitura: {e}")
+            return False
+
+    def pipeline(self):
+        """
+        Método para executar o pipeline de integração de dados.
+
+        Returns:
+            bool: True se o pipeline for concluído com sucesso, False caso contrário.
+        """
+        try:
+            # Obter informações das cidades, de temperatura, meteorológicas do dia e de vento
+            transformacoes = {
+                'city_information': self.silver_city_information,
+                'temperatures_information': self.silver_temperatures_information,
+                'weather_of_the_day': self.silver_weather_of_the_day,
+                'wind_information': self.silver_wind_information,
+            }
+            tabelas = {}
+            for tabela, transformar in transformacoes.items():
+                memory.check('silver_clima')  # Falha cedo se o orçamento de memória estourar
+                with metrics.step('silver_clima.transformar', tabela=tabela) as m:
+                    tabelas[tabela] = transformar()
+                    m.set(rows_out=len(tabelas[tabela]))
+
+            # Inserir as quatro tabelas em uma única carga atômica
+            if self.insert_stage(tabelas, 'silver') is False:
+                return False
+
+            # As séries e o serviço de leitura só recebem o que já está no banco
+            self.alimentar_serie_temporal(tabelas)
+            self.publicar_ultimas(tabelas)
 
             return True
         except Exception as e:
@@ -0,0 +1,187 @@
+import os
+import sys
+import queue
+import threading
+import time
+
+src_dir = os.path.join(os.getcwd().split('src')[0], 'src','utils')
+sys.path.insert(0, src_dir)
+from features.feat_bronze_clima import ClimateData
+from features.feat_silver_clima import IntegracaoSilver
+from utils.metrics import metrics
+from utils import bronze_store
+
+_FIM = object()  # Marca o fim do fluxo em cada fila
+
+
+class StreamClima:
+    """
+    Execução em micro-lotes das camadas Bronze e Silver de clima.
+
+    As cidades são divididas em lotes de tamanho_lote e cada lote passa por
+    coleta -> normalização e gravação bronze -> transformação silver -> carga
+    no banco. Cada fase roda em sua própria thread, ligada à seguinte por uma
+    fila limitada (profundidade_fila): enquanto um lote é carregado, os
+    próximos já estão sendo coletados e transformados, e a memória fica
+    limitada a alguns lotes, independentemente do total de cidades.
+
+    Os arquivos bronze são gravados como partes (<tabela>.parquet/part-N.parquet),
+    lidas pelo BronzeReader nas etapas seguintes. Com detecção
+    de mudanças, cada lote segue apenas com as cidades cuja observação mudou e
+    as partes se somam às já gravadas no dia.
+
+    Attributes:
+        bronze (ClimateData): Coleta e normalização da camada Bronze.
+        silver (IntegracaoSilver): Transformações da camada Silver.
+        tamanho_lote (int): Cidades por lote.
+        profundidade_fila (int): Lotes aguardando em cada fila entre as fases.
+    """
+    # Tabela -> (método bronze, método silver, arquivo bronze)
+    TABELAS = {
+        'city_information': ('bronze_city_information', 'silver_city_information', 'city_information.parquet'),
+        'temperatures_information': ('bronze_temperatures_information', 'silver_temperatures_information', 'temperatures_information.parquet'),
+        'weather_of_the_day': ('bronze_weather_of_the_day', 'silver_weather_of_the_day', 'weather_of_day.parquet'),
+        'wind_information': ('bronze_wind_information', 'silver_wind_information', 'wind_information.parquet'),
+    }
+
+    def __init__(self, json_cities: str, tamanho_amostral: int=None, insert_method: str='append',
+                 data_referencia=None, storage_root: str=None, workers: int=1, checkpoint: bool=True,
+                 tamanho_lote: int=500, profundidade_fila: int=2, detectar_mudancas: bool=False,
+                 serie_temporal: bool=False, execucao: str=None):
+        self.bronze = ClimateData(json_cities=json_cities, tamanho_amostral=tamanho_amostral, insert_method=insert_method,
+                                  data_referencia=data_referencia, storage_root=storage_root, workers=workers,
+                                  checkpoint=checkpoint, detectar_mudancas=detectar_mudancas, execucao=execucao)
+        self.silver = IntegracaoSilver(insert_method=insert_method, data_referencia=data_referencia,
+                                       storage_root=storage_root, serie_temporal=serie_temporal)
+        self.insert_method = insert_method
+        self.tamanho_lote = tamanho_lote
+        self.profundidade_fila = profundidade_fila
+        self.lotes_carregados = 0
+        self.primeira_carga = None  # Segundos até o primeiro lote chegar ao banco
+
+    def _fase(self, nome, entrada, saida, func, parar, erros):
+        """
+        Consome lotes de entrada, aplica func e publica o resultado na saída, até o fim do fluxo ou um erro.
+        """
+        item = None
+        try:
+            while True:
+                item = entrada.get()
+                if item is _FIM or parar.is_set():
+                    break
+                resultado = func(item)
+                if saida is not None:
+                    saida.put(resultado)
+        except Exception as e:
+            erros.append((nome, e))
+            parar.set()
+        finally:
+            if saida is not None:
+                saida.put(_FIM)
+            # Esvazia a entrada para que a fase anterior não fique bloqueada em uma fila cheia
+            while parar.is_set() and item is not _FIM:
+                item = entrada.get()
+
+    def coletar(self, lote):
+        numero, cidades = lote
+        weather_data = self.bronze.fetch_weather_data(cidades)
+        obtidas = weather_data['id'].tolist() if not weather_data.empty else []
+        weather_data, impressoes = self.bronze.filtrar_inalterados(weather_data)
+        return numero, weather_data, impressoes, obtidas
+
+    def transformar(self, lote):
+        numero, weather_data, impressoes, obtidas = lote
+        bronze, silver = {}, {}
+        if weather_data.empty:
+            return numero, bronze, silver, impressoes, obtidas
+        with metrics.step('stream_clima.transformar', lote=numero) as m:
+            for tabela, (metodo_bronze, metodo_silver, nome_arquivo) in self.TABELAS.items():
+                bronze[tabela] = getattr(self.bronze, metodo_bronze)(weather_data, self.bronze.ref_month,
+                                                                     self.bronze.ref_day, salvar=False)
+                caminho = os.path.join(self.bronze.local_dir, nome_arquivo)
+                if self.bronze.impressoes is not None:
+                    bronze_store.append_part(bronze[tabela], caminho, 'bronze', tabela)
+                else:
+                    bronze_store.write_part(bronze[tabela], caminho, numero, 'bronze', tabela)
+                silver[tabela] = getattr(self.silver, metodo_silver)(bronze[tabela])
+            m.set(rows_in=len(weather_data), rows_out=sum(len(df) for df in silver.values()))
+        return numero, bronze, silver, impressoes, obtidas
+
+    def carregar(self, lote):
+        numero, bronze, silver, impressoes, obtidas = lote
+        if not bronze:
+            self.bronze.resolver_falhas(obtidas)  # Nada mudou: as observações já estão no banco
+            return
+        # Em 'replace' apenas o primeiro lote substitui as tabelas; os demais acrescentam
+        modo = 'append' if self.insert_method == 'replace' and self.lotes_carregados else self.insert_method
+        with metrics.step('stream_clima.carregar', lote=numero) as m:
+            m.set(rows_in=sum(len(df) for df in bronze.values()) + sum(len(df) for df in silver.values()))
+            for schema, tabelas, database, chaves in (('bronze', bronze, self.bronze.database, self.bronze.chaves_naturais),
+                                                      ('silver', silver, self.silver.database, self.silver.chaves_naturais)):
+                database.load_stage([(schema, tabela, df) for tabela, df in tabelas.items()], if_exists=modo, keys=chaves)
+        self.bronze.registrar_impressoes(impressoes)
+        self.bronze.resolver_falhas(obtidas)  # Só deixam a fila de falhas depois de gravadas
+        self.silver.alimentar_serie_temporal(silver)
+        self.silver.publicar_ultimas(silver)
+        self.lotes_carregados += 1
+
+    def pipeline(self):
+        """
+        Executa coleta, bronze, silver e carga em micro-lotes.
+
+        Retorna:
+            None: Se o pipeline for executado com sucesso.
+            bool: False se ocorrer algum erro durante o processo.
+        """
+        try:
+            inicio = time.perf_counter()
+            br_cidades = self.bronze.load_city_list()
+
+            # Saídas bronze de execuções anteriores no mesmo dia são substituídas pelas partes deste fluxo,
+            # exceto com detecção de mudanças, em que as partes de cada execução se acumulam no dia
+            self.bronze.create_local_directory(self.bronze.ref_month, self.bronze.ref_day)
+            if self.bronze.impressoes is None:
+                for _, _, nome_arquivo in self.TABELAS.values():
+                    bronze_store.reset(os.path.join(self.bronze.local_dir, nome_arquivo))
+
+            lotes = queue.Queue(maxsize=self.profundidade_fila)
+            coletados = queue.Queue(maxsize=self.profundidade_fila)
+            transformados = queue.Queue(maxsize=self.profundidade_fila)
+            parar, erros = threading.Event(), []
+
+            def carregar(lote):
+                self.carregar(lote)
+                if self.primeira_carga is None:
+                    self.primeira_carga = time.perf_counter() - inicio
+                    print(f'[stream] primeiro lote no banco em {self.primeira_carga:.1f} segundos')
+
+            fases = [
+                threading.Thread(target=self._fase, args=('coletar', lotes, coletados, self.coletar, parar, erros)),
+                threading.Thread(target=self._fase, args=('transformar', coletados, transformados, self.transformar, parar, erros)),
+                threading.Thread(target=self._fase, args=('carregar', transformados, None, carregar, parar, erros)),
+            ]
+            for fase in fases:
+                fase.start()
+
+            with metrics.step('stream_clima', tamanho_lote=self.tamanho_lote) as m:
+                for numero, posicao in enumerate(range(0, len(br_cidades), self.tamanho_lote)):
+                    if parar.is_set():
+                        break
+                    lotes.put((numero, br_cidades.iloc[posicao:posicao + self.tamanho_lote]))
+                lotes.put(_FIM)
+                for fase in fases:
+                    fase.join()
+                m.set(rows_in=len(br_cidades), lotes=self.lotes_carregados, primeira_carga_s=self.primeira_carga)
+
+            if erros:
+                fase, erro = erros[0]
+                print(f"[erro][feat_stream_clima][fase: {fase}]\n{erro}")
+                return False
+
+            if self.bronze.checkpoint:
+                self.bronze.checkpoint.clear()  # Etapa concluída: a próxima execução começa do zero
+            return None
+
+        except Exception as e:
+            print(f"[erro][feat_stream_clima][def: pipeline]\nErro durante a execução do pipeline: {e}")
+            return False
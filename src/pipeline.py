@@ -1,30 +1,447 @@
-from features.feat_bronze_clima import ClimateData
-from features.feat_bronze_transito import TrafficData
-from features.feat_silver_clima import IntegracaoSilver
+from utils.dag import DagExecutor
+from utils.metrics import metrics
+from utils.memory import memory
+from datetime import date, datetime, timedelta
+import argparse
+import os
+import sys
 import time
 
-if __name__ == '__main__':
-    start_time = time.time()
+ETAPAS = ('bronze_clima', 'bronze_transito', 'silver_clima')
+
+
+def etapa(nome, descricao, func):
+    """
+    Envolve a execução de uma etapa com as mensagens de início, sucesso e erro,
+    suas métricas e o controle de memória (orçamento em MEMORY_BUDGETS).
+    """
+    def executar():
+        print(f'[insercao]{descricao}')
+        with metrics.step('etapa', etapa=nome) as m, memory.track(nome, step=m):
+            resultado = func()
+            m.set(sucesso=resultado is not False)
+        if resultado is False:
+            print(f'[erro]{descricao}')
+        else:
+            print(f'[sucesso]{descricao}\n')
+        return resultado
+    return executar
+
+
+def data_iso(valor):
     try:
-        print('[insercao][schema: bronze][dados: clima]')
-        ClimateData(json_cities='./data/city_list.json', tamanho_amostral=5).pipeline()
-        print('sucesso!\n')
-    except Exception as e:
-        print(f'[erro][schema: bronze][dados: clima]\n{e}')
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"data inválida '{valor}', use AAAA-MM-DD")
+
 
+def inteiro_positivo(valor):
     try:
-        print('[insercao][schema: bronze][dados: transito]')
-        TrafficData().pipeline()
-        print('sucesso!\n')
-    except Exception as e:
-        print(f'[erro][schema: bronze][dados: transito]\n{e}')
+        numero = int(valor)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"número inteiro inválido '{valor}'")
+    if numero < 1:
+        raise argparse.ArgumentTypeError(f"deve ser maior que zero: {numero}")
+    return numero
+
+
+def lista_etapas(valor):
+    etapas = [nome.strip() for nome in valor.split(',') if nome.strip()]
+    desconhecidas = [nome for nome in etapas if nome not in ETAPAS]
+    if desconhecidas:
+        raise argparse.ArgumentTypeError(f"etapas desconhecidas: {', '.join(desconhecidas)}. Opções: {', '.join(ETAPAS)}")
+    return etapas
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Pipeline de ingestão de dados da Zebrinha Azul.')
+
+    amostra = parser.add_mutually_exclusive_group()
+    amostra.add_argument('--amostra', type=inteiro_positivo, default=5, metavar='N',
+                         help='quantidade de cidades sorteadas (padrão: 5)')
+    amostra.add_argument('--todas', action='store_true', help='processa todas as cidades brasileiras')
+    parser.add_argument('--cidades', default=os.path.join('.', 'data', 'city_list.json'),
+                        help='arquivo JSON com a lista de cidades (padrão: ./data/city_list.json)')
+
+    datas = parser.add_mutually_exclusive_group()
+    datas.add_argument('--data', type=data_iso, metavar='AAAA-MM-DD', help='data de referência (padrão: hoje)')
+    datas.add_argument('--de', type=data_iso, metavar='AAAA-MM-DD', help='início do intervalo de datas de referência')
+    parser.add_argument('--ate', type=data_iso, metavar='AAAA-MM-DD', help='fim do intervalo (inclusive, padrão: hoje)')
+
+    parser.add_argument('--etapas', type=lista_etapas, default=list(ETAPAS),
+                        help=f"etapas a executar, separadas por vírgula (padrão: {','.join(ETAPAS)})")
+    parser.add_argument('--workers', type=inteiro_positivo, default=1,
+                        help='requisições simultâneas às APIs em cada etapa (padrão: 1)')
+    parser.add_argument('--workers-etapas', type=inteiro_positivo, default=None,
+                        help='etapas independentes executadas em paralelo (padrão: todas)')
+    parser.add_argument('--batch-size', type=inteiro_positivo, default=None,
+                        help='linhas por lote de INSERT (padrão: DB_BATCH_SIZE ou 5000)')
+    parser.add_argument('--storage-root', default=None,
+                        help='raiz dos arquivos locais (padrão: STORAGE_ROOT ou ../data)')
+    parser.add_argument('--backend', choices=('mssql', 'sqlite'), default=None,
+                        help='banco de destino (padrão: STORAGE_BACKEND ou mssql)')
+    parser.add_argument('--insert-method', choices=('append', 'replace', 'upsert'), default='append',
+                        help='modo de inserção no banco (padrão: append; upsert mescla pelas chaves naturais)')
+    parser.add_argument('--lote', type=inteiro_positivo, default=None, metavar='CIDADES',
+                        help='executa clima em micro-lotes de CIDADES (coleta, bronze, silver e carga em fluxo)')
+    parser.add_argument('--profundidade-fila', type=inteiro_positivo, default=2,
+                        help='lotes em espera entre as fases do modo em micro-lotes (padrão: 2)')
+    parser.add_argument('--sem-checkpoint', action='store_true',
+                        help='não grava nem retoma checkpoints de execuções interrompidas')
+    parser.add_argument('--detectar-mudancas', action='store_true',
+                        help='grava e carrega apenas as observações de clima que mudaram desde a última carga do dia')
+    parser.add_argument('--serie-temporal', action='store_true',
+                        help='acrescenta as medições da etapa silver às séries temporais locais de cada cidade')
+    parser.add_argument('--reprocessar', action='store_true',
+                        help='busca apenas as cidades e pares da fila de falhas e os mescla à partição bronze do dia')
+    parser.add_argument('--max-tentativas', type=int, default=5, metavar='N',
+                        help='no reprocessamento, ignora itens que já falharam N vezes (padrão: 5, 0 para todos)')
+    parser.add_argument('--compactar', action='store_true',
+                        help='junta as partes dos arquivos bronze de cada data em um arquivo por tabela, em vez de executar as etapas')
+    parser.add_argument('--cidade-proxima', type=float, nargs=2, action='append', default=None, metavar=('LAT', 'LON'),
+                        help='informa as cidades da lista mais próximas da coordenada (repetível), em vez de executar as etapas')
+    parser.add_argument('--vizinhos', type=inteiro_positivo, default=1, metavar='N',
+                        help='com --cidade-proxima, quantidade de cidades por coordenada (padrão: 1)')
+    parser.add_argument('--raio-km', type=float, default=None, metavar='KM',
+                        help='com --cidade-proxima, informa todas as cidades até essa distância em vez das N mais próximas')
+    parser.add_argument('--profile', default=None, metavar='ETAPAS',
+                        help='funções a perfilar, separadas por vírgula (ou all); veja ZEBRINHA_PROFILE')
+
+    leitura = parser.add_argument_group('serviço de leitura')
+    leitura.add_argument('--servir', action='store_true',
+                         help='sobe o serviço HTTP de leitura do clima e trânsito mais recentes, em vez de executar as etapas')
+    leitura.add_argument('--host', default='127.0.0.1', help='endereço do serviço de leitura (padrão: 127.0.0.1)')
+    leitura.add_argument('--porta', type=inteiro_positivo, default=8080, help='porta do serviço de leitura (padrão: 8080)')
+    leitura.add_argument('--cache-itens', type=inteiro_positivo, default=10000, metavar='N',
+                         help='respostas mantidas no cache LRU do serviço (padrão: 10000)')
+    leitura.add_argument('--cache-ttl', type=float, default=30, metavar='SEGUNDOS',
+                         help='validade de cada resposta no cache (padrão: 30)')
+
+    daemon = parser.add_argument_group('modo daemon')
+    daemon.add_argument('--daemon', action='store_true',
+                        help='permanece em execução, rodando as coletas em intervalos fixos')
+    daemon.add_argument('--intervalo-clima', type=float, default=3600, metavar='SEGUNDOS',
+                        help='intervalo entre ciclos de clima (bronze e silver, padrão: 3600)')
+    daemon.add_argument('--intervalo-transito', type=float, default=3600, metavar='SEGUNDOS',
+                        help='intervalo entre ciclos de trânsito (padrão: 3600)')
+    daemon.add_argument('--intervalo-compactacao', type=float, default=None, metavar='SEGUNDOS',
+                        help='compacta as partes bronze do dia nesse intervalo (padrão: desligado)')
+    # Identificador da execução dono dos checkpoints; definido pelo daemon a cada ciclo
+    parser.set_defaults(execucao=None)
+
+    args = parser.parse_args(argv)
+    if args.ate is not None and args.de is None:
+        parser.error('--ate exige --de')
+    if args.de is not None and args.de > (args.ate or date.today()):
+        parser.error('--de deve ser anterior ou igual a --ate')
+    if args.detectar_mudancas and args.insert_method == 'replace':
+        parser.error("--detectar-mudancas carrega apenas as linhas alteradas; use --insert-method upsert ou append")
+    if args.reprocessar and (args.lote or args.daemon):
+        parser.error('--reprocessar não se combina com --lote ou --daemon')
+    if args.daemon and (args.data or args.de):
+        parser.error('--daemon usa sempre a data do dia; não combine com --data ou --de')
+    if args.compactar and (args.daemon or args.reprocessar):
+        parser.error('--compactar não se combina com --daemon ou --reprocessar; no daemon use --intervalo-compactacao')
+    if args.servir and (args.daemon or args.reprocessar or args.compactar or args.cidade_proxima):
+        parser.error('--servir não se combina com --daemon, --reprocessar, --compactar ou --cidade-proxima')
+    if args.max_tentativas < 0:
+        parser.error('--max-tentativas não pode ser negativo')
+    if args.cache_ttl <= 0:
+        parser.error('--cache-ttl deve ser maior que zero')
+    if args.cidade_proxima and (args.daemon or args.reprocessar or args.compactar):
+        parser.error('--cidade-proxima não se combina com --daemon, --reprocessar ou --compactar')
+    if any(not (-90 <= lat <= 90 and -180 <= lon <= 180) for lat, lon in args.cidade_proxima or []):
+        parser.error('--cidade-proxima: latitude entre -90 e 90, longitude entre -180 e 180')
+    if args.raio_km is not None and args.raio_km <= 0:
+        parser.error('--raio-km deve ser maior que zero')
+    if args.intervalo_clima <= 0 or args.intervalo_transito <= 0 or (args.intervalo_compactacao is not None and args.intervalo_compactacao <= 0):
+        parser.error('os intervalos devem ser maiores que zero')
+    return args
+
+
+def datas_referencia(args):
+    if args.de is None:
+        return [args.data or date.today()]
+    fim = args.ate or date.today()
+    return [args.de + timedelta(days=n) for n in range((fim - args.de).days + 1)]
+
+
+# As classes das etapas são importadas sob demanda, para que a inicialização
+# carregue apenas as dependências (pandas, SQLAlchemy, ...) das etapas escolhidas
+def bronze_clima(args, data_referencia):
+    from features.feat_bronze_clima import ClimateData
+    return ClimateData(json_cities=args.cidades, tamanho_amostral=None if args.todas else args.amostra,
+                       insert_method=args.insert_method, data_referencia=data_referencia,
+                       storage_root=args.storage_root, workers=args.workers,
+                       checkpoint=not args.sem_checkpoint, detectar_mudancas=args.detectar_mudancas,
+                       execucao=args.execucao).pipeline()
+
+
+def stream_clima(args, data_referencia):
+    from features.feat_stream_clima import StreamClima
+    return StreamClima(json_cities=args.cidades, tamanho_amostral=None if args.todas else args.amostra,
+                       insert_method=args.insert_method, data_referencia=data_referencia,
+                       storage_root=args.storage_root, workers=args.workers, checkpoint=not args.sem_checkpoint,
+                       tamanho_lote=args.lote, profundidade_fila=args.profundidade_fila,
+                       detectar_mudancas=args.detectar_mudancas, serie_temporal=args.serie_temporal,
+                       execucao=args.execucao).pipeline()
+
+
+def bronze_transito(args, data_referencia):
+    from features.feat_bronze_transito import TrafficData
+    return TrafficData(insert_method=args.insert_method, data_referencia=data_referencia,
+                       storage_root=args.storage_root, workers=args.workers,
+                       checkpoint=not args.sem_checkpoint, execucao=args.execucao).pipeline()
+
+
+def reprocessar_clima(args, data_referencia):
+    from features.feat_bronze_clima import ClimateData
+    return ClimateData(json_cities=args.cidades, insert_method=args.insert_method, data_referencia=data_referencia,
+                       storage_root=args.storage_root, workers=args.workers,
+                       checkpoint=False).reprocessar_falhas(args.max_tentativas)
+
+
+def reprocessar_transito(args, data_referencia):
+    from features.feat_bronze_transito import TrafficData
+    return TrafficData(insert_method=args.insert_method, data_referencia=data_referencia,
+                       storage_root=args.storage_root, workers=args.workers,
+                       checkpoint=False).reprocessar_falhas(args.max_tentativas)
+
+
+def silver_clima(args, data_referencia):
+    from features.feat_silver_clima import IntegracaoSilver
+    return IntegracaoSilver(insert_method=args.insert_method, data_referencia=data_referencia,
+                            storage_root=args.storage_root, serie_temporal=args.serie_temporal).pipeline()
+
+
+def compactar(args, data_referencia):
+    """
+    Junta as partes de cada tabela bronze da data em um único arquivo e informa
+    o ganho em quantidade de arquivos e em tempo de leitura.
+
+    Retorna:
+        int: Quantidade de tabelas cuja compactação falhou.
+    """
+    from utils import bronze_store
+    from utils.storage_paths import bronze_dir
+
+    diretorio = bronze_dir(data_referencia.month, data_referencia.day, args.storage_root)
+    falhas = 0
+    for tabela, nome_arquivo in bronze_store.BRONZE_FILES.items():
+        try:
+            with metrics.step('compactacao', tabela=tabela, data=str(data_referencia)) as m:
+                relatorio = bronze_store.compact(os.path.join(diretorio, nome_arquivo), 'bronze', tabela)
+                if relatorio:
+                    m.set(rows_in=relatorio['linhas'], rows_out=relatorio['linhas'],
+                          bytes_written=relatorio['bytes_depois'], **relatorio)
+        except Exception as e:
+            print(f'[erro][compactacao][{data_referencia}][{tabela}]\n{e}')
+            falhas += 1
+            continue
+        if relatorio:
+            ganho = relatorio['leitura_antes_s'] / relatorio['leitura_depois_s'] if relatorio['leitura_depois_s'] else 0
+            print(f"[compactacao][{data_referencia}][{tabela}] {relatorio['arquivos_antes']} -> 1 arquivo, "
+                  f"{relatorio['linhas']} linhas, leitura {relatorio['leitura_antes_s'] * 1000:.1f}ms -> "
+                  f"{relatorio['leitura_depois_s'] * 1000:.1f}ms ({ganho:.1f}x)")
+        else:
+            print(f'[compactacao][{data_referencia}][{tabela}] nada a compactar')
+    return falhas
+
+
+def cidade_proxima(args):
+    """
+    Informa as cidades da lista mais próximas de cada coordenada (ou dentro de --raio-km),
+    pelo índice espacial das cidades.
+
+    Retorna:
+        int: 0 se todas as coordenadas tiveram cidades encontradas, 1 caso contrário.
+    """
+    from features.feat_bronze_clima import ClimateData
+
+    indice = ClimateData(json_cities=args.cidades, storage_root=args.storage_root, checkpoint=False).city_index()
+    sem_resultado = 0
+    for lat, lon in args.cidade_proxima:
+        if args.raio_km is not None:
+            ids, distancias = indice.within(lat, lon, args.raio_km)
+        else:
+            ids, distancias = indice.nearest(lat, lon, args.vizinhos)
+        if not len(ids):
+            print(f'[cidade_proxima][{lat},{lon}] nenhuma cidade até {args.raio_km:g} km')
+            sem_resultado += 1
+        for cidade, distancia in zip(indice.describe(ids), distancias):
+            print(f"[cidade_proxima][{lat},{lon}] {cidade['id']} {cidade['name']} "
+                  f"({cidade['lat']:.4f},{cidade['lon']:.4f}) {distancia:.1f} km")
+    return 1 if sem_resultado else 0
+
+
+def montar_dag(args, data_referencia, etapas):
+    """
+    Monta o grafo com as etapas selecionadas. Dependências fora da seleção são
+    consideradas já satisfeitas (os arquivos bronze de execuções anteriores).
+    """
+    # Transito e silver dependem apenas dos arquivos bronze de clima, então rodam em paralelo
+    declaradas = {
+        'bronze_clima': ('[schema: bronze][dados: clima]', bronze_clima, []),
+        'bronze_transito': ('[schema: bronze][dados: transito]', bronze_transito, ['bronze_clima']),
+        'silver_clima': ('[schema: silver][dados: clima]', silver_clima, ['bronze_clima']),
+    }
+    if args.lote and 'bronze_clima' in etapas:
+        # Em micro-lotes a etapa de clima já produz a camada silver de cada lote
+        declaradas['bronze_clima'] = ('[schema: bronze e silver][dados: clima][micro-lotes]', stream_clima, [])
+        etapas = [nome for nome in etapas if nome != 'silver_clima']
+    if args.reprocessar:
+        # As etapas bronze buscam apenas os itens da fila de falhas; a silver refaz o dia com a partição completa
+        declaradas['bronze_clima'] = ('[schema: bronze][dados: clima][reprocessamento]', reprocessar_clima, [])
+        declaradas['bronze_transito'] = ('[schema: bronze][dados: transito][reprocessamento]', reprocessar_transito,
+                                         ['bronze_clima'])  # Inclui os pares das cidades recuperadas
+    dag = DagExecutor(max_workers=args.workers_etapas)
+    for nome in ETAPAS:
+        if nome not in etapas:
+            continue
+        descricao, func, inputs = declaradas[nome]
+        dag.add(nome, etapa(nome, f'[data: {data_referencia}]{descricao}', lambda func=func: func(args, data_referencia)),
+                inputs=[dep for dep in inputs if dep in etapas])
+    return dag
+
+
+def executar(args, data_referencia, etapas):
+    """
+    Executa as etapas para uma data de referência.
+
+    Retorna:
+        int: Quantidade de etapas que falharam ou foram puladas.
+    """
+    dag = montar_dag(args, data_referencia, etapas)
+    falhas = 0
+    for nome, stage in dag.run().items():
+        if stage.status == 'skipped':
+            print(f'[pulada][{nome}] etapa anterior falhou')
+        elif stage.error is not None:
+            print(f'[erro][{nome}]\n{stage.error}')
+        falhas += stage.status != 'ok'
+
+    caminho, duracao = dag.critical_path()
+    print(f"Caminho crítico ({data_referencia}): {' -> '.join(caminho)} ({duracao:.1f} segundos)")
+    return falhas
+
+
+def servir(args):
+    """
+    Serviço HTTP de leitura: responde com o clima mais recente de cada cidade e
+    o trânsito mais recente de cada par a partir dos snapshots publicados pelas
+    etapas, sem consultar o banco. As métricas de latência do serviço são
+    registradas a cada minuto. SIGINT/SIGTERM encerram o serviço.
+    """
+    import signal
+    import threading
+    from utils.read_service import ReadService
+
+    parar = threading.Event()
+
+    def encerrar(signum, frame):
+        print(f"[servico] sinal {signal.Signals(signum).name} recebido, encerrando")
+        parar.set()
+
+    signal.signal(signal.SIGINT, encerrar)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, encerrar)
+
+    def registrar_metricas(servico):
+        estado = servico.metrics_snapshot()
+        with metrics.step('servico_leitura') as m:
+            m.set(**{f'{rota}_{chave}': valor for rota, valores in estado['rotas'].items() for chave, valor in valores.items()},
+                  **{chave: valor for chave, valor in estado.items() if chave.startswith('cache_')})
+        metrics.flush()
+
+    with ReadService(args.host, args.porta, args.storage_root, cache_size=args.cache_itens, ttl=args.cache_ttl) as servico:
+        servico.start()
+        print(f"[servico] servindo em {servico.url} (snapshots: {', '.join(servico.index.loaded) or 'nenhum ainda'})")
+        while not parar.wait(60):
+            registrar_metricas(servico)
+        registrar_metricas(servico)
+    return 0
+
+
+def daemon(args):
+    """
+    Modo residente: clima (bronze e silver) e trânsito rodam em intervalos
+    próprios no mesmo processo. Módulos importados, sessão HTTP, pools de
+    conexão e a lista de cidades ficam carregados entre os ciclos, então cada
+    ciclo paga apenas pelo trabalho em si. SIGINT/SIGTERM encerram após o ciclo atual.
+    """
+    from utils.scheduler import Scheduler
+    from utils import http_client
+
+    scheduler = Scheduler()
+    scheduler.install_signal_handlers()
+    ciclos = {
+        'clima': ([nome for nome in ('bronze_clima', 'silver_clima') if nome in args.etapas], args.intervalo_clima),
+        'transito': ([nome for nome in ('bronze_transito',) if nome in args.etapas], args.intervalo_transito),
+    }
+    for ciclo, (etapas, intervalo) in ciclos.items():
+        if not etapas:
+            continue
+
+        def rodar_ciclo(ciclo=ciclo, etapas=etapas):
+            inicio = time.perf_counter()
+            # Cada ciclo é uma execução própria: o checkpoint de um ciclo que falhou é
+            # descartado pelo seguinte, que sorteia e busca tudo de novo
+            args_ciclo = argparse.Namespace(**{**vars(args), 'execucao': f'{ciclo}-{datetime.now().isoformat()}'})
+            with metrics.step('ciclo', ciclo=ciclo):
+                falhas = executar(args_ciclo, date.today(), etapas)
+            metrics.flush()
+            print(f'[daemon][{ciclo}] ciclo concluído em {time.perf_counter() - inicio:.1f} segundos')
+            return falhas == 0
+
+        scheduler.every(intervalo, ciclo, rodar_ciclo)
+        print(f'[daemon][{ciclo}] etapas {", ".join(etapas)} a cada {intervalo:g} segundos')
+
+    if args.intervalo_compactacao:
+        scheduler.every(args.intervalo_compactacao, 'compactacao', lambda: compactar(args, date.today()) == 0)
+        print(f'[daemon][compactacao] partes bronze do dia a cada {args.intervalo_compactacao:g} segundos')
 
     try:
-        print('[insercao][schema: silver][dados: clima]')
-        IntegracaoSilver().pipeline()
-        print('sucesso!\n')
-    except Exception as e:
-        print(f'[erro][schema: silver][dados: clima]\n{e}')
+        scheduler.run()
+    finally:
+        http_client.close()
+        if 'utils.database_operations' in sys.modules:
+            sys.modules['utils.database_operations'].dispose_engines()
+        print('[daemon] encerrado')
+
+    return 1 if any(job.failures for job in scheduler.jobs) else 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    start_time = time.time()
+
+    # Configurações lidas do ambiente por DatabaseOps e pelos backends; a raiz local também
+    # vale para as métricas, os perfis, a cota das APIs e o banco SQLite
+    if args.storage_root:
+        os.environ['STORAGE_ROOT'] = args.storage_root
+    if args.backend:
+        os.environ['STORAGE_BACKEND'] = args.backend
+    if args.batch_size:
+        os.environ['DB_BATCH_SIZE'] = str(args.batch_size)
+    if args.profile:
+        from utils import profiling
+        profiling.enable(args.profile.split(','))
+
+    if args.daemon:
+        return daemon(args)
+    if args.cidade_proxima:
+        return cidade_proxima(args)
+    if args.servir:
+        return servir(args)
+
+    falhas = 0
+    for data_referencia in datas_referencia(args):
+        if args.compactar:
+            falhas += compactar(args, data_referencia)
+        else:
+            falhas += executar(args, data_referencia, args.etapas)
+
+    metrics.flush()
 
     end_time = time.time()
 
@@ -35,3 +452,8 @@ if __name__ == '__main__':
     seconds = int(execution_time_seconds % 60)
 
     print(f"Tempo de execução: {hours} horas, {minutes} minutos e {seconds} segundos.")
+    return 1 if falhas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
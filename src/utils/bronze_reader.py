@@ -0,0 +1,115 @@
+import os
+from datetime import date, datetime, timezone
+
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from utils import bronze_store
+from utils.metrics import metrics
+from utils.storage_paths import bronze_dir
+
+
+class BronzeReader:
+    """
+    Shared reader of the bronze Parquet store.
+
+    A read names a table and the reference dates (partitions) to scan, and
+    optionally the columns, the city ids and a time range on the observation
+    dt. Partitions outside the dates are never listed. Columns and filters
+    are handed to the Arrow dataset scanner, which reads only the requested
+    columns and skips row groups whose min/max statistics cannot match (the
+    compacted files are sorted by id_city and dt, which keeps those ranges
+    tight). Both layouts are read: single files and directories of parts, with
+    compacted parts resolved as in bronze_store.read().
+
+    Usage:
+        reader = BronzeReader(storage_root)
+        df = reader.read('wind_information', data_referencia, columns=['id_city', 'dt', 'speed'], cities=[3448439])
+    """
+    def __init__(self, root=None):
+        self.root = root
+
+    def files(self, table, dates):
+        """
+        Live Parquet files of a table in the given partitions.
+
+        Args:
+            table (str): Bronze table, a key of bronze_store.BRONZE_FILES.
+            dates (date or iterable): Reference dates of the partitions.
+
+        Returns:
+            list: File paths.
+        """
+        if isinstance(dates, date):
+            dates = [dates]
+        files = []
+        for ref_date in dates:
+            path = os.path.join(bronze_dir(ref_date.month, ref_date.day, self.root), bronze_store.BRONZE_FILES[table])
+            files += bronze_store.live_parts(path)
+        return files
+
+    @staticmethod
+    def _timestamp(value):
+        if isinstance(value, datetime):
+            return int(value.replace(tzinfo=value.tzinfo or timezone.utc).timestamp())
+        return int(value)
+
+    def expression(self, table, cities=None, dt_from=None, dt_to=None, filters=None):
+        """
+        Arrow filter expression for a read, or None without filters.
+
+        Args:
+            cities (iterable, optional): Keep only these id_city values.
+            dt_from (datetime or int, optional): Keep observations with dt >= this (epoch seconds if int).
+            dt_to (datetime or int, optional): Keep observations with dt < this.
+            filters (list or Expression, optional): Extra filters, as an Arrow expression or in the
+                pyarrow/pandas DNF form, e.g. [('main', '=', 'Rain')].
+        """
+        schema = bronze_store.arrow_schema('bronze', table)
+        terms = []
+        if cities is not None:
+            terms.append(ds.field('id_city').isin([int(city) for city in cities]))
+        if (dt_from is not None or dt_to is not None) and 'dt' not in schema.names:
+            raise ValueError(f"Table '{table}' has no dt column to filter on")
+        if dt_from is not None:
+            terms.append(ds.field('dt') >= self._timestamp(dt_from))
+        if dt_to is not None:
+            terms.append(ds.field('dt') < self._timestamp(dt_to))
+        if filters is not None:
+            terms.append(filters if isinstance(filters, ds.Expression) else pq.filters_to_expression(filters))
+        expression = None
+        for term in terms:
+            expression = term if expression is None else expression & term
+        return expression
+
+    def read_arrow(self, table, dates, columns=None, cities=None, dt_from=None, dt_to=None, filters=None):
+        """
+        Read a bronze table as an Arrow table. See expression() for the filters.
+
+        Args:
+            table (str): Bronze table, a key of bronze_store.BRONZE_FILES.
+            dates (date or iterable): Reference dates of the partitions to scan.
+            columns (list, optional): Columns to read. Defaults to all declared columns.
+
+        Returns:
+            pyarrow.Table: The matching rows, with the declared schema.
+
+        Raises:
+            FileNotFoundError: None of the partitions has the table.
+        """
+        files = self.files(table, dates)
+        if not files:
+            raise FileNotFoundError(f"No bronze files for '{table}' on {dates}")
+        # O esquema declarado unifica arquivos únicos (gravados pelo pandas) e partes
+        dataset = ds.dataset(files, schema=bronze_store.arrow_schema('bronze', table), format='parquet')
+        with metrics.step('bronze.leitura', tabela=table) as m:
+            result = dataset.to_table(columns=columns,
+                                      filter=self.expression(table, cities, dt_from, dt_to, filters))
+            m.set(rows_out=result.num_rows, arquivos=len(files), colunas=len(result.column_names))
+        return result
+
+    def read(self, table, dates, columns=None, cities=None, dt_from=None, dt_to=None, filters=None):
+        """
+        Read a bronze table as a pandas DataFrame. Same arguments as read_arrow().
+        """
+        return self.read_arrow(table, dates, columns, cities, dt_from, dt_to, filters).to_pandas()
@@ -0,0 +1,287 @@
+import os
+import re
+import json
+import time
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.table_schemas import get_table
+
+# Tabela bronze -> arquivo (ou diretório de partes) na partição do dia
+BRONZE_FILES = {
+    'city_information': 'city_information.parquet',
+    'temperatures_information': 'temperatures_information.parquet',
+    'weather_of_the_day': 'weather_of_day.parquet',
+    'wind_information': 'wind_information.parquet',
+}
+
+# Chave dos metadados Parquet em que um arquivo compactado lista as partes que substitui
+REPLACES_KEY = b'zebrinha.replaces'
+
+# Tipos portáveis de table_schemas -> tipos Arrow dos arquivos bronze
+ARROW_TYPES = {
+    'int': pa.int64(), 'bigint': pa.int64(), 'float': pa.float64(),
+    'date': pa.date32(), 'datetime': pa.timestamp('s'),
+}
+
+
+def arrow_schema(schema, table):
+    """
+    Arrow schema of a declared table, or None if the table is not declared.
+    """
+    spec = get_table(schema, table)
+    if spec is None:
+        return None
+    return pa.schema([(name, pa.string() if portable.startswith('str') else ARROW_TYPES[portable])
+                      for name, portable in spec['columns']])
+
+
+def reset(path):
+    """
+    Remove a bronze output, either a single Parquet file or a directory of parts.
+    """
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def write_part(dataframe, path, part, schema='bronze', table=None):
+    """
+    Write one micro-batch of a bronze table as <path>/part-<n>.parquet.
+
+    The parts of a table share the declared schema, so a column that is
+    missing or typed differently in one chunk (e.g. no gust reported) does not
+    change the schema of the dataset. read(path) reads the parts back as one
+    table, the same call used for a single-file output.
+
+    Args:
+        dataframe (pd.DataFrame): Rows of the chunk.
+        path (str): Output of the table, e.g. <bronze dir>/wind_information.parquet.
+        part (int): Sequence number of the chunk.
+        schema (str, optional): Schema used to look up the declaration. Defaults to 'bronze'.
+        table (str, optional): Declared table name. When omitted the data is written as is.
+
+    Returns:
+        str: Path of the part written.
+    """
+    if os.path.isfile(path):
+        os.remove(path)  # Saída de uma execução em lote no mesmo dia
+    os.makedirs(path, exist_ok=True)
+
+    target = arrow_schema(schema, table) if table else None
+    if target is not None:
+        dataframe = dataframe.reindex(columns=target.names)
+    arrow_table = pa.Table.from_pandas(dataframe, schema=target, preserve_index=False)
+
+    part_path = os.path.join(path, f'part-{part:05d}.parquet')
+    # Arquivos iniciados por '.' são ignorados na leitura enquanto a escrita não termina
+    tmp_path = os.path.join(path, f'.part-{part:05d}.parquet.tmp')
+    pq.write_table(arrow_table, tmp_path)
+    os.replace(tmp_path, part_path)
+    return part_path
+
+
+def list_parts(path):
+    """
+    Files present for a bronze table, in order, including compacted ones and
+    the parts they replaced. A single-file output counts as one part.
+    """
+    if os.path.isfile(path):
+        return [path]
+    if not os.path.isdir(path):
+        return []
+    return sorted(os.path.join(path, name) for name in os.listdir(path)
+                  if re.fullmatch(r'part-\d+(-\d+)?\.parquet', name))
+
+
+def _replaced_by(part):
+    """
+    Names of the parts a compacted file replaces (empty for a regular part or a file removed meanwhile).
+    """
+    if not re.fullmatch(r'part-\d+-\d+\.parquet', os.path.basename(part)):
+        return []
+    try:
+        metadata = pq.read_schema(part).metadata or {}
+    except FileNotFoundError:
+        return []
+    return json.loads(metadata.get(REPLACES_KEY, b'[]'))
+
+
+def live_parts(path):
+    """
+    Parts that make up a bronze table: every part not replaced by a compacted file.
+    """
+    parts = list_parts(path)
+    replaced = {name for part in parts for name in _replaced_by(part)}
+    return [part for part in parts if os.path.basename(part) not in replaced]
+
+
+def _next_part_number(path):
+    numbers = [int(n) for part in list_parts(path) for n in re.findall(r'\d+', os.path.basename(part))]
+    return max(numbers) + 1 if numbers else 0
+
+
+def append(dataframe, path, schema='bronze', table=None):
+    """
+    Merge rows into an existing bronze output, e.g. items fetched by a retry pass.
+
+    A directory of parts gets one more part. A single file is rewritten with
+    the new rows appended, through a temporary file and an atomic replace, so
+    a reader never sees a half-written table.
+
+    Args:
+        dataframe (pd.DataFrame): Rows to add.
+        path (str): Output of the table, e.g. <bronze dir>/wind_information.parquet.
+        schema (str, optional): Schema used to look up the declaration. Defaults to 'bronze'.
+        table (str, optional): Declared table name, for the parts' schema.
+
+    Returns:
+        str: Path of the file written.
+    """
+    if os.path.isdir(path):
+        return append_part(dataframe, path, schema, table)
+
+    if os.path.exists(path):
+        dataframe = pd.concat([pd.read_parquet(path), dataframe], ignore_index=True)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.tmp')
+    dataframe.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def append_part(dataframe, path, schema='bronze', table=None):
+    """
+    Add rows to a bronze output as one more part, without rewriting what is already there.
+
+    A missing output starts as a directory of parts. A single-file output (from
+    a batch run earlier the same day) is first turned into the directory's
+    part 0, with the declared schema, so later appends only write new parts.
+
+    Returns:
+        str: Path of the part written.
+    """
+    if os.path.isfile(path):
+        parts_dir = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.parts')
+        reset(parts_dir)
+        write_part(pd.read_parquet(path), parts_dir, 0, schema, table)
+        os.remove(path)
+        os.replace(parts_dir, path)
+    return write_part(dataframe, path, _next_part_number(path), schema, table)
+
+
+def read(path, columns=None):
+    """
+    Read a bronze table written either as one file or as micro-batch parts.
+
+    Parts replaced by a compacted file are skipped, so a read during or right
+    after a compaction sees each row once.
+    """
+    if not os.path.isdir(path):
+        return pd.read_parquet(path, columns=columns)
+    parts = live_parts(path)
+    if not parts:
+        raise FileNotFoundError(f'No parts in {path}')
+    return pq.ParquetDataset(parts).read(columns=columns, use_pandas_metadata=True).to_pandas()
+
+
+def _remove_replaced(path, grace_seconds):
+    """
+    Delete the parts replaced by compacted files older than grace_seconds.
+    """
+    removed = 0
+    for part in list_parts(path):
+        replaced = _replaced_by(part)
+        try:
+            if not replaced or time.time() - os.path.getmtime(part) < grace_seconds:
+                continue
+        except FileNotFoundError:
+            continue
+        for name in replaced:
+            try:
+                os.remove(os.path.join(path, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def compact(path, schema='bronze', table=None, sort_by=('id_city', 'dt'), row_group_size=128 * 1024,
+            min_parts=2, grace_seconds=60):
+    """
+    Merge the parts of a bronze table into one file with large row groups, sorted by city and time.
+
+    The compacted file is written beside the parts as part-<first>-<last>.parquet
+    and renamed into place atomically; its Parquet metadata lists the parts
+    it replaces, so read() skips them from that moment on. The replaced parts
+    are deleted only grace_seconds later (on the next compaction, or right
+    away with grace_seconds=0), so a reader that listed them just before the
+    swap can still open them. Parts written during the compaction are not
+    touched.
+
+    Args:
+        path (str): Directory of parts, e.g. <bronze dir>/wind_information.parquet.
+        schema (str, optional): Schema used to look up the declaration. Defaults to 'bronze'.
+        table (str, optional): Declared table name; parts are cast to its schema.
+        sort_by (tuple, optional): Sort columns, when present in the table.
+        row_group_size (int, optional): Rows per row group of the compacted file.
+        min_parts (int, optional): Compact only from this many live parts.
+        grace_seconds (float, optional): Age of a compacted file before its replaced parts are deleted.
+
+    Returns:
+        dict: Files, rows, bytes and full-read seconds before and after, or None if there was nothing to compact.
+    """
+    if not os.path.isdir(path):
+        return None
+    removed = _remove_replaced(path, grace_seconds)
+    parts = live_parts(path)
+    if len(parts) < min_parts:
+        return None
+    bytes_before = sum(os.path.getsize(part) for part in parts)
+
+    # Leitura de todas as partes, como faria um leitor: o tempo é a referência de antes
+    started = time.perf_counter()
+    tables = [pq.read_table(part) for part in parts]
+    read_before = time.perf_counter() - started
+
+    target = arrow_schema(schema, table) if table else None
+    if target is not None:
+        tables = [t.select(target.names).cast(target) for t in tables]
+    arrow_table = pa.concat_tables(tables)
+    sort_keys = [(column, 'ascending') for column in sort_by if column in arrow_table.column_names]
+    if sort_keys:
+        arrow_table = arrow_table.sort_by(sort_keys)
+
+    # O arquivo compactado também substitui o que os compactados de entrada substituíam
+    names = [os.path.basename(part) for part in parts]
+    replaces = sorted(set(names).union(*(_replaced_by(part) for part in parts)))
+    numbers = [int(n) for name in names for n in re.findall(r'\d+', name)]
+    name = f'part-{min(numbers):05d}-{max(numbers):05d}.parquet'
+    metadata = {**(tables[0].schema.metadata or {}), REPLACES_KEY: json.dumps(replaces).encode('utf-8')}
+    arrow_table = arrow_table.replace_schema_metadata(metadata)
+
+    compacted = os.path.join(path, name)
+    tmp_path = os.path.join(path, f'.{name}.tmp')
+    pq.write_table(arrow_table, tmp_path, row_group_size=row_group_size)
+    os.replace(tmp_path, compacted)
+    if grace_seconds <= 0:
+        removed += _remove_replaced(path, 0)
+
+    started = time.perf_counter()
+    pq.read_table(compacted)
+    read_after = time.perf_counter() - started
+    return {
+        'arquivos_antes': len(parts),
+        'arquivos_depois': 1,
+        'linhas': arrow_table.num_rows,
+        'grupos_de_linhas': pq.ParquetFile(compacted).num_row_groups,
+        'bytes_antes': bytes_before,
+        'bytes_depois': os.path.getsize(compacted),
+        'leitura_antes_s': round(read_before, 4),
+        'leitura_depois_s': round(read_after, 4),
+        'partes_removidas': removed,
+    }
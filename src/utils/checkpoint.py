@@ -0,0 +1,124 @@
+import os
+import json
+import shutil
+import threading
+
+from utils.storage_paths import storage_root
+
+
+class Checkpoint:
+    """
+    Durable progress of one stage for one reference date, so an interrupted run can resume.
+
+    Lives in <storage root>/checkpoints/<date>/<stage>/ and holds:
+        state.json       small state (selected city ids, bronze files written),
+                         replaced atomically on every save.
+        responses.jsonl  API responses already fetched, one JSON line per key,
+                         flushed after every write. A line cut short by a crash
+                         is ignored on load.
+
+    A stage clears its checkpoint once its output is committed, so the next
+    run for the same date starts fresh.
+
+    With a run_id, the checkpoint belongs to that run only: one left by any
+    other run (or by a run without an id) is discarded on load instead of
+    resumed. The daemon gives every cycle its own id, so a cycle that failed
+    does not hand its city sample and responses to the next one.
+    """
+    def __init__(self, stage, data_referencia, root=None, run_id=None):
+        self.stage = stage
+        self.run_id = run_id
+        self.directory = os.path.join(storage_root(root), 'checkpoints', str(data_referencia), stage)
+        self.state_path = os.path.join(self.directory, 'state.json')
+        self.responses_path = os.path.join(self.directory, 'responses.jsonl')
+        self._lock = threading.Lock()
+        self._spool = None
+        self.state = self._load_state()
+        if run_id is not None and self.resumed and self.state.get('run_id') != run_id:
+            print(f"[checkpoint][{stage}] checkpoint de outra execução ({self.state.get('run_id')}) descartado")
+            self.clear()
+        if run_id is not None:
+            self.state['run_id'] = run_id
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @property
+    def resumed(self):
+        return any(key != 'run_id' for key in self.state) or os.path.exists(self.responses_path)
+
+    def save_state(self, **values):
+        """
+        Merge values into the state and write it atomically.
+        """
+        with self._lock:
+            self.state.update(values)
+            self._write_state()
+
+    def _write_state(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def responses(self):
+        """
+        Load the responses saved by previous attempts.
+
+        Returns:
+            dict: Key -> response data.
+        """
+        saved = {}
+        try:
+            with open(self.responses_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Linha incompleta, gravada quando o processo foi interrompido
+                    saved[entry['key']] = entry['data']
+        except OSError:
+            pass
+        return saved
+
+    def save_response(self, key, data):
+        """
+        Append one response to the spool. Safe to call from worker threads.
+        """
+        line = json.dumps({'key': key, 'data': data}, default=str) + '\n'
+        with self._lock:
+            if self._spool is None:
+                if self.run_id is not None and not os.path.exists(self.state_path):
+                    self._write_state()  # Registra a execução dona das respostas antes da primeira linha
+                os.makedirs(self.directory, exist_ok=True)
+                self._spool = open(self.responses_path, 'a', encoding='utf-8')
+            self._spool.write(line)
+            self._spool.flush()
+
+    def close(self):
+        with self._lock:
+            if self._spool is not None:
+                self._spool.flush()
+                os.fsync(self._spool.fileno())
+                self._spool.close()
+                self._spool = None
+
+    def clear(self):
+        """
+        Remove the checkpoint after the stage output was committed.
+        """
+        self.close()
+        with self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.state = {'run_id': self.run_id} if self.run_id is not None else {}
+            try:
+                os.rmdir(os.path.dirname(self.directory))  # Remove a pasta da data quando não resta outra etapa
+            except OSError:
+                pass
@@ -0,0 +1,411 @@
+import os
+import math
+import heapq
+import threading
+
+import numpy as np
+
+# Raio médio da Terra, em km
+EARTH_RADIUS_KM = 6371.0088
+
+# Versão do formato do arquivo .npz; arquivos de outra versão são reconstruídos
+FORMAT_VERSION = 1
+
+# Consultas em massa são processadas em blocos, para limitar a memória dos candidatos
+QUERY_CHUNK = 16384
+
+# Índices carregados no processo, um por arquivo
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def to_unit_vectors(lat, lon):
+    """
+    3D unit vectors of (lat, lon) points in degrees, shape (..., 3).
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord2_to_km(chord2):
+    """
+    Great-circle distance in km of a squared chord between unit vectors.
+    """
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.sqrt(chord2) / 2, 1.0))
+
+
+def km_to_chord2(km):
+    """
+    Squared chord between unit vectors of a great-circle distance in km.
+    """
+    angle = np.minimum(np.asarray(km, dtype=np.float64) / EARTH_RADIUS_KM, math.pi)
+    return (2 * np.sin(angle / 2)) ** 2
+
+
+class CityIndex:
+    """
+    Nearest-city lookup over a city list: a KD-tree of the cities' unit-sphere vectors.
+
+    Cities are mapped to 3D unit vectors, where the straight-line (chord)
+    distance orders points exactly as the great-circle distance does, with no
+    special case at the poles or the antimeridian. The tree is balanced and
+    implicit: nodes are numbered in heap order, each covers a contiguous range
+    of the cities (stored in tree order) and keeps its bounding box, and the
+    leaves hold at most leaf_size cities.
+
+    Queries are vectorized over the points: all queries descend the tree
+    together as (query, node) pairs, a node is dropped for a query once its
+    box is farther than the query's search radius, and the surviving leaves
+    are scanned in one batch. For nearest-k, the radius starts as the k-th
+    distance within the query's own subtree, so most queries visit one to a
+    few leaves. A single point is answered by a best-first search in plain
+    Python instead, which avoids the per-call overhead of the array
+    operations. Distances are returned in km.
+
+    Usage:
+        index = CityIndex(ids, lat, lon, names)
+        ids, km = index.nearest(-23.55, -46.63, k=3)
+        ids, km = index.nearest(lats, lons)  # arrays of millions of points, shape (n, 1)
+        index.save(path); index = CityIndex.load(path)
+    """
+    def __init__(self, ids, lat, lon, names=None, leaf_size=16, source=''):
+        """
+        Args:
+            ids (array-like): City ids, e.g. the OpenWeather ids.
+            lat (array-like): Latitudes in degrees.
+            lon (array-like): Longitudes in degrees.
+            names (array-like, optional): City names.
+            leaf_size (int, optional): Maximum cities per leaf.
+            source (str, optional): Identifies what the index was built from, checked by get_index().
+
+        Raises:
+            ValueError: Empty city list, or arrays of different lengths.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        names = np.asarray(names if names is not None else [''] * len(ids), dtype=str)
+        if not len(ids):
+            raise ValueError('Cannot index an empty city list')
+        if not len(ids) == len(lat) == len(lon) == len(names):
+            raise ValueError('ids, lat, lon and names must have the same length')
+
+        points = to_unit_vectors(lat, lon)
+        n = len(points)
+        depth = max(0, math.ceil(math.log2(n / leaf_size))) if n > leaf_size else 0
+        internal = 2 ** depth - 1
+        start = np.zeros(2 * internal + 1, dtype=np.int64)
+        end = np.zeros(2 * internal + 1, dtype=np.int64)
+        end[0] = n
+        split_dim = np.zeros(internal, dtype=np.int8)
+        split_value = np.zeros(internal, dtype=np.float64)
+        order = np.arange(n)
+
+        # Os pais vêm antes dos filhos na ordem de heap: cada nó divide sua faixa ao meio na maior dimensão
+        for node in range(internal):
+            s, e = start[node], end[node]
+            mid = (s + e) // 2
+            pts = points[order[s:e]]
+            dim = int(np.argmax(pts.max(axis=0) - pts.min(axis=0)))
+            order[s:e] = order[s:e][np.argpartition(pts[:, dim], mid - s)]
+            split_dim[node] = dim
+            split_value[node] = points[order[mid], dim]
+            start[2 * node + 1], end[2 * node + 1] = s, mid
+            start[2 * node + 2], end[2 * node + 2] = mid, e
+
+        self.ids, self.lat, self.lon, self.names = ids[order], lat[order], lon[order], names[order]
+        self.points = points[order]
+        self.depth, self.leaf_size, self.source = depth, leaf_size, source
+        self.start, self.end = start, end
+        self.split_dim, self.split_value = split_dim, split_value
+
+        # Caixas das folhas, depois de cada nível a partir dos filhos
+        lo = np.empty((len(start), 3))
+        hi = np.empty((len(start), 3))
+        lo[internal:] = np.minimum.reduceat(self.points, start[internal:], axis=0)
+        hi[internal:] = np.maximum.reduceat(self.points, start[internal:], axis=0)
+        for level in range(depth - 1, -1, -1):
+            parents = np.arange(2 ** level - 1, 2 ** (level + 1) - 1)
+            lo[parents] = np.minimum(lo[2 * parents + 1], lo[2 * parents + 2])
+            hi[parents] = np.maximum(hi[2 * parents + 1], hi[2 * parents + 2])
+        self.lo, self.hi = lo, hi
+        self._positions = None
+        self._lists = None
+
+    @classmethod
+    def from_cities(cls, cities, **kwargs):
+        """
+        Build the index from a city list DataFrame in the OpenWeather format (id, name, coord.lat, coord.lon).
+        """
+        return cls(cities['id'], cities['coord'].str['lat'], cities['coord'].str['lon'], cities['name'], **kwargs)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _descend(self, q, depth):
+        """
+        Node at the given depth whose range holds each query's own subtree.
+        """
+        node = np.zeros(len(q), dtype=np.int64)
+        rows = np.arange(len(q))
+        for _ in range(depth):
+            right = q[rows, self.split_dim[node]] >= self.split_value[node]
+            node = 2 * node + 1 + right
+        return node
+
+    def _gather(self, q, qi, node):
+        """
+        Squared chords from queries qi to every city of their nodes, padded with inf.
+        """
+        starts, ends = self.start[node], self.end[node]
+        width = int((ends - starts).max()) if len(node) else 0
+        positions = starts[:, None] + np.arange(width)
+        valid = positions < ends[:, None]
+        positions = np.minimum(positions, len(self) - 1)
+        d2 = ((self.points[positions] - q[qi][:, None, :]) ** 2).sum(axis=-1)
+        d2[~valid] = np.inf
+        return d2, positions
+
+    def _traverse(self, q, r2):
+        """
+        (query, leaf node) pairs whose leaf box is within each query's squared radius.
+        """
+        qi = np.arange(len(q))
+        node = np.zeros(len(q), dtype=np.int64)
+        for _ in range(self.depth):
+            qi = np.repeat(qi, 2)
+            node = (2 * node[:, None] + np.array([1, 2])).ravel()
+            x = q[qi]
+            gap = np.maximum(self.lo[node] - x, 0) + np.maximum(x - self.hi[node], 0)
+            keep = (gap ** 2).sum(axis=1) <= r2[qi]
+            qi, node = qi[keep], node[keep]
+        return qi, node
+
+    def _nearest(self, q, k):
+        """
+        Positions and squared chords of the k nearest cities of each query, closest first.
+        """
+        # Raio inicial: k-ésima distância na subárvore da consulta mais profunda com ao menos k cidades
+        bound_depth = max(d for d in range(self.depth + 1) if len(self) >> d >= k)
+        d2, _ = self._gather(q, np.arange(len(q)), self._descend(q, bound_depth))
+        r2 = np.partition(d2, k - 1, axis=1)[:, k - 1]
+
+        qi, node = self._traverse(q, r2)
+        d2, positions = self._gather(q, qi, node)
+        if d2.shape[1] > k:
+            best = np.argpartition(d2, k - 1, axis=1)[:, :k]
+            d2, positions = np.take_along_axis(d2, best, 1), np.take_along_axis(positions, best, 1)
+
+        # Candidatos de todas as folhas de cada consulta lado a lado, uma linha por consulta
+        width = d2.shape[1]
+        order = np.argsort(qi, kind='stable')
+        qi, d2, positions = qi[order], d2[order], positions[order]
+        counts = np.bincount(qi, minlength=len(q))
+        rank = np.arange(len(qi)) - (np.cumsum(counts) - counts)[qi]
+        columns = rank[:, None] * width + np.arange(width)
+        all_d2 = np.full((len(q), counts.max() * width), np.inf)
+        all_positions = np.zeros(all_d2.shape, dtype=np.int64)
+        all_d2[qi[:, None], columns] = d2
+        all_positions[qi[:, None], columns] = positions
+
+        if all_d2.shape[1] > k:
+            best = np.argpartition(all_d2, k - 1, axis=1)[:, :k]
+            all_d2, all_positions = np.take_along_axis(all_d2, best, 1), np.take_along_axis(all_positions, best, 1)
+        closest = np.argsort(all_d2, axis=1)
+        return np.take_along_axis(all_positions, closest, 1), np.take_along_axis(all_d2, closest, 1)
+
+    @staticmethod
+    def _unit_vector(lat, lon):
+        lat, lon = math.radians(lat), math.radians(lon)
+        return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+    def _result_one(self, found):
+        """
+        (ids, distances in km) of a _search_one() result.
+        """
+        ids = np.array([int(self.ids[position]) for _, position in found], dtype=np.int64)
+        km = [2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(d2) / 2, 1.0)) for d2, _ in found]
+        return ids, np.array(km)
+
+    def _search_one(self, x, k=None, r2=math.inf):
+        """
+        Best-first search for one unit vector: the k nearest cities, or all within r2 when k is None.
+
+        Returns:
+            list: (squared chord, position) pairs, closest first.
+        """
+        if self._lists is None:
+            self._lists = (self.points.tolist(), self.lo.tolist(), self.hi.tolist(),
+                           self.start.tolist(), self.end.tolist())
+        points, lo, hi, start, end = self._lists
+        x0, x1, x2 = x
+        internal = 2 ** self.depth - 1
+        best = []  # Heap de (-distância, posição): o topo é o pior dos melhores
+        bound = r2
+        pending = [(0.0, 0)]
+        while pending:
+            gap, node = heapq.heappop(pending)
+            if gap > bound:
+                break  # Os nós seguintes estão ainda mais longe
+            if node >= internal:
+                for position in range(start[node], end[node]):
+                    p0, p1, p2 = points[position]
+                    d2 = (p0 - x0) ** 2 + (p1 - x1) ** 2 + (p2 - x2) ** 2
+                    if d2 > bound:
+                        continue
+                    if k is None or len(best) < k:
+                        heapq.heappush(best, (-d2, position))
+                        if k is not None and len(best) == k:
+                            bound = -best[0][0]
+                    elif d2 < bound:
+                        heapq.heapreplace(best, (-d2, position))
+                        bound = -best[0][0]
+                continue
+            for child in (2 * node + 1, 2 * node + 2):
+                (l0, l1, l2), (h0, h1, h2) = lo[child], hi[child]
+                gap = ((l0 - x0 if x0 < l0 else x0 - h0 if x0 > h0 else 0.0) ** 2
+                       + (l1 - x1 if x1 < l1 else x1 - h1 if x1 > h1 else 0.0) ** 2
+                       + (l2 - x2 if x2 < l2 else x2 - h2 if x2 > h2 else 0.0) ** 2)
+                if gap <= bound:
+                    heapq.heappush(pending, (gap, child))
+        return sorted((-d2, position) for d2, position in best)
+
+    def nearest(self, lat, lon, k=1):
+        """
+        The k nearest cities of one point or of arrays of points.
+
+        Args:
+            lat (float or array-like): Latitude(s) in degrees.
+            lon (float or array-like): Longitude(s) in degrees.
+            k (int, optional): Cities per point. Capped at the number of cities.
+
+        Returns:
+            tuple: (ids, distances in km), closest first; shape (k,) for one point, (n, k) for arrays.
+        """
+        k = min(int(k), len(self))
+        if k < 1:
+            raise ValueError('k must be at least 1')
+        if np.ndim(lat) == 0 and np.ndim(lon) == 0:
+            return self._result_one(self._search_one(self._unit_vector(lat, lon), k))
+        q = to_unit_vectors(lat, lon).reshape(-1, 3)
+        ids = np.empty((len(q), k), dtype=np.int64)
+        km = np.empty((len(q), k))
+        for s in range(0, len(q), QUERY_CHUNK):
+            positions, d2 = self._nearest(q[s:s + QUERY_CHUNK], k)
+            ids[s:s + QUERY_CHUNK], km[s:s + QUERY_CHUNK] = self.ids[positions], chord2_to_km(d2)
+        return ids, km
+
+    def within(self, lat, lon, radius_km):
+        """
+        Cities within a great-circle radius of one point or of arrays of points.
+
+        Args:
+            lat (float or array-like): Latitude(s) in degrees.
+            lon (float or array-like): Longitude(s) in degrees.
+            radius_km (float or array-like): Radius, one for all points or one per point.
+
+        Returns:
+            tuple: For one point, (ids, distances in km), closest first. For arrays,
+                (query index, ids, distances in km), ordered by query and then distance.
+        """
+        if np.ndim(lat) == 0 and np.ndim(lon) == 0 and np.ndim(radius_km) == 0:
+            r2 = (2 * math.sin(min(radius_km / EARTH_RADIUS_KM, math.pi) / 2)) ** 2
+            return self._result_one(self._search_one(self._unit_vector(lat, lon), r2=r2))
+        q = to_unit_vectors(lat, lon).reshape(-1, 3)
+        r2 = np.broadcast_to(km_to_chord2(radius_km), (len(q),))
+        found = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0))]
+        for s in range(0, len(q), QUERY_CHUNK):
+            chunk = q[s:s + QUERY_CHUNK]
+            qi, node = self._traverse(chunk, r2[s:s + QUERY_CHUNK])
+            d2, positions = self._gather(chunk, qi, node)
+            rows, cols = np.nonzero(d2 <= r2[s:s + QUERY_CHUNK][qi][:, None])
+            found.append((qi[rows] + s, positions[rows, cols], d2[rows, cols]))
+        qi, positions, d2 = (np.concatenate(parts) for parts in zip(*found))
+        order = np.lexsort((d2, qi))
+        qi, ids, km = qi[order], self.ids[positions[order]], chord2_to_km(d2[order])
+        return qi, ids, km
+
+    def describe(self, ids):
+        """
+        Name and coordinates of indexed cities.
+
+        Returns:
+            list: One dict (id, name, lat, lon) per id, or None for an id not in the index.
+        """
+        if self._positions is None:
+            self._positions = {int(city_id): i for i, city_id in enumerate(self.ids)}
+        result = []
+        for city_id in np.ravel(ids):
+            i = self._positions.get(int(city_id))
+            result.append(None if i is None else {'id': int(self.ids[i]), 'name': str(self.names[i]),
+                                                  'lat': float(self.lat[i]), 'lon': float(self.lon[i])})
+        return result
+
+    def save(self, path):
+        """
+        Write the index to a .npz file, through a temporary file and an atomic replace.
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, version=FORMAT_VERSION, source=self.source, depth=self.depth, leaf_size=self.leaf_size,
+                     ids=self.ids, lat=self.lat, lon=self.lon, names=self.names, points=self.points,
+                     start=self.start, end=self.end, split_dim=self.split_dim, split_value=self.split_value,
+                     lo=self.lo, hi=self.hi)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read an index written by save(), without rebuilding the tree.
+
+        Raises:
+            ValueError: The file was written by another format version.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != FORMAT_VERSION:
+                raise ValueError(f"{path} has format version {int(data['version'])}, expected {FORMAT_VERSION}")
+            index = cls.__new__(cls)
+            for name in ('ids', 'lat', 'lon', 'names', 'points', 'start', 'end', 'split_dim', 'split_value', 'lo', 'hi'):
+                setattr(index, name, data[name])
+            index.depth, index.leaf_size = int(data['depth']), int(data['leaf_size'])
+            index.source = str(data['source'])
+        index._positions = None
+        index._lists = None
+        return index
+
+
+def get_index(path, source, build):
+    """
+    The process-wide CityIndex stored at path, for the given source.
+
+    The index is loaded from path when the file was built from the same
+    source (e.g. the city list path and modification time), and otherwise
+    built with build() and saved there.
+
+    Args:
+        path (str): .npz file of the index.
+        source (str): Identifies the data the index must reflect.
+        build (callable): Returns a new CityIndex when the stored one is missing or stale.
+
+    Returns:
+        CityIndex: The index.
+    """
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is not None and index.source == source:
+            return index
+        index = None
+        if os.path.exists(path):
+            try:
+                index = CityIndex.load(path)
+            except (OSError, ValueError, KeyError):
+                index = None  # Arquivo corrompido ou de outra versão: reconstruído abaixo
+        if index is None or index.source != source:
+            index = build()
+            index.source = source
+            index.save(path)
+        _indexes[path] = index
+        return index
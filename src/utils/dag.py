@@ -0,0 +1,143 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Stage:
+    """
+    A unit of work in the pipeline graph.
+
+    Attributes:
+        name (str): Unique stage name.
+        func (callable): Called without arguments. Raising or returning False marks the stage as failed.
+        inputs (tuple): Names of the stages this one depends on.
+    """
+    def __init__(self, name, func, inputs=()):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.status = 'pending'  # pending, running, ok, failed, skipped
+        self.error = None
+        self.start = None
+        self.end = None
+
+    @property
+    def duration(self):
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+
+class DagExecutor:
+    """
+    Run pipeline stages in dependency order, independent stages concurrently.
+
+    A stage starts as soon as all of its inputs succeeded. When a stage fails,
+    every stage downstream of it is skipped instead of running on stale data.
+    """
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self.stages = {}
+
+    def add(self, name, func, inputs=()):
+        """
+        Declare a stage.
+
+        Args:
+            name (str): Unique stage name.
+            func (callable): The work to run.
+            inputs (iterable, optional): Names of the stages it depends on.
+
+        Returns:
+            Stage: The declared stage.
+        """
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' declared twice")
+        stage = self.stages[name] = Stage(name, func, inputs)
+        return stage
+
+    def _validate(self):
+        for stage in self.stages.values():
+            for dep in stage.inputs:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+
+        # Kahn's algorithm: any stage left unvisited is part of a cycle
+        pending = {name: len(stage.inputs) for name, stage in self.stages.items()}
+        ready = [name for name, count in pending.items() if count == 0]
+        visited = 0
+        while ready:
+            name = ready.pop()
+            visited += 1
+            for other in self.stages.values():
+                if name in other.inputs:
+                    pending[other.name] -= 1
+                    if pending[other.name] == 0:
+                        ready.append(other.name)
+        if visited != len(self.stages):
+            raise ValueError("The stage graph has a cycle")
+
+    def _run_stage(self, stage):
+        stage.start = time.perf_counter()
+        try:
+            result = stage.func()
+            stage.status = 'failed' if result is False else 'ok'
+        except Exception as e:
+            stage.status = 'failed'
+            stage.error = e
+        stage.end = time.perf_counter()
+        return stage
+
+    def run(self):
+        """
+        Execute every stage.
+
+        Returns:
+            dict: Stage name -> Stage, with status, error and timings filled in.
+        """
+        self._validate()
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                for stage in self.stages.values():
+                    if stage.status != 'pending':
+                        continue
+                    deps = [self.stages[dep].status for dep in stage.inputs]
+                    if any(status in ('failed', 'skipped') for status in deps):
+                        stage.status = 'skipped'
+                    elif all(status == 'ok' for status in deps):
+                        stage.status = 'running'
+                        running[executor.submit(self._run_stage, stage)] = stage
+
+                # Skipping can unblock nothing new but may cascade; loop until stable
+                if any(stage.status == 'pending' and any(
+                        self.stages[dep].status in ('failed', 'skipped') for dep in stage.inputs)
+                       for stage in self.stages.values()):
+                    continue
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running.pop(future)
+
+        return self.stages
+
+    def critical_path(self):
+        """
+        Return the chain of executed stages with the longest cumulative duration.
+
+        Returns:
+            tuple: (list of stage names, total seconds).
+        """
+        best = {}
+
+        def longest(name):
+            if name not in best:
+                stage = self.stages[name]
+                chains = [longest(dep) for dep in stage.inputs]
+                path, total = max(chains, key=lambda chain: chain[1], default=([], 0.0))
+                best[name] = (path + [name], total + stage.duration)
+            return best[name]
+
+        return max((longest(name) for name in self.stages), key=lambda chain: chain[1], default=([], 0.0))
@@ -1,49 +1,204 @@
 import os
-import pyodbc
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import Column, MetaData, Table, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
 from dotenv import find_dotenv, load_dotenv
+from utils.storage_backends import StorageBackend, get_backend
+from utils.table_schemas import get_table
+from utils.metrics import metrics
+from utils.profiling import profiled
+
+# Engines compartilhados pelo processo, indexados pela URL do backend.
+# Cada engine mantém seu próprio pool e só é criado no primeiro uso.
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(backend, pool_size=5, max_overflow=10, pool_recycle=1800, pool_pre_ping=True):
+    """
+    Return the process-wide backend and engine for a database, creating them on first use.
+
+    The first backend instance registered for a URL is the one kept, since it
+    may hold state bound to the engine's connection events.
+
+    Args:
+        backend (StorageBackend): The storage backend.
+        pool_size (int): Number of connections kept open in the pool.
+        max_overflow (int): Extra connections allowed above pool_size under load.
+        pool_recycle (int): Seconds after which a pooled connection is recycled.
+        pool_pre_ping (bool): Test connections with a ping before handing them out.
+
+    Returns:
+        tuple: The shared (StorageBackend, sqlalchemy.engine.Engine) pair.
+    """
+    with _engines_lock:
+        shared = _engines.get(backend.url)
+        if shared is None:
+            engine = backend.create_engine(
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_recycle=pool_recycle,
+                pool_pre_ping=pool_pre_ping,
+            )
+            shared = _engines[backend.url] = (backend, engine)
+        return shared
+
+
+def dispose_engines():
+    """
+    Close every pooled connection and forget the shared engines.
+    """
+    with _engines_lock:
+        for _, engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+class MetadataCache:
+    """
+    Per-process cache of known schemas, tables and column types.
+
+    Entries are filled from the database catalog on first use and keyed by the
+    engine URL, so every DatabaseOps sharing an engine shares the cache too.
+    Callers must invalidate the affected entries after running DDL.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._schemas = {}  # url -> set of schema names
+        self._tables = {}  # (url, schema, table) -> {column: type} or None if missing
+
+    def has_schema(self, engine, schema):
+        """
+        Check whether a schema exists, querying the catalog only once per engine.
+        """
+        key = str(engine.url)
+        with self._lock:
+            schemas = self._schemas.get(key)
+        if schemas is None:
+            with engine.connect() as conn:
+                schemas = set(inspect(conn).get_schema_names())
+            with self._lock:
+                self._schemas[key] = schemas
+        return schema in schemas
+
+    def add_schema(self, engine, schema):
+        with self._lock:
+            self._schemas.setdefault(str(engine.url), set()).add(schema)
+
+    def columns(self, engine, schema, table):
+        """
+        Return the column types of a table, or None if the table does not exist.
+        """
+        key = (str(engine.url), schema, table)
+        with self._lock:
+            if key in self._tables:
+                return self._tables[key]
+        with engine.connect() as conn:
+            inspector = inspect(conn)
+            if inspector.has_table(table, schema=schema):
+                columns = {col['name']: col['type'] for col in inspector.get_columns(table, schema=schema)}
+            else:
+                columns = None
+        with self._lock:
+            self._tables[key] = columns
+        return columns
+
+    def invalidate(self, engine=None, schema=None, table=None):
+        """
+        Forget cached entries. Without arguments the whole cache is cleared.
+        """
+        with self._lock:
+            if engine is None:
+                self._schemas.clear()
+                self._tables.clear()
+                return
+            url = str(engine.url)
+            if schema is None:
+                self._schemas.pop(url, None)
+            for key in list(self._tables):
+                if key[0] == url and schema in (None, key[1]) and table in (None, key[2]):
+                    del self._tables[key]
+
+
+metadata_cache = MetadataCache()
+
+
 class DatabaseOps:
-    def __init__(self, database='zebrinha_azul'):
+    def __init__(self, database='zebrinha_azul', backend=None, pool_size=None, max_overflow=None,
+                 pool_recycle=None, pool_pre_ping=None, batch_size=None):
 
         load_dotenv(find_dotenv())
         """
         Initialize the DatabaseOps class.
 
+        No connection is opened here: the shared pool is created on the first
+        insert or query. The backend falls back to the STORAGE_BACKEND variable
+        and the pool settings to DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE
+        and DB_POOL_PRE_PING, and the insert batch size to DB_BATCH_SIZE.
+
         Args:
-            server (str): The server name.
             database (str): The database name.
-            username (str): The username for authentication.
-            password (str): The password for authentication.
+            backend (str or StorageBackend, optional): 'mssql', 'sqlite' or a backend instance.
+            pool_size (int, optional): Number of connections kept open in the pool.
+            max_overflow (int, optional): Extra connections allowed above pool_size.
+            pool_recycle (int, optional): Seconds after which a connection is recycled.
+            pool_pre_ping (bool, optional): Ping connections before using them.
+            batch_size (int, optional): Rows sent per INSERT round trip.
         """
-        self.server = os.getenv('SERVER')
         self.database = database
+        self._backend = backend if isinstance(backend, StorageBackend) else get_backend(backend, database=database)
+        self.pool_size = pool_size if pool_size is not None else int(os.getenv('DB_POOL_SIZE', 5))
+        self.max_overflow = max_overflow if max_overflow is not None else int(os.getenv('DB_MAX_OVERFLOW', 10))
+        self.pool_recycle = pool_recycle if pool_recycle is not None else int(os.getenv('DB_POOL_RECYCLE', 1800))
+        if pool_pre_ping is None:
+            pool_pre_ping = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+        self.pool_pre_ping = pool_pre_ping
+        self.batch_size = batch_size if batch_size is not None else int(os.getenv('DB_BATCH_SIZE', 5000))
+
+    @property
+    def backend(self):
+        """
+        The shared storage backend for this database.
+        """
+        return self._shared()[0]
+
+    @property
+    def engine(self):
+        """
+        The shared engine for this database, created lazily on first access.
+        """
+        return self._shared()[1]
+
+    def _shared(self):
+        return get_engine(
+            self._backend,
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_recycle=self.pool_recycle,
+            pool_pre_ping=self.pool_pre_ping,
+        )
 
     def connect_db(self):
         """
-        Connect to the SQL Server database.
+        Eagerly check out a connection from the pool to validate the settings.
+
+        Calling this is optional: inserts and queries connect on demand.
 
         Returns:
-            pyodbc.Connection: The database connection object.
-            pyodbc.Database: The database object.
+            None
         """
         try:
-            # Define the connection string
-            conn_str = f"\
-                DRIVER={{ODBC Driver 17 for SQL Server}};\
-                SERVER={self.server};\
-                DATABASE={self.database};\
-                Trusted_Connection=yes"
-
-            # Establish the database connection
-            self.conn = pyodbc.connect(conn_str)
-            self.db = self.conn.cursor().connection
-            self.engine =  create_engine(f"mssql+pyodbc:///?odbc_connect={conn_str}")
+            with self.engine.connect():
+                pass
             print(f"Connected to the database {self.database}.")
 
             return None
 
-        except pyodbc.Error as e:
+        except SQLAlchemyError as e:
             print("An error occurred while connecting to the database:", e)
 
 
@@ -56,10 +211,41 @@ class DatabaseOps:
             print(f"An error occurred while executing the query: {e}")
             return None
 
-    
+    def stream_query(self, query, chunksize=None, as_arrow=False):
+        """
+        Execute a query and yield its result in chunks.
+
+        Rows are read through a server-side cursor, so peak memory is bounded by
+        the chunk size instead of the size of the result.
 
+        Args:
+            query (str): The SQL query.
+            chunksize (int, optional): Rows per chunk. Defaults to the DB_FETCH_SIZE
+                environment variable, or 10000.
+            as_arrow (bool, optional): Yield pyarrow.RecordBatch objects instead of DataFrames.
+
+        Yields:
+            pd.DataFrame or pyarrow.RecordBatch: One chunk of the result.
+
+        Raises:
+            SQLAlchemyError: The query failed, possibly after some chunks were yielded, so a
+                partial result is never mistaken for a complete one.
+        """
+        chunksize = chunksize or int(os.getenv('DB_FETCH_SIZE', 10000))
+        if as_arrow:
+            import pyarrow as pa
+
+        try:
+            with self.engine.connect() as conn:
+                conn = conn.execution_options(stream_results=True, max_row_buffer=chunksize)
+                for chunk in pd.read_sql(text(query), conn, chunksize=chunksize):
+                    yield pa.RecordBatch.from_pandas(chunk, preserve_index=False) if as_arrow else chunk
+        except SQLAlchemyError as e:
+            print(f"An error occurred while streaming the query: {e}")
+            raise
 
-    def insert(self, dataframe, schema, table, if_exists='replace'):
+    @profiled
+    def insert(self, dataframe, schema, table, if_exists='replace', keys=None):
         """
         Insert data into the specified table in the database.
 
@@ -68,24 +254,227 @@ class DatabaseOps:
             dataframe (pd.DataFrame): The DataFrame containing the data to be inserted.
             schema (str): The name of the schema.
             if_exists (str, optional): The action to take if the table already exists.
-                Defaults to 'replace'.
+                Defaults to 'replace'. Use 'upsert' to merge rows on the natural keys.
+            keys (list, optional): Natural key columns, required when if_exists='upsert'.
+
+        Raises:
+            SQLAlchemyError: The write failed (after printing it), so callers never mistake it for a load.
         """
+        if if_exists == 'upsert':
+            self.upsert(dataframe, schema, table, keys)
+            return
+
         try:
-            # Check if the schema exists
-            schema_query = f"SELECT COUNT(*) as count FROM information_schema.schemata WHERE schema_name = '{schema}'"
-            schema_exists = self.run_query(schema_query)['count'][0] > 0
-            # print('Schema exists? ', schema_exists)
-            
-            if not schema_exists:
-                # Create the schema if it doesn't exist
-                create_schema_query = f"CREATE SCHEMA {schema}"
-                self.conn.execute(create_schema_query)
-                # print(f"Schema '{schema}' created successfully!")
-
-            # Insert the DataFrame into the SQL Server table with the if_exists option
-            # print('Insert data to DB')
-            dataframe.to_sql(schema=schema, name=table, con=self.engine, if_exists=if_exists, index=False)
-            # print("Data inserted successfully!")
-
-        except pyodbc.Error as e:
-            print("An error occurred while inserting the data:", e)
\ No newline at end of file
+            with metrics.step('db.insert', table=f"{schema}.{table}", mode=if_exists) as m:
+                m.set(rows_in=len(dataframe))
+                self._ensure_schema(schema)
+
+                declared = get_table(schema, table) is not None
+                if if_exists == 'append' or (if_exists == 'replace' and declared):
+                    columns = self._ensure_table(schema, table, dataframe)
+                    if set(dataframe.columns) <= set(columns):
+                        # Insert the rows directly, keeping the declared DDL and
+                        # without pandas re-inspecting the catalog
+                        with self.engine.begin() as conn:
+                            if if_exists == 'replace':
+                                conn.execute(text(f"DELETE FROM {self.backend.qualified(schema, table)}"))
+                            self._append_rows(conn, dataframe, schema, table, columns, self.batch_size)
+                        return
+
+                # Insert the DataFrame into the table with the if_exists option
+                dataframe.to_sql(schema=schema, name=table, con=self.engine, if_exists=if_exists, index=False,
+                                 chunksize=self.batch_size)
+                # to_sql may have created or replaced the table
+                metadata_cache.invalidate(self.engine, schema, table)
+
+        except SQLAlchemyError as e:
+            print("An error occurred while inserting the data:", e)
+            raise
+
+    @profiled
+    def upsert(self, dataframe, schema, table, keys):
+        """
+        Merge data into a table on its natural keys.
+
+        The rows are bulk-loaded into a temporary staging table and applied with a
+        single set-based merge (MERGE on SQL Server): new keys are inserted and
+        existing keys are updated only when some column actually changed. If the
+        table does not exist yet it is created first.
+
+        Args:
+            dataframe (pd.DataFrame): The DataFrame containing the data to be merged.
+            schema (str): The name of the schema.
+            table (str): The name of the table.
+            keys (list): The natural key columns.
+
+        Returns:
+            int: Number of rows inserted or updated.
+
+        Raises:
+            ValueError: No natural keys were given, or the DataFrame has columns the table does not.
+            SQLAlchemyError: The merge failed (after printing it); nothing is applied.
+        """
+        if not keys:
+            raise ValueError(f"upsert into {schema}.{table} requires natural keys")
+
+        try:
+            self._ensure_schema(schema)
+
+            columns = self._ensure_table(schema, table, dataframe)
+            self._check_columns(schema, table, dataframe, columns)
+
+            # Duplicate keys in the source would make the merge fail
+            dataframe = dataframe.drop_duplicates(subset=keys, keep='last')
+            backend = self.backend
+            staging = backend.staging_name(table, uuid.uuid4().hex[:8])
+
+            with self.engine.begin() as conn:
+                backend.create_staging(conn, schema, table, staging, list(dataframe.columns))
+                self._append_rows(conn, dataframe, None, staging, columns, self.batch_size)
+                affected = backend.merge(conn, schema, table, staging, list(dataframe.columns), keys)
+                backend.drop_staging(conn, staging)
+            return affected
+
+        except SQLAlchemyError as e:
+            print("An error occurred while upserting the data:", e)
+            raise
+
+    @profiled
+    def load_stage(self, tables, if_exists='append', keys=None, max_workers=None):
+        """
+        Load every table of a pipeline stage concurrently and commit them atomically.
+
+        Each DataFrame is first bulk-loaded into its own staging table, in
+        parallel, over separate pooled connections. A single transaction then
+        applies all staging tables onto their targets, so either every table of
+        the stage is loaded or none is.
+
+        On SQLite each schema is a separate attached file in WAL mode, where a
+        transaction is atomic within each file but not across files: a crash
+        while committing tables of several schemas can leave some schemas
+        committed. The pipeline loads one schema per call, which stays atomic.
+
+        Args:
+            tables (list): (schema, table, dataframe) tuples.
+            if_exists (str, optional): 'append', 'replace' or 'upsert'. Defaults to 'append'.
+            keys (dict, optional): Natural key columns per table name, required for 'upsert'.
+            max_workers (int, optional): Concurrent staging loads. Defaults to one per table.
+
+        Returns:
+            dict: Seconds spent per table ('staging' and 'apply') and in total.
+
+        Raises:
+            ValueError: 'upsert' into a table with no natural keys, or a DataFrame with columns its table does not have.
+        """
+        keys = keys or {}
+        if if_exists == 'upsert':
+            for schema, table, _ in tables:
+                if not keys.get(table):
+                    raise ValueError(f"upsert into {schema}.{table} requires natural keys")
+        start = time.perf_counter()
+        report = {'tables': {}, 'total': None}
+        backend = self.backend
+        suffix = uuid.uuid4().hex[:8]
+        staged = []
+
+        # Schemas and missing tables are created up front, outside the atomic step
+        for schema, table, dataframe in tables:
+            self._ensure_schema(schema)
+            self._check_columns(schema, table, dataframe, self._ensure_table(schema, table, dataframe))
+
+        def stage(item):
+            schema, table, dataframe = item
+            t0 = time.perf_counter()
+            if if_exists == 'upsert':
+                dataframe = dataframe.drop_duplicates(subset=keys.get(table), keep='last')
+            staging = backend.staging_name(table, suffix, temporary=False)
+            columns = metadata_cache.columns(self.engine, schema, table)
+            with self.engine.begin() as conn:
+                backend.create_staging(conn, schema, table, staging, list(dataframe.columns), staging_schema=schema)
+                self._append_rows(conn, dataframe, schema, staging, columns, self.batch_size)
+            staged.append((schema, staging))
+            report['tables'][f"{schema}.{table}"] = {'rows': len(dataframe), 'staging': time.perf_counter() - t0}
+            return schema, table, staging, list(dataframe.columns)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers or len(tables) or 1) as executor:
+                loaded = list(executor.map(stage, tables))
+
+            with self.engine.begin() as conn:
+                for schema, table, staging, columns in loaded:
+                    t0 = time.perf_counter()
+                    if if_exists == 'upsert':
+                        backend.merge(conn, schema, table, staging, columns, keys.get(table), staging_schema=schema)
+                    else:
+                        if if_exists == 'replace':
+                            conn.execute(text(f"DELETE FROM {backend.qualified(schema, table)}"))
+                        backend.append(conn, schema, table, staging, columns, staging_schema=schema)
+                    report['tables'][f"{schema}.{table}"]['apply'] = time.perf_counter() - t0
+
+        except SQLAlchemyError as e:
+            print("An error occurred while loading the stage:", e)
+            raise
+
+        finally:
+            for schema, staging in staged:
+                try:
+                    with self.engine.begin() as conn:
+                        backend.drop_staging(conn, staging, staging_schema=schema)
+                except SQLAlchemyError as e:
+                    print(f"Could not drop staging table {schema}.{staging}:", e)
+
+        report['total'] = time.perf_counter() - start
+        for name, timing in report['tables'].items():
+            metrics.record('db.load_stage', timing['staging'] + timing.get('apply', 0), labels={'table': name, 'mode': if_exists},
+                           rows_out=timing['rows'], staging_s=round(timing['staging'], 6), apply_s=round(timing.get('apply', 0), 6))
+            print(f"Loaded {name}: {timing['rows']} rows, staging {timing['staging']:.3f}s, apply {timing.get('apply', 0):.3f}s")
+        print(f"Stage loaded in {report['total']:.3f}s")
+        return report
+
+    def _ensure_schema(self, schema):
+        """
+        Create the schema if it doesn't exist (catalog queried once per process).
+        """
+        if not metadata_cache.has_schema(self.engine, schema):
+            with self.engine.begin() as conn:
+                self.backend.create_schema(conn, schema)
+            metadata_cache.add_schema(self.engine, schema)
+
+    def _ensure_table(self, schema, table, dataframe):
+        """
+        Create the table if it doesn't exist and return its column types.
+
+        Tables declared in table_schemas get their explicit DDL and indexes;
+        any other table is created by pandas from the DataFrame.
+        """
+        columns = metadata_cache.columns(self.engine, schema, table)
+        if columns is None:
+            spec = get_table(schema, table)
+            with self.engine.begin() as conn:
+                if spec is not None:
+                    self.backend.create_table(conn, schema, table, spec)
+                else:
+                    dataframe.head(0).to_sql(schema=schema, name=table, con=conn, index=False)
+            metadata_cache.invalidate(self.engine, schema, table)
+            columns = metadata_cache.columns(self.engine, schema, table)
+        return columns
+
+    @staticmethod
+    def _check_columns(schema, table, dataframe, columns):
+        """
+        Raise ValueError if the DataFrame has columns the table does not.
+        """
+        extra = [name for name in dataframe.columns if name not in columns]
+        if extra:
+            raise ValueError(f"{schema}.{table} has no column(s) {', '.join(map(str, extra))}")
+
+    @staticmethod
+    def _append_rows(conn, dataframe, schema, table, columns, batch_size=None):
+        """
+        Append rows to an existing table using the cached column types, batch_size rows per round trip.
+        """
+        target = Table(table, MetaData(), *[Column(name, columns[name]) for name in dataframe.columns], schema=schema)
+        batch_size = batch_size or len(dataframe) or 1
+        for start in range(0, len(dataframe), batch_size):
+            chunk = dataframe.iloc[start:start + batch_size]
+            conn.execute(target.insert(), chunk.astype(object).where(chunk.notna(), None).to_dict('records'))
@@ -0,0 +1,129 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from utils.storage_paths import storage_root
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS failed_items (
+    stage TEXT NOT NULL,
+    ref_date TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    reason TEXT,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    first_failed_at TEXT NOT NULL,
+    last_failed_at TEXT NOT NULL,
+    resolved_at TEXT,
+    PRIMARY KEY (stage, ref_date, item_key)
+)
+"""
+
+# Filas abertas no processo, uma por arquivo
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+class DeadLetterQueue:
+    """
+    Durable record of the items (city ids, city pairs) whose fetch failed.
+
+    Lives in <storage root>/dead_letter/failed_items.db (SQLite, WAL). Each
+    item is keyed by stage, reference date and item key, and keeps what is
+    needed to fetch it again (payload), the last failure reason and how many
+    times it failed. Every write is committed immediately, so failures survive
+    a crash. A later successful fetch marks the item as resolved.
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+    def record(self, stage, ref_date, key, payload, reason):
+        """
+        Add a failed item, or count one more attempt if it is already queued. Safe to call from worker threads.
+
+        Args:
+            stage (str): Stage that failed, e.g. 'bronze_clima'.
+            ref_date (date or str): Reference date of the run.
+            key (str): Item key, e.g. the city id or '<origin id>-<destination id>'.
+            payload (dict): JSON-serializable data needed to fetch the item again.
+            reason (str): Why it failed (HTTP status, exception).
+        """
+        now = self._now()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO failed_items (stage, ref_date, item_key, payload, reason, first_failed_at, last_failed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (stage, ref_date, item_key) DO UPDATE SET
+                    payload = excluded.payload, reason = excluded.reason, attempts = attempts + 1,
+                    last_failed_at = excluded.last_failed_at, resolved_at = NULL
+                """,
+                (stage, str(ref_date), str(key), json.dumps(payload, default=str), reason, now, now))
+            self._conn.commit()
+
+    def pending(self, stage, ref_date, max_attempts=None):
+        """
+        Unresolved items of a stage and date, oldest first.
+
+        Args:
+            max_attempts (int, optional): Leave out items that already failed this many times.
+
+        Returns:
+            list: Dicts with key, payload, reason and attempts.
+        """
+        query = 'SELECT item_key, payload, reason, attempts FROM failed_items WHERE stage = ? AND ref_date = ? AND resolved_at IS NULL'
+        params = [stage, str(ref_date)]
+        if max_attempts:
+            query += ' AND attempts < ?'
+            params.append(max_attempts)
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY first_failed_at, item_key', params).fetchall()
+        return [{'key': key, 'payload': json.loads(payload), 'reason': reason, 'attempts': attempts}
+                for key, payload, reason, attempts in rows]
+
+    def resolve(self, stage, ref_date, keys):
+        """
+        Mark the given items as resolved. Keys that are not queued are ignored.
+
+        Returns:
+            int: Items resolved.
+        """
+        with self._lock:
+            queued = {key for (key,) in self._conn.execute(
+                'SELECT item_key FROM failed_items WHERE stage = ? AND ref_date = ? AND resolved_at IS NULL',
+                (stage, str(ref_date)))}
+            resolved = queued.intersection(str(key) for key in keys)
+            if resolved:
+                now = self._now()
+                self._conn.executemany(
+                    'UPDATE failed_items SET resolved_at = ? WHERE stage = ? AND ref_date = ? AND item_key = ?',
+                    [(now, stage, str(ref_date), key) for key in resolved])
+                self._conn.commit()
+        return len(resolved)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_queue(root=None):
+    """
+    The process-wide DeadLetterQueue under a storage root, opened on first use.
+    """
+    path = os.path.join(storage_root(root), 'dead_letter', 'failed_items.db')
+    with _queues_lock:
+        if path not in _queues:
+            _queues[path] = DeadLetterQueue(path)
+        return _queues[path]
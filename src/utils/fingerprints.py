@@ -0,0 +1,103 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+
+from utils.storage_paths import storage_root
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    scope TEXT NOT NULL,
+    ref_date TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    digest INTEGER NOT NULL,
+    PRIMARY KEY (scope, ref_date, item_key)
+)
+"""
+
+# Estados abertos no processo, um por arquivo
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def fingerprint(record, fields):
+    """
+    64-bit content hash of some fields of a record.
+
+    Args:
+        record (dict): The record, e.g. one API response.
+        fields (iterable): Fields that define the content; missing fields hash as None.
+
+    Returns:
+        int: Signed 64-bit digest, stored as a SQLite INTEGER.
+    """
+    content = json.dumps({field: record.get(field) for field in fields}, sort_keys=True, default=str,
+                         separators=(',', ':'))
+    return int.from_bytes(hashlib.blake2b(content.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+class FingerprintStore:
+    """
+    Last loaded fingerprint of each item (e.g. each city), per scope and reference date.
+
+    Lives in <storage root>/state/fingerprints.db (SQLite, WAL), 8 bytes of
+    digest per item. Only the latest reference date of a scope is kept, so the
+    store stays the size of one run.
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def changed(self, scope, ref_date, digests):
+        """
+        Keys whose digest differs from the stored one, or that were never stored.
+
+        Args:
+            scope (str): Namespace, e.g. 'bronze_clima'.
+            ref_date (date or str): Reference date of the run.
+            digests (dict): Key -> fingerprint of the current run.
+
+        Returns:
+            set: Keys of the changed items.
+        """
+        with self._lock:
+            stored = dict(self._conn.execute(
+                'SELECT item_key, digest FROM fingerprints WHERE scope = ? AND ref_date = ?', (scope, str(ref_date))))
+        return {key for key, digest in digests.items() if stored.get(str(key)) != digest}
+
+    def commit(self, scope, ref_date, digests):
+        """
+        Store the fingerprints of items that were loaded, and drop older reference dates of the scope.
+
+        Call it only after the load succeeded, so a failed load is retried in full.
+        """
+        if not digests:
+            return
+        with self._lock:
+            self._conn.executemany(
+                'INSERT INTO fingerprints (scope, ref_date, item_key, digest) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (scope, ref_date, item_key) DO UPDATE SET digest = excluded.digest',
+                [(scope, str(ref_date), str(key), digest) for key, digest in digests.items()])
+            self._conn.execute('DELETE FROM fingerprints WHERE scope = ? AND ref_date < ?', (scope, str(ref_date)))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_store(root=None):
+    """
+    The process-wide FingerprintStore under a storage root, opened on first use.
+    """
+    path = os.path.join(storage_root(root), 'state', 'fingerprints.db')
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = FingerprintStore(path)
+        return _stores[path]
@@ -0,0 +1,267 @@
+import os
+import time
+import threading
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.rate_limit import QuotaExceeded, get_limiter
+from utils.resilience import CircuitBreaker, LatencyWindow
+
+# Sessão HTTP compartilhada pelo processo: mantém as conexões TLS abertas entre chamadas e ciclos
+_session = None
+_session_lock = threading.Lock()
+
+# Estado por API (circuit breaker, latências, requisições duplicadas) e threads das requisições duplicadas
+_endpoints = {}
+_hedge_pool = None
+
+
+def session():
+    """
+    The shared requests Session, created on first use.
+
+    The connection pool is sized by HTTP_POOL_SIZE so that concurrent workers
+    reuse keep-alive connections instead of opening one per request.
+
+    Returns:
+        requests.Session: The process-wide session.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = int(os.getenv('HTTP_POOL_SIZE', 32))
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                new_session = requests.Session()
+                new_session.mount('https://', adapter)
+                new_session.mount('http://', adapter)
+                _session = new_session
+    return _session
+
+
+def _setting(api, key, default):
+    """
+    HTTP_<API>_<KEY>, falling back to HTTP_<KEY> and then to default.
+    """
+    return os.getenv(f'HTTP_{api.upper()}_{key}') or os.getenv(f'HTTP_{key}') or default
+
+
+class Endpoint:
+    """
+    Per-API state of the HTTP layer: circuit breaker, latency window and hedging.
+
+    Hedging sends a duplicate of a request that has not answered after the
+    hedge_percentile latency (95th by default) and keeps whichever response
+    arrives first. It is off unless HTTP_HEDGE (or HTTP_<API>_HEDGE) is set,
+    waits for min_samples latencies before the first hedge, and is capped at
+    hedge_budget of the requests so a slow API is not sent twice the load.
+    """
+    def __init__(self, api):
+        self.api = api
+        self.timeout = (float(_setting(api, 'CONNECT_TIMEOUT', 5)), float(_setting(api, 'TIMEOUT', 30)))
+        self.breaker = CircuitBreaker(api, failure_threshold=int(_setting(api, 'BREAKER_FAILURES', 5)),
+                                      reset_timeout=float(_setting(api, 'BREAKER_RESET_S', 30)))
+        self.latency = LatencyWindow()
+        self.hedge = _setting(api, 'HEDGE', '0').lower() in ('1', 'true', 'yes')
+        self.hedge_percentile = float(_setting(api, 'HEDGE_PERCENTILE', 95))
+        self.hedge_budget = float(_setting(api, 'HEDGE_BUDGET', 0.05))
+        self.min_samples = int(_setting(api, 'HEDGE_MIN_SAMPLES', 100))
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0  # Requisições duplicadas que responderam antes da original
+        self._lock = threading.Lock()
+
+    def hedge_delay(self):
+        """
+        Seconds to wait before hedging the next request, or None to not hedge it.
+        """
+        if not self.hedge or self.latency.count < self.min_samples:
+            return None
+        with self._lock:
+            if self.hedges >= self.hedge_budget * self.requests:
+                return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    def snapshot(self):
+        """
+        Latency percentiles, hedging and circuit breaker counters, for metrics.
+        """
+        return {
+            **self.latency.snapshot(),
+            'requisicoes_duplicadas': self.hedges,
+            'duplicadas_vencedoras': self.hedge_wins,
+            'circuito': self.breaker.state,
+            'circuito_aberturas': self.breaker.opens,
+            'circuito_recusadas': self.breaker.rejected,
+        }
+
+
+def endpoint(api):
+    """
+    The process-wide Endpoint of an API, created on first use.
+    """
+    with _session_lock:
+        if api not in _endpoints:
+            _endpoints[api] = Endpoint(api)
+        return _endpoints[api]
+
+
+def snapshot(api, root=None):
+    """
+    Metrics of an API: latency percentiles, hedging, circuit breaker and, when enabled, the rate
+    limiter of the storage root (see get_limiter).
+    """
+    values = endpoint(api).snapshot()
+    limiter = get_limiter(api, root)
+    if limiter is not None:
+        values.update(limiter.snapshot())
+    return values
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _send(target, limiter, url, timeout, kwargs):
+    """
+    One HTTP attempt through the rate limiter, with its latency recorded.
+    """
+    with (limiter.slot() if limiter else nullcontext({})) as slot:
+        started = time.perf_counter()
+        try:
+            response = session().get(url, timeout=timeout, **kwargs)
+        finally:
+            target.latency.add(time.perf_counter() - started)  # Timeouts também entram na cauda
+        slot['status'] = response.status_code
+        if response.status_code == 429:
+            slot['retry_after'] = _retry_after(response)
+    return response
+
+
+def _pool():
+    global _hedge_pool
+    with _session_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=2 * int(os.getenv('HTTP_POOL_SIZE', 32)),
+                                             thread_name_prefix='http-hedge')
+        return _hedge_pool
+
+
+def _hedged(target, limiter, url, timeout, kwargs, step=None):
+    """
+    Send a request and, if it is slower than the hedge delay, a duplicate; return the first good response.
+    A duplicate sent counts as a retry of the step.
+    """
+    with target._lock:
+        target.requests += 1
+    delay = target.hedge_delay()
+    if delay is None:
+        return _send(target, limiter, url, timeout, kwargs)
+
+    original = _pool().submit(_send, target, limiter, url, timeout, kwargs)
+    try:
+        return original.result(timeout=delay)
+    except FutureTimeout:
+        pass
+    with target._lock:
+        target.hedges += 1
+    if step is not None:
+        step.add('retries')
+    duplicate = _pool().submit(_send, target, limiter, url, timeout, kwargs)
+
+    # A resposta perdedora termina em segundo plano e é descartada
+    pending, fallback, error = {original, duplicate}, None, None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                response = future.result()
+            except requests.RequestException as e:
+                error = e
+                continue
+            if response.status_code < 500:
+                if future is duplicate:
+                    with target._lock:
+                        target.hedge_wins += 1
+                return response
+            fallback = response
+    if fallback is not None:
+        return fallback
+    raise error
+
+
+def get(url, timeout=None, api=None, root=None, step=None, **kwargs):
+    """
+    GET through the shared session.
+
+    When api is given ('openweather', 'directions'), the request goes through
+    that API's circuit breaker and adaptive rate limiter, may be hedged (see
+    Endpoint), and a 429 is retried (up to HTTP_MAX_RETRIES times) after the
+    limiter's Retry-After pause. Timeouts are (connect, read) pairs, set with
+    HTTP_CONNECT_TIMEOUT and HTTP_TIMEOUT or per API with HTTP_<API>_TIMEOUT.
+
+    Args:
+        url (str): The URL to fetch.
+        timeout (float or tuple, optional): Seconds to wait. Defaults to the API's timeouts.
+        api (str, optional): Name of the external API.
+        root (str, optional): Storage root whose daily quota the request counts against.
+        step (StepMetrics, optional): Metrics step whose 'retries' counter receives each 429
+            re-send and each hedged duplicate.
+
+    Returns:
+        requests.Response: The response.
+
+    Raises:
+        CircuitOpenError: The API's circuit is open, so no request was sent.
+        QuotaExceeded: The API's daily quota is used up, so no request was sent.
+        requests.RequestException: The request failed without a response.
+    """
+    if api is None:
+        return session().get(url, timeout=timeout or float(os.getenv('HTTP_TIMEOUT', 30)), **kwargs)
+
+    target = endpoint(api)
+    limiter = get_limiter(api, root)
+    timeout = timeout or target.timeout
+    retries = int(os.getenv('HTTP_MAX_RETRIES', 2))
+    for attempt in range(retries + 1):
+        if attempt and step is not None:
+            step.add('retries')  # Reenvio depois de um 429
+        target.breaker.before()
+        success = None
+        try:
+            response = _hedged(target, limiter, url, timeout, kwargs, step)
+            success = response.status_code < 500
+        except QuotaExceeded:
+            raise  # Nada foi enviado: não conta como falha da API
+        except requests.RequestException:
+            success = False
+            raise
+        finally:
+            # Sempre devolve a sonda do circuito meio-aberto, mesmo em exceções inesperadas
+            if success is None:
+                target.breaker.release()
+            else:
+                target.breaker.record(success)
+        if response.status_code != 429:
+            break
+    return response
+
+
+def close():
+    """
+    Close the shared session and its pooled connections, after any hedged request still running.
+    """
+    global _session, _hedge_pool
+    with _session_lock:
+        if _hedge_pool is not None:
+            _hedge_pool.shutdown(wait=True)
+            _hedge_pool = None
+        if _session is not None:
+            _session.close()
+            _session = None
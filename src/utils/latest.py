@@ -0,0 +1,71 @@
+import os
+import threading
+
+import pandas as pd
+
+from utils.storage_paths import storage_root
+
+# Snapshot -> (colunas que identificam uma linha, coluna que decide a mais recente)
+SNAPSHOTS = {
+    'clima': (['id_city'], 'dt'),
+    'transito': (['id_city_origem', 'id_city_destino'], 'dt_ingestao'),
+}
+
+# Etapas da mesma execução publicam em paralelo; cada snapshot é regravado por uma de cada vez
+_publish_lock = threading.Lock()
+
+
+def snapshot_path(name, root=None):
+    """
+    Path of a latest-value snapshot: <root>/latest/<name>.parquet.
+    """
+    return os.path.join(storage_root(root), 'latest', f'{name}.parquet')
+
+
+def publish(name, dataframe, root=None):
+    """
+    Merge rows into the latest-value snapshot of a dataset, keeping the newest row per key.
+
+    The snapshot holds one row per key (a city, a pair of cities) and is what
+    the read service serves, so lookups never reach the database. A row
+    replaces the stored one unless it is older (e.g. a backfill of a past
+    date). The file is written to a temporary file and renamed, so a reader
+    never sees a partial snapshot.
+
+    Args:
+        name (str): Snapshot, a key of SNAPSHOTS.
+        dataframe (pd.DataFrame): Rows just loaded.
+        root (str, optional): Storage root. See storage_root().
+
+    Returns:
+        int: Rows in the snapshot.
+    """
+    keys, newest = SNAPSHOTS[name]
+    path = snapshot_path(name, root)
+    with _publish_lock:
+        if os.path.exists(path):
+            dataframe = pd.concat([pd.read_parquet(path), dataframe], ignore_index=True)
+        dataframe = (dataframe.sort_values(newest, kind='stable')
+                              .drop_duplicates(keys, keep='last')
+                              .sort_values(keys)
+                              .reset_index(drop=True))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.tmp')
+        dataframe.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    return len(dataframe)
+
+
+def load(name, root=None):
+    """
+    Read a snapshot.
+
+    Returns:
+        tuple: (DataFrame, modification time in ns), or (None, None) if it was never published.
+    """
+    path = snapshot_path(name, root)
+    try:
+        modified = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None, None
+    return pd.read_parquet(path), modified
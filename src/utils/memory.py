@@ -0,0 +1,221 @@
+import os
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:  # psutil é opcional; sem ele o RSS vem de /proc ou do resource
+    psutil = None
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """
+    Raised when a stage goes over its memory budget.
+    """
+    def __init__(self, stage, report):
+        self.stage = stage
+        self.report = report
+        lines = [f"Stage '{stage}' exceeded its memory budget of {report['budget_mb']:.1f} MB "
+                 f"(peak RSS {report['rss_peak_mb']:.1f} MB, RSS delta {report['rss_delta_mb']:+.1f} MB)."]
+        for site in report.get('top_allocations', []):
+            lines.append(f"  {site['size_mb']:.2f} MB in {site['count']} blocks at {site['site']}")
+        super().__init__('\n'.join(lines))
+
+
+def rss_mb():
+    """
+    Current resident set size of the process, in MB.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KB elsewhere
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+class _RssSampler(threading.Thread):
+    """
+    Polls RSS while a stage runs to catch the peak between the before/after readings.
+    """
+    def __init__(self, interval, budget_mb=None):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.budget_mb = budget_mb
+        self.peak = rss_mb()
+        self.exceeded = threading.Event()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+            if self.budget_mb is not None and self.peak > self.budget_mb:
+                self.exceeded.set()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.peak = max(self.peak, rss_mb())
+
+
+class MemoryTracker:
+    """
+    Optional per-stage memory accounting.
+
+    Records RSS before and after each stage and the peak in between and, when
+    tracemalloc is on, the top allocation sites. Budgets (in MB of RSS) make a
+    stage fail with MemoryBudgetExceeded and a report of where memory went.
+
+    Configuration comes from the environment:
+        MEMORY_TRACKING=1         turn tracking on
+        MEMORY_TRACEMALLOC=1      also record the top allocation sites (slower)
+        MEMORY_BUDGET_MB=2048     default budget for every stage
+        MEMORY_BUDGETS=bronze_clima:1024,silver_clima:512   per-stage budgets
+
+    RSS and tracemalloc are process-wide. When stages run concurrently (the
+    DAG executor), each one's readings include the others: their reports are
+    marked with 'scope': 'process' and list the 'overlapping' stages, and the
+    tracemalloc peak is only reset by a stage that starts alone. tracemalloc
+    is started by the first tracked stage and stopped after the last one
+    finishes.
+    """
+    def __init__(self, enabled=False, tracemalloc_on=False, default_budget_mb=None, budgets=None,
+                 top_n=10, interval=0.05):
+        self.enabled = enabled
+        self.tracemalloc_on = tracemalloc_on
+        self.default_budget_mb = default_budget_mb
+        self.budgets = budgets or {}
+        self.top_n = top_n
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._running = {}  # Etapa em execução -> (amostrador de RSS, etapas que rodaram ao mesmo tempo)
+        self._tracemalloc_users = 0  # Etapas rastreadas que usam o tracemalloc agora
+        self._owns_tracemalloc = False  # O tracemalloc foi iniciado por este rastreador
+
+    @classmethod
+    def from_env(cls):
+        budgets = {}
+        for item in filter(None, os.getenv('MEMORY_BUDGETS', '').split(',')):
+            stage, _, value = item.partition(':')
+            budgets[stage.strip()] = float(value)
+        default = os.getenv('MEMORY_BUDGET_MB')
+        return cls(
+            enabled=os.getenv('MEMORY_TRACKING', '').lower() in ('1', 'true', 'yes') or bool(budgets) or bool(default),
+            tracemalloc_on=os.getenv('MEMORY_TRACEMALLOC', '').lower() in ('1', 'true', 'yes'),
+            default_budget_mb=float(default) if default else None,
+            budgets=budgets,
+        )
+
+    def budget_for(self, stage):
+        return self.budgets.get(stage, self.default_budget_mb)
+
+    def _top_allocations(self, before):
+        after = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        stats = after.compare_to(before, 'lineno') if before is not None else after.statistics('lineno')
+        top = []
+        for stat in stats[:self.top_n]:
+            frame = stat.traceback[0]
+            size = getattr(stat, 'size_diff', stat.size)
+            count = getattr(stat, 'count_diff', stat.count)
+            if size <= 0:
+                continue
+            top.append({'site': f"{frame.filename}:{frame.lineno}", 'size_mb': size / 2**20, 'count': count})
+        return top
+
+    @contextmanager
+    def track(self, stage, step=None):
+        """
+        Track the memory used by a stage.
+
+        Args:
+            stage (str): Stage name, used to look up its budget.
+            step (StepMetrics, optional): Metrics step that receives the memory fields.
+
+        Yields:
+            dict: The report, filled in when the stage finishes.
+        """
+        report = {}
+        if not self.enabled:
+            yield report
+            return
+
+        budget = self.budget_for(stage)
+        sampler = _RssSampler(self.interval, budget)
+        overlapping = set()
+        with self._lock:
+            # Etapas simultâneas dividem o processo: cada uma passa a saber das outras
+            for other, (_, others) in self._running.items():
+                others.add(stage)
+                overlapping.add(other)
+            self._running[stage] = (sampler, overlapping)
+            before = None
+            if self.tracemalloc_on:
+                if self._tracemalloc_users == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._owns_tracemalloc = True
+                self._tracemalloc_users += 1
+                if not overlapping:
+                    tracemalloc.reset_peak()  # Com outra etapa em curso, zerar o pico apagaria o dela
+                before = tracemalloc.take_snapshot()
+
+        rss_before = rss_mb()
+        sampler.start()
+        try:
+            yield report
+        finally:
+            sampler.stop()
+            rss_after = rss_mb()
+            report.update({
+                'rss_before_mb': round(rss_before, 2),
+                'rss_after_mb': round(rss_after, 2),
+                'rss_peak_mb': round(sampler.peak, 2),
+                'rss_delta_mb': round(rss_after - rss_before, 2),
+            })
+            if budget is not None:
+                report['budget_mb'] = budget
+            with self._lock:
+                del self._running[stage]
+                report['scope'] = 'process' if overlapping else 'stage'
+                if overlapping:
+                    report['overlapping'] = sorted(overlapping)
+                if self.tracemalloc_on:
+                    report['py_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+                    report['top_allocations'] = self._top_allocations(before)
+                    self._tracemalloc_users -= 1
+                    if self._tracemalloc_users == 0 and self._owns_tracemalloc:
+                        tracemalloc.stop()
+                        self._owns_tracemalloc = False
+            if step is not None:
+                step.set(**{key: value for key, value in report.items() if key != 'top_allocations'})
+                if 'top_allocations' in report:
+                    step.set(top_allocations=report['top_allocations'])
+
+        if budget is not None and sampler.peak > budget:
+            raise MemoryBudgetExceeded(stage, report)
+
+    def check(self, stage):
+        """
+        Fail fast if the process is, or was since the stage started, over the
+        stage budget. Meant to be called between chunks of long-running work.
+        """
+        budget = self.budget_for(stage) if self.enabled else None
+        if budget is not None:
+            running = self._running.get(stage)
+            peak = rss_mb()
+            if running is not None and running[0].exceeded.is_set():
+                peak = max(peak, running[0].peak)  # Pico visto pelo amostrador entre duas verificações
+            if peak > budget:
+                raise MemoryBudgetExceeded(stage, {'budget_mb': budget, 'rss_peak_mb': peak, 'rss_delta_mb': 0.0})
+
+
+# Rastreador padrão do processo, configurado pelas variáveis MEMORY_*
+memory = MemoryTracker.from_env()
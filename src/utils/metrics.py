@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from dotenv import find_dotenv, load_dotenv
+
+from utils.storage_paths import storage_root
+
+# jsonl_path padrão: <storage root>/metrics/pipeline_metrics.jsonl, resolvido a cada gravação
+DEFAULT_PATH = object()
+
+COUNTERS = ('rows_in', 'rows_out', 'bytes_written', 'http_calls', 'retries', 'cache_hits')
+
+
+class StepMetrics:
+    """
+    Measurements of one pipeline step, filled in while the step runs.
+
+    Counters can be bumped from worker threads through add().
+    """
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.extra = {}
+        self.start = time.perf_counter()
+        self.duration = None
+        self._lock = threading.Lock()
+
+    def add(self, counter, n=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def set(self, **values):
+        """
+        Set counters or extra fields, e.g. set(rows_in=10, failures=2).
+        """
+        with self._lock:
+            for key, value in values.items():
+                if key in self.counters:
+                    self.counters[key] = value
+                else:
+                    self.extra[key] = value
+
+
+class MetricsRecorder:
+    """
+    Collects structured per-step metrics for a run.
+
+    Every finished step is appended as one JSON line to jsonl_path and added
+    to running totals per step name; records are not kept in memory, so a
+    long-lived process (daemon, read service) does not grow with every step.
+    When prom_path is set, flush() also writes the totals in the Prometheus
+    text exposition format (suitable for the node_exporter textfile
+    collector).
+    """
+    def __init__(self, jsonl_path=None, prom_path=None):
+        self._jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.run_id = uuid.uuid4().hex[:12]
+        self._totals = {}  # Etapa -> totais acumulados desde o início do processo
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build a recorder from METRICS_PATH (JSON lines, empty to disable, unset for
+        <storage root>/metrics/pipeline_metrics.jsonl) and METRICS_PROM_PATH.
+        """
+        load_dotenv(find_dotenv())
+        jsonl_path = os.getenv('METRICS_PATH', DEFAULT_PATH)
+        return cls(jsonl_path=jsonl_path or None, prom_path=os.getenv('METRICS_PROM_PATH') or None)
+
+    @property
+    def jsonl_path(self):
+        if self._jsonl_path is DEFAULT_PATH:
+            # Segue STORAGE_ROOT mesmo quando definido depois da criação do recorder (--storage-root)
+            return os.path.join(storage_root(), 'metrics', 'pipeline_metrics.jsonl')
+        return self._jsonl_path
+
+    def configure(self, jsonl_path=None, prom_path=None):
+        if jsonl_path is not None:
+            self._jsonl_path = jsonl_path or None
+        if prom_path is not None:
+            self.prom_path = prom_path or None
+
+    @contextmanager
+    def step(self, name, **labels):
+        """
+        Measure a block of code as a named step.
+
+        Usage:
+            with metrics.step('bronze.fetch', api='openweather') as m:
+                m.set(rows_in=len(cities))
+                ...
+
+        Yields:
+            StepMetrics: The step being measured.
+        """
+        step = StepMetrics(name, labels)
+        status, error = 'ok', None
+        try:
+            yield step
+        except Exception as e:
+            status, error = 'error', repr(e)
+            raise
+        finally:
+            step.duration = time.perf_counter() - step.start
+            self._emit(step.name, step.labels, step.duration, step.counters, step.extra, status, error)
+
+    def record(self, name, duration, status='ok', labels=None, **values):
+        """
+        Record a step that was timed elsewhere.
+        """
+        counters = {key: values.pop(key) for key in list(values) if key in COUNTERS}
+        self._emit(name, labels or {}, duration, counters, values, status, None)
+
+    def _emit(self, name, labels, duration, counters, extra, status, error):
+        record = {
+            'ts': datetime.now(timezone.utc).isoformat(),
+            'run_id': self.run_id,
+            'step': name,
+            'labels': labels,
+            'status': status,
+            'duration_s': round(duration, 6),
+            **counters,
+            **extra,
+        }
+        if error:
+            record['error'] = error
+
+        with self._lock:
+            entry = self._totals.setdefault(name, {'count': 0, 'errors': 0, 'duration_s': 0.0})
+            entry['count'] += 1
+            entry['errors'] += status != 'ok'
+            entry['duration_s'] += record['duration_s']
+            for key in COUNTERS:
+                value = record.get(key, 0)
+                entry[key] = entry.get(key, 0) + (value if isinstance(value, (int, float)) else 0)
+            jsonl_path = self.jsonl_path
+            if jsonl_path:
+                os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+                with open(jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, default=str) + '\n')
+
+    def summary(self):
+        """
+        Totals of the recorded steps by name, since the process started.
+
+        Returns:
+            dict: Step name -> {'count', 'errors', 'duration_s', counters...}, summed.
+        """
+        with self._lock:
+            return {step: dict(entry) for step, entry in self._totals.items()}
+
+    def flush(self):
+        """
+        Write the Prometheus text file, if configured. The file is replaced atomically.
+        """
+        if not self.prom_path:
+            return
+        lines = []
+        fields = [('duration_s', 'step_duration_seconds', 'Total seconds spent in the step'),
+                  ('count', 'step_runs', 'Times the step ran'),
+                  ('errors', 'step_errors', 'Times the step failed')]
+        fields += [(key, f'step_{key}', f'Total {key.replace("_", " ")} of the step') for key in COUNTERS]
+        summary = self.summary()
+        for key, metric, help_text in fields:
+            lines.append(f'# HELP zebrinha_{metric} {help_text}')
+            lines.append(f'# TYPE zebrinha_{metric} counter')  # Totais que só crescem durante o processo
+            for step, entry in sorted(summary.items()):
+                lines.append(f'zebrinha_{metric}{{step="{step}",run_id="{self.run_id}"}} {entry.get(key, 0)}')
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.prom_path)), exist_ok=True)
+        tmp_path = f"{self.prom_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.prom_path)
+
+
+# Recorder padrão do processo, usado por todas as etapas do pipeline
+metrics = MetricsRecorder.from_env()
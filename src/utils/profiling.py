@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import cProfile
+import threading
+import functools
+from collections import Counter
+from datetime import datetime
+
+from utils.storage_paths import storage_root
+
+# Etapas a perfilar, por nome da função ou nome qualificado ('all' para todas).
+# Lidas de ZEBRINHA_PROFILE (ex.: "fetch_weather_data,DatabaseOps.insert") ou definidas por enable().
+_enabled = frozenset(filter(None, os.getenv('ZEBRINHA_PROFILE', '').split(',')))
+# Diretório dos perfis: ZEBRINHA_PROFILE_DIR ou <storage root>/profiles, resolvido a cada gravação
+_directory = os.getenv('ZEBRINHA_PROFILE_DIR') or None
+_interval = float(os.getenv('ZEBRINHA_PROFILE_INTERVAL', 0.005))
+_active = threading.local()
+
+
+def enable(stages, directory=None, interval=None):
+    """
+    Turn profiling on for the given stages.
+
+    Args:
+        stages (iterable): Function names, qualified names, or 'all'.
+        directory (str, optional): Where profiles are written. Defaults to <storage root>/profiles.
+        interval (float, optional): Stack sampling interval in seconds.
+    """
+    global _enabled, _directory, _interval
+    _enabled = frozenset(stages)
+    if directory is not None:
+        _directory = directory
+    if interval is not None:
+        _interval = interval
+
+
+def is_enabled(*names):
+    return bool(_enabled) and ('all' in _enabled or any(name in _enabled for name in names))
+
+
+class _StackSampler(threading.Thread):
+    """
+    Samples the stack of one thread at a fixed interval and counts collapsed stacks.
+    """
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def _save(stage, profiler, sampler):
+    directory = _directory or os.path.join(storage_root(), 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{stage}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}")
+    profiler.dump_stats(f"{base}.pstats")
+    # Formato "pilha;de;chamadas contagem", aceito por flamegraph.pl e speedscope
+    with open(f"{base}.collapsed", 'w', encoding='utf-8') as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    return base
+
+
+def profiled(func):
+    """
+    Decorator that profiles a stage when it is selected via ZEBRINHA_PROFILE or enable().
+
+    Each call writes <stage>-<timestamp>.pstats (cProfile) and
+    <stage>-<timestamp>.collapsed (sampled stacks for flame graphs). When the
+    stage is not selected the only cost is one set lookup per call. Nested
+    profiled calls in the same thread are covered by the outer profile; work
+    handed to other threads (e.g. a worker pool) is not, so profile the fetch
+    stages with a single worker.
+    """
+    name, qualname = func.__name__, func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled or getattr(_active, 'on', False) or not is_enabled(name, qualname):
+            return func(*args, **kwargs)
+
+        _active.on = True
+        profiler = cProfile.Profile()
+        sampler = _StackSampler(threading.get_ident(), _interval)
+        sampler.start()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            sampler.stop()
+            _active.on = False
+            base = _save(qualname, profiler, sampler)
+            print(f"[profile][{qualname}] {time.perf_counter() - start:.3f}s -> {base}.pstats")
+
+    return wrapper
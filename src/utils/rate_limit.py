@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import requests
+
+from utils.storage_paths import storage_root
+
+# Limites padrão de cada API: requisições por minuto, por dia (0 = sem cota diária),
+# concorrência máxima e latência acima da qual a concorrência é reduzida.
+# Sobrescritos por RATE_LIMIT_<API>_PER_MINUTE, _PER_DAY, _MAX_CONCURRENCY e _TARGET_LATENCY_MS.
+DEFAULT_LIMITS = {
+    'openweather': {'per_minute': 60, 'per_day': 33000, 'max_concurrency': 16, 'target_latency_ms': 2000},
+    'directions': {'per_minute': 3000, 'per_day': 0, 'max_concurrency': 32, 'target_latency_ms': 3000},
+}
+
+
+class QuotaExceeded(requests.RequestException):
+    """
+    Raised instead of sending a request that would go over the daily quota.
+
+    It is a requests RequestException, so the stages record the city or pair
+    as a failed item (dead-letter queue) instead of aborting the whole fetch.
+    """
+
+
+class TokenBucket:
+    """
+    Classic token bucket: refills at `rate` tokens per second up to `capacity`.
+
+    reserve() always takes a token and returns how long the caller must wait
+    for it, so concurrent callers are served in arrival order.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, rate=None):
+        with self._lock:
+            now = time.monotonic()
+            if rate is not None:
+                self.rate = rate
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class AdaptiveLimiter:
+    """
+    Rate, concurrency and daily quota control for one external API.
+
+    Every request goes through acquire()/release() (or the slot() context manager):
+      - a token bucket enforces the per-minute rate;
+      - the number of requests in flight is capped by an adaptive limit (AIMD):
+        each fast, successful response adds 1/limit, and a 429, a 5xx, a
+        connection error or a response slower than target_latency_ms halves
+        it, at most once per observed latency so one burst of errors does not
+        collapse it to the minimum;
+      - a 429 pauses new requests for its Retry-After;
+      - daily consumption is counted and persisted under <storage root>/quota/.
+        Past soft_limit of the quota the rate is paced to spread the remaining
+        requests over the rest of the (UTC) day, and acquire() raises
+        QuotaExceeded rather than go over it.
+    """
+    def __init__(self, name, per_minute, per_day=0, max_concurrency=16, min_concurrency=1,
+                 target_latency_ms=2000, soft_limit=0.8, state_dir=None):
+        self.name = name
+        self.rate = per_minute / 60
+        self.per_day = per_day
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.target_latency = target_latency_ms / 1000
+        self.soft_limit = soft_limit
+        self.bucket = TokenBucket(self.rate, capacity=max(1.0, min(self.rate, max_concurrency)))
+        self.limit = float(min(max_concurrency, max(min_concurrency, 4)))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.throttled = 0  # Respostas 429 recebidas
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._quota_lock = threading.Lock()
+        self._state_path = os.path.join(state_dir or os.path.join(storage_root(), 'quota'), f'{name}.json')
+        self._day, self.used = self._load_quota()
+        self._unsaved = 0
+        atexit.register(self.save)
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).date().isoformat()
+
+    def _load_quota(self):
+        try:
+            with open(self._state_path, encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('day') == self._today():
+                return state['day'], int(state['used'])
+        except (OSError, ValueError, KeyError):
+            pass
+        return self._today(), 0
+
+    def save(self):
+        """
+        Persist the daily consumption (atomic replace).
+        """
+        with self._quota_lock:
+            os.makedirs(os.path.dirname(self._state_path), exist_ok=True)
+            tmp_path = f'{self._state_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'day': self._day, 'used': self.used}, f)
+            os.replace(tmp_path, self._state_path)
+            self._unsaved = 0
+
+    def _take_quota(self):
+        with self._quota_lock:
+            if self._day != self._today():
+                self._day, self.used = self._today(), 0
+            if self.per_day and self.used >= self.per_day:
+                raise QuotaExceeded(f"Daily quota of {self.per_day} requests for '{self.name}' is used up")
+            self.used += 1
+            self._unsaved += 1
+            flush = self._unsaved >= 10
+        if flush:
+            self.save()
+
+    def _paced_rate(self):
+        """
+        Rate allowed now: the configured one, or slower once past the soft limit of the daily quota.
+        """
+        if not self.per_day or self.used < self.per_day * self.soft_limit:
+            return self.rate
+        now = datetime.now(timezone.utc)
+        seconds_left = 86400 - (now.hour * 3600 + now.minute * 60 + now.second)
+        return max(min(self.rate, (self.per_day - self.used) / max(seconds_left, 1)), 1e-3)
+
+    def acquire(self):
+        """
+        Wait for a token and a free concurrency slot.
+
+        Returns:
+            float: time.monotonic() at which the request may start, to pass to release().
+        """
+        self._take_quota()
+        wait = self.bucket.reserve(self._paced_rate())
+        pause = self.paused_until - time.monotonic()
+        if max(wait, pause) > 0:
+            time.sleep(max(wait, pause))
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started, status=None, error=False, retry_after=None):
+        """
+        Report the outcome of a request and adapt the concurrency limit.
+
+        Args:
+            started (float): Value returned by acquire().
+            status (int, optional): HTTP status of the response.
+            error (bool, optional): The request failed without a response.
+            retry_after (float, optional): Seconds from a Retry-After header.
+        """
+        now = time.monotonic()
+        latency = now - started
+        congested = error or status == 429 or (status is not None and status >= 500) or latency > self.target_latency
+        with self._cond:
+            self.in_flight -= 1
+            if congested:
+                if now - self._last_decrease > latency:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            if status == 429:
+                self.throttled += 1
+                self.paused_until = max(self.paused_until, now + (retry_after if retry_after is not None else 1.0))
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """
+        acquire()/release() around a block. Set slot['status'] (and optionally
+        slot['retry_after']) inside the block; an exception counts as an error.
+        """
+        started = self.acquire()
+        outcome = {}
+        try:
+            yield outcome
+        except Exception:
+            self.release(started, error=True)
+            raise
+        self.release(started, outcome.get('status'), retry_after=outcome.get('retry_after'))
+
+    def snapshot(self):
+        """
+        Current state, for metrics.
+        """
+        return {
+            'concorrencia': round(self.limit, 2),
+            'respostas_429': self.throttled,
+            'cota_usada': self.used,
+            'cota_restante': self.per_day - self.used if self.per_day else None,
+        }
+
+
+_limiters = {}  # (API, diretório da cota) -> limitador
+_limiters_lock = threading.Lock()
+
+
+def enabled():
+    return os.getenv('RATE_LIMIT_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+
+
+def get_limiter(name, root=None):
+    """
+    The process-wide limiter of an API under a storage root, configured from
+    DEFAULT_LIMITS and the RATE_LIMIT_<API>_* variables. Returns None when
+    RATE_LIMIT_ENABLED is off.
+
+    The daily consumption is persisted under <root>/quota/, so each storage
+    root has its own limiter and quota file; stages sharing a root share them.
+
+    Args:
+        name (str): API name ('openweather', 'directions').
+        root (str, optional): Storage root. See storage_root().
+    """
+    if not enabled():
+        return None
+    state_dir = os.path.abspath(os.path.join(storage_root(root), 'quota'))
+    with _limiters_lock:
+        if (name, state_dir) not in _limiters:
+            settings = dict(DEFAULT_LIMITS.get(name, DEFAULT_LIMITS['directions']))
+            for key in settings:
+                value = os.getenv(f'RATE_LIMIT_{name.upper()}_{key.upper()}')
+                if value:
+                    settings[key] = float(value) if key == 'per_minute' else int(value)
+            _limiters[(name, state_dir)] = AdaptiveLimiter(name, state_dir=state_dir, **settings)
+        return _limiters[(name, state_dir)]
@@ -0,0 +1,328 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from utils import latest
+from utils.resilience import LatencyWindow
+
+
+class TTLCache:
+    """
+    LRU cache whose entries also expire ttl seconds after they were stored.
+
+    Holds up to maxsize entries; storing one more evicts the least recently
+    used. An expired entry counts as a miss and is dropped. Thread-safe.
+    """
+    def __init__(self, maxsize=10000, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # Chave -> (expira em, valor), da menos para a mais usada
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'cache_itens': len(self._entries), 'cache_acertos': self.hits, 'cache_falhas': self.misses,
+                    'cache_taxa_acerto': round(self.hits / total, 4) if total else None}
+
+
+class LatestIndex:
+    """
+    In-memory index of the latest weather per city and traffic per city pair.
+
+    Built from the snapshots that IntegracaoSilver and TrafficData publish
+    after each load (utils/latest.py) and rebuilt when a snapshot file
+    changes. A rebuild swaps whole dictionaries, so lookups never see a
+    half-loaded index and take no lock.
+    """
+    def __init__(self, root=None):
+        self.root = root
+        self.clima = {}
+        self.transito = {}
+        self.loaded = {}  # Snapshot -> (modificado em, linhas, carregado em)
+
+    @staticmethod
+    def _records(dataframe):
+        # Ida e volta pelo JSON do pandas: NaN vira null, datas viram texto ISO e os números, tipos do Python
+        return json.loads(dataframe.to_json(orient='records', date_format='iso', date_unit='s'))
+
+    def refresh(self):
+        """
+        Reload the snapshots that changed since the last refresh.
+
+        Returns:
+            bool: True if anything was reloaded.
+        """
+        changed = False
+        for name in latest.SNAPSHOTS:
+            modified = self.loaded.get(name, (None,))[0]
+            path = latest.snapshot_path(name, self.root)
+            try:
+                if modified is not None and modified == os.stat(path).st_mtime_ns:
+                    continue
+            except FileNotFoundError:
+                continue
+            dataframe, modified = latest.load(name, self.root)
+            if dataframe is None:
+                continue
+            records = self._records(dataframe)
+            if name == 'clima':
+                self.clima = {record['id_city']: record for record in records}
+            else:
+                self.transito = {(record['id_city_origem'], record['id_city_destino']): record for record in records}
+            self.loaded[name] = (modified, len(records), time.time())
+            changed = True
+        return changed
+
+    def weather(self, id_city):
+        return self.clima.get(id_city)
+
+    def traffic(self, origin, destination):
+        # Cada par é coletado em um só sentido
+        return self.transito.get((origin, destination)) or self.transito.get((destination, origin))
+
+
+class ReadService:
+    """
+    Local HTTP read API over the latest silver weather and traffic, served from memory.
+
+    Lookups go to a LatestIndex refreshed from the published snapshots every
+    refresh_seconds, through an LRU cache with TTL of each key's serialized
+    record (batch answers are joined from the cached pieces). The database
+    the pipeline loads into is never queried. A refresh that reloads a
+    snapshot clears the cache, so new data is served right away.
+
+    Endpoints (JSON):
+        GET  /clima/<id_city>                    latest weather of a city (404 if unknown)
+        GET  /clima?ids=1,2,3                    batch; also POST /clima {"ids": [...]}
+        GET  /transito/<origem>/<destino>        latest distance and duration between two cities
+        GET  /transito?pares=1-2,3-4             batch; also POST /transito {"pares": [[1, 2], ...]}
+        GET  /metricas                           requests, latency p50/p99/p999 per route, cache and snapshots
+        GET  /saude                              liveness and loaded snapshots
+
+    Batch answers keep the request order, with null for unknown keys, and
+    accept up to max_batch keys.
+
+    Usage:
+        with ReadService(port=8080) as service:
+            service.serve_forever()
+    """
+    def __init__(self, host='127.0.0.1', port=8080, root=None, cache_size=10000, ttl=30.0, refresh_seconds=5.0,
+                 max_batch=1000):
+        self.index = LatestIndex(root)
+        self.cache = TTLCache(cache_size, ttl)
+        self.refresh_seconds = refresh_seconds
+        self.max_batch = max_batch
+        self.latencies = {}  # Rota -> LatencyWindow
+        self.requests = {}  # Rota -> quantidade
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._serving = False
+        self.refresh()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def refresh(self):
+        if self.index.refresh():
+            self.cache.clear()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f'[erro][read_service][def: refresh]\n{e}')
+
+    def lookup(self, kind, keys):
+        """
+        Latest records of several keys, serialized, through the cache.
+
+        Args:
+            kind (str): 'clima' (keys are city ids) or 'transito' (keys are (origin, destination) pairs).
+            keys (list): Keys to look up.
+
+        Returns:
+            list: One JSON text per key, 'null' for an unknown key.
+        """
+        find = self.index.weather if kind == 'clima' else lambda pair: self.index.traffic(*pair)
+        results = []
+        for key in keys:
+            text = self.cache.get((kind, key))
+            if text is None:
+                text = json.dumps(find(key), ensure_ascii=False)
+                self.cache.put((kind, key), text)
+            results.append(text)
+        return results
+
+    def _record(self, route, seconds):
+        with self._stats_lock:
+            if route not in self.latencies:
+                self.latencies[route] = LatencyWindow()
+                self.requests[route] = 0
+            self.requests[route] += 1
+        self.latencies[route].add(seconds)
+
+    def metrics_snapshot(self):
+        """
+        Requests and latency percentiles per route, cache counters and snapshot ages.
+        """
+        with self._stats_lock:
+            routes = dict(self.requests)
+        now = time.time()
+        return {
+            'rotas': {route: {'requisicoes': count, **self.latencies[route].snapshot()} for route, count in routes.items()},
+            **self.cache.snapshot(),
+            'snapshots': {name: {'linhas': rows, 'idade_s': round(now - loaded_at, 1)}
+                          for name, (_, rows, loaded_at) in self.index.loaded.items()},
+        }
+
+    def _keys(self, kind, query, body):
+        """
+        Keys of a batch request, from the query string or the JSON body.
+
+        Raises:
+            ValueError: Malformed keys or too many of them.
+        """
+        if body is not None and not isinstance(body, dict):
+            raise ValueError('o corpo JSON deve ser um objeto')
+        if kind == 'clima':
+            keys = body.get('ids') if body is not None else query.get('ids', '').split(',')
+            keys = [int(key) for key in keys if str(key).strip()]
+        else:
+            pairs = body.get('pares') if body is not None else [pair.split('-') for pair in query.get('pares', '').split(',') if pair]
+            keys = [(int(origin), int(destination)) for origin, destination in pairs]
+        if len(keys) > self.max_batch:
+            raise ValueError(f'no máximo {self.max_batch} chaves por requisição')
+        return keys
+
+    def handle(self, method, path, body=None):
+        """
+        Answer one request.
+
+        Args:
+            method (str): 'GET' or 'POST'.
+            path (str): Request path with the query string.
+            body (bytes, optional): Body of a POST, JSON.
+
+        Returns:
+            tuple: (HTTP status, route label for metrics, JSON text of the answer).
+        """
+        url = urlparse(path)
+        parts = [part for part in url.path.split('/') if part]
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        try:
+            body = json.loads(body) if body else None
+            if parts == ['saude']:
+                loaded = {name: rows for name, (_, rows, _) in self.index.loaded.items()}
+                return 200, 'saude', json.dumps({'status': 'ok', 'snapshots': loaded})
+            if parts == ['metricas']:
+                return 200, 'metricas', json.dumps(self.metrics_snapshot())
+            if len(parts) == 2 and parts[0] == 'clima' and method == 'GET':
+                text, = self.lookup('clima', [int(parts[1])])
+                return (200, 'clima', text) if text != 'null' else (404, 'clima', '{"erro": "cidade não encontrada"}')
+            if len(parts) == 3 and parts[0] == 'transito' and method == 'GET':
+                text, = self.lookup('transito', [(int(parts[1]), int(parts[2]))])
+                return (200, 'transito', text) if text != 'null' else (404, 'transito', '{"erro": "par não encontrado"}')
+            if len(parts) == 1 and parts[0] in ('clima', 'transito'):
+                results = self.lookup(parts[0], self._keys(parts[0], query, body))
+                found = sum(text != 'null' for text in results)
+                return 200, f'{parts[0]}_lote', f'{{"resultados": [{", ".join(results)}], "encontrados": {found}}}'
+        except (ValueError, TypeError, AttributeError) as e:
+            return 400, 'invalida', json.dumps({'erro': f'requisição inválida: {e}'}, ensure_ascii=False)
+        return 404, 'desconhecida', '{"erro": "rota não encontrada"}'
+
+    def _handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Cabeçalhos e corpo saem em duas escritas: sem isso, o Nagle segura o corpo até o ACK do cliente
+            disable_nagle_algorithm = True
+
+            def _answer(self, method):
+                started = time.perf_counter()
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if method == 'POST' and length else None
+                status, route, answer = service.handle(method, self.path, body)
+                data = answer.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                service._record(route, time.perf_counter() - started)
+
+            def do_GET(self):
+                self._answer('GET')
+
+            def do_POST(self):
+                self._answer('POST')
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """
+        Serve from a background thread.
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        """
+        Serve from the calling thread until stop() (or KeyboardInterrupt).
+        """
+        self._serving = True
+        if not self._refresher.is_alive():
+            self._refresher.start()
+        self._server.serve_forever()
+
+    def stop(self):
+        self._stop.set()
+        if self._serving:
+            self._server.shutdown()  # Sem o laço em execução, shutdown() esperaria para sempre
+        self._server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
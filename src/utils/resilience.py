@@ -0,0 +1,126 @@
+import math
+import time
+import threading
+from collections import deque
+
+import requests
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised without calling the endpoint while its circuit is open.
+
+    It is a requests ConnectionError, so callers that already handle a failed
+    connection treat it the same way.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calling an endpoint that keeps failing.
+
+    After failure_threshold consecutive failures (connection errors, timeouts,
+    5xx) the circuit opens and every call fails immediately with
+    CircuitOpenError. After reset_timeout seconds it becomes half-open: a
+    single probe request goes through, and its outcome closes the circuit
+    again or reopens it for another reset_timeout.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0  # Falhas consecutivas
+        self.opened_at = 0.0
+        self.opens = 0  # Quantas vezes o circuito abriu
+        self.rejected = 0  # Chamadas recusadas sem tocar na rede
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before(self):
+        """
+        Check that a call may go through.
+
+        Raises:
+            CircuitOpenError: The circuit is open, or half-open with a probe already in flight.
+        """
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state, self._probing = self.HALF_OPEN, False
+            if self.state == self.OPEN or (self.state == self.HALF_OPEN and self._probing):
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit for '{self.name}' is open after {self.failures} consecutive failures")
+            if self.state == self.HALF_OPEN:
+                self._probing = True
+
+    def release(self):
+        """
+        Give back a call allowed by before() that never reached the endpoint (e.g. over the
+        quota), without counting it as a success or a failure.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record(self, success):
+        """
+        Report the outcome of a call allowed by before().
+        """
+        with self._lock:
+            self._probing = False
+            if success:
+                self.state, self.failures = self.CLOSED, 0
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state, self.opened_at = self.OPEN, time.monotonic()
+                self.opens += 1
+
+
+class LatencyWindow:
+    """
+    Latencies of the last `size` requests, for percentiles.
+
+    Sorting the window on every request would cost more than the request
+    itself, so percentiles are recomputed only after `refresh` new samples.
+    """
+    def __init__(self, size=10000, refresh=100):
+        self.refresh = refresh
+        self.count = 0
+        self._samples = deque(maxlen=size)
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def percentile(self, q):
+        """
+        The q-th percentile (0-100) in seconds, or None without samples.
+        """
+        with self._lock:
+            cached = self._cache.get(q)
+            if cached is not None and self.count - cached[0] < self.refresh:
+                return cached[1]
+            samples = sorted(self._samples)
+            count = self.count
+        if not samples:
+            return None
+        value = samples[min(len(samples) - 1, max(math.ceil(q / 100 * len(samples)) - 1, 0))]
+        with self._lock:
+            self._cache[q] = (count, value)
+        return value
+
+    def snapshot(self):
+        """
+        p50, p99 and p999 in milliseconds, for metrics.
+        """
+        values = {}
+        for label, q in (('p50', 50), ('p99', 99), ('p999', 99.9)):
+            value = self.percentile(q)
+            if value is not None:
+                values[f'lat_{label}_ms'] = round(value * 1000, 2)
+        return values
@@ -0,0 +1,100 @@
+import signal
+import threading
+import time
+
+
+class Job:
+    """
+    A function run by the Scheduler at a fixed interval.
+
+    Attributes:
+        name (str): Job name.
+        interval (float): Seconds between the starts of two runs.
+        func (callable): Called without arguments. Raising or returning False counts as a failure.
+        next_run (float): time.monotonic() of the next run.
+    """
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.next_run = time.monotonic()
+        self.runs = 0
+        self.failures = 0
+
+
+class Scheduler:
+    """
+    Run jobs on fixed intervals inside a long-lived process.
+
+    Jobs run one at a time in the calling thread, so resources kept warm
+    between cycles (connection pools, caches) are never used by two cycles at
+    once. A run that overruns its interval does not queue up the missed ones:
+    the job simply runs again as soon as possible. stop() (also called on
+    SIGINT/SIGTERM) lets the current job finish and then returns from run().
+    """
+    def __init__(self):
+        self.jobs = []
+        self._stopping = threading.Event()
+
+    def every(self, interval, name, func):
+        """
+        Schedule func to run every interval seconds, starting now.
+
+        Returns:
+            Job: The scheduled job.
+        """
+        if interval <= 0:
+            raise ValueError(f"Job '{name}' needs a positive interval")
+        job = Job(name, interval, func)
+        self.jobs.append(job)
+        return job
+
+    def stop(self, *_):
+        self._stopping.set()
+
+    @property
+    def stopping(self):
+        return self._stopping.is_set()
+
+    def install_signal_handlers(self):
+        """
+        Stop gracefully on SIGINT/SIGTERM. A second signal falls back to the default handler.
+        """
+        def handler(signum, frame):
+            print(f"[daemon] sinal {signal.Signals(signum).name} recebido, encerrando após o ciclo atual")
+            self.stop()
+            signal.signal(signum, signal.SIG_DFL)
+
+        signal.signal(signal.SIGINT, handler)
+        if hasattr(signal, 'SIGTERM'):
+            signal.signal(signal.SIGTERM, handler)
+
+    def run(self, max_runs=None):
+        """
+        Run the jobs until stop() is called.
+
+        Args:
+            max_runs (int, optional): Stop after this many job runs in total (useful for tests).
+        """
+        total = 0
+        while self.jobs and not self.stopping:
+            job = min(self.jobs, key=lambda j: j.next_run)
+            if self._stopping.wait(max(job.next_run - time.monotonic(), 0)):
+                break
+
+            try:
+                ok = job.func() is not False
+            except Exception as e:
+                print(f"[erro][scheduler][job: {job.name}]\n{e}")
+                ok = False
+            job.runs += 1
+            job.failures += not ok
+            total += 1
+
+            # Mantém a cadência fixa; ciclos perdidos por uma execução longa não se acumulam
+            job.next_run += job.interval
+            now = time.monotonic()
+            if job.next_run < now:
+                job.next_run = now
+            if max_runs is not None and total >= max_runs:
+                break
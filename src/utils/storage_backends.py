@@ -0,0 +1,343 @@
+import os
+import re
+import glob
+import threading
+import urllib.parse
+from datetime import date
+from sqlalchemy import create_engine, event, text
+
+from utils.storage_paths import storage_root
+
+
+class StorageBackend:
+    """
+    Base class for the databases DatabaseOps can write to.
+
+    A backend knows how to build its engine and how to express the few
+    statements that are not portable: schema creation, the staging table used
+    by upserts and the merge itself. Everything else goes through SQLAlchemy.
+    """
+    name = None
+
+    @property
+    def url(self):
+        raise NotImplementedError
+
+    def quote(self, name):
+        return f'"{name}"'
+
+    def qualified(self, schema, table):
+        return f"{self.quote(schema)}.{self.quote(table)}" if schema else self.quote(table)
+
+    def create_engine(self, pool_size=5, max_overflow=10, pool_recycle=1800, pool_pre_ping=True):
+        """
+        Build a new engine with the given pool settings.
+        """
+        raise NotImplementedError
+
+    def create_schema(self, conn, schema):
+        conn.execute(text(f"CREATE SCHEMA {self.quote(schema)}"))
+
+    def type_sql(self, portable):
+        """
+        Translate a portable column type from table_schemas into this backend's SQL type.
+        """
+        match = re.fullmatch(r'str\((\d+)\)', portable)
+        if match:
+            return self.TYPES['str'].format(n=match.group(1))
+        return self.TYPES[portable]
+
+    def create_table(self, conn, schema, table, spec):
+        """
+        Create a table and its indexes from a table_schemas declaration.
+        """
+        raise NotImplementedError
+
+    def staging_name(self, table, suffix, temporary=True):
+        return f"stg_{table}_{suffix}"
+
+    def create_staging(self, conn, schema, table, staging, columns, staging_schema=None):
+        """
+        Create an empty staging table with the target's column types.
+
+        Without staging_schema the table is temporary and only visible to conn;
+        with it the table is regular, so other connections can load it.
+        """
+        raise NotImplementedError
+
+    def drop_staging(self, conn, staging, staging_schema=None):
+        conn.execute(text(f"DROP TABLE {self.qualified(staging_schema, staging)}"))
+
+    def append(self, conn, schema, table, staging, columns, staging_schema=None):
+        """
+        Copy every staging row into the target.
+
+        Returns:
+            int: Number of rows inserted.
+        """
+        cols = ', '.join(self.quote(c) for c in columns)
+        return conn.execute(text(
+            f"INSERT INTO {self.qualified(schema, table)} ({cols}) "
+            f"SELECT {cols} FROM {self.qualified(staging_schema, staging)}"
+        )).rowcount
+
+    def merge(self, conn, schema, table, staging, columns, keys, staging_schema=None):
+        """
+        Apply the staging table onto the target: insert new keys and update
+        existing keys whose values changed.
+
+        Returns:
+            int: Number of rows inserted or updated.
+        """
+        raise NotImplementedError
+
+
+class SqlServerBackend(StorageBackend):
+    """
+    SQL Server through ODBC Driver 17 with Windows authentication.
+    """
+    name = 'mssql'
+    TYPES = {
+        'int': 'INT', 'bigint': 'BIGINT', 'float': 'FLOAT', 'date': 'DATE',
+        'datetime': 'DATETIME2(0)', 'str': 'NVARCHAR({n})',
+    }
+
+    def __init__(self, server=None, database='zebrinha_azul'):
+        self.server = server if server is not None else os.getenv('SERVER')
+        self.database = database
+
+    @property
+    def conn_str(self):
+        return (
+            "DRIVER={ODBC Driver 17 for SQL Server};"
+            f"SERVER={self.server};"
+            f"DATABASE={self.database};"
+            "Trusted_Connection=yes"
+        )
+
+    @property
+    def url(self):
+        return f"mssql+pyodbc:///?odbc_connect={urllib.parse.quote_plus(self.conn_str)}"
+
+    def quote(self, name):
+        return f"[{name}]"
+
+    def create_engine(self, pool_size=5, max_overflow=10, pool_recycle=1800, pool_pre_ping=True):
+        return create_engine(
+            self.url,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=pool_pre_ping,
+            fast_executemany=True,
+        )
+
+    def create_table(self, conn, schema, table, spec):
+        target = self.qualified(schema, table)
+        cols = ', '.join(f"[{name}] {self.type_sql(kind)} NULL" for name, kind in spec['columns'])
+        keys = ', '.join(f"[{k}]" for k in spec['keys'])
+
+        on = ''
+        partition = spec.get('partition_column')
+        if partition:
+            kind = dict(spec['columns'])[partition]
+            self._ensure_partition_scheme(conn, partition, self.type_sql(kind))
+            on = f" ON [ps_{partition}]([{partition}])"
+
+        conn.execute(text(f"CREATE TABLE {target} ({cols}){on}"))
+        if spec.get('storage') == 'columnstore':
+            conn.execute(text(f"CREATE CLUSTERED COLUMNSTORE INDEX [cci_{table}] ON {target}{on}"))
+            conn.execute(text(f"CREATE NONCLUSTERED INDEX [ix_{table}_keys] ON {target} ({keys}){on}"))
+        else:
+            conn.execute(text(f"CREATE CLUSTERED INDEX [cix_{table}] ON {target} ({keys}){on}"))
+
+    def _ensure_partition_scheme(self, conn, column, sql_type):
+        """
+        Create the monthly partition function and scheme for a date column if missing.
+
+        Boundaries cover DB_PARTITION_MONTHS_BACK months before and
+        DB_PARTITION_MONTHS_AHEAD months after the current month.
+        """
+        exists = conn.execute(text("SELECT COUNT(*) FROM sys.partition_schemes WHERE name = :name"),
+                              {'name': f"ps_{column}"}).scalar()
+        if exists:
+            return
+
+        back = int(os.getenv('DB_PARTITION_MONTHS_BACK', 12))
+        ahead = int(os.getenv('DB_PARTITION_MONTHS_AHEAD', 24))
+        today = date.today()
+        boundaries = []
+        for offset in range(-back, ahead + 1):
+            year, month = divmod(today.year * 12 + today.month - 1 + offset, 12)
+            boundaries.append(f"'{date(year, month + 1, 1).isoformat()}'")
+
+        conn.execute(text(
+            f"CREATE PARTITION FUNCTION [pf_{column}] ({sql_type}) AS RANGE RIGHT FOR VALUES ({', '.join(boundaries)})"
+        ))
+        conn.execute(text(f"CREATE PARTITION SCHEME [ps_{column}] AS PARTITION [pf_{column}] ALL TO ([PRIMARY])"))
+
+    def staging_name(self, table, suffix, temporary=True):
+        # '#' makes it a session temp table, dropped by the server if we don't
+        return f"#stg_{table}_{suffix}" if temporary else f"stg_{table}_{suffix}"
+
+    def create_staging(self, conn, schema, table, staging, columns, staging_schema=None):
+        col_list = ', '.join(self.quote(c) for c in columns)
+        conn.execute(text(
+            f"SELECT TOP 0 {col_list} INTO {self.qualified(staging_schema, staging)} FROM {self.qualified(schema, table)}"
+        ))
+
+    def merge(self, conn, schema, table, staging, columns, keys, staging_schema=None):
+        on = ' AND '.join(f'tgt.[{k}] = src.[{k}]' for k in keys)
+        values = [c for c in columns if c not in keys]
+        cols = ', '.join(f'[{c}]' for c in columns)
+        src_cols = ', '.join(f'src.[{c}]' for c in columns)
+
+        sql = f"MERGE {self.qualified(schema, table)} WITH (HOLDLOCK) AS tgt USING {self.qualified(staging_schema, staging)} AS src ON {on}"
+        if values:
+            # EXCEPT compares NULLs as equal, so unchanged rows are not rewritten
+            changed = (f"EXISTS (SELECT {', '.join(f'src.[{c}]' for c in values)} "
+                       f"EXCEPT SELECT {', '.join(f'tgt.[{c}]' for c in values)})")
+            sql += f" WHEN MATCHED AND {changed} THEN UPDATE SET {', '.join(f'tgt.[{c}] = src.[{c}]' for c in values)}"
+        sql += f" WHEN NOT MATCHED BY TARGET THEN INSERT ({cols}) VALUES ({src_cols});"
+        return conn.execute(text(sql)).rowcount
+
+
+class SqliteBackend(StorageBackend):
+    """
+    Embedded SQLite database, for tests, CI and benchmarks on any machine.
+
+    SQLite has no schemas, so each schema is a separate database file
+    (`<database>.<schema>.db`) attached to every pooled connection under the
+    schema name. `bronze.city_information` therefore works unchanged. The
+    files use WAL, so a transaction is atomic per schema file, not across
+    several of them.
+    """
+    name = 'sqlite'
+    # Dates are kept as ISO text, which SQLite compares and indexes correctly
+    TYPES = {
+        'int': 'INTEGER', 'bigint': 'INTEGER', 'float': 'REAL', 'date': 'TEXT',
+        'datetime': 'TEXT', 'str': 'TEXT',
+    }
+
+    def __init__(self, directory=None, database='zebrinha_azul'):
+        self.directory = directory if directory is not None else (os.getenv('SQLITE_DIR') or os.path.join(storage_root(), 'sqlite'))
+        self.database = database
+        self._schemas = set()
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"sqlite:///{os.path.abspath(self.main_path)}"
+
+    @property
+    def main_path(self):
+        return os.path.join(self.directory, f"{self.database}.db")
+
+    def schema_path(self, schema):
+        return os.path.abspath(os.path.join(self.directory, f"{self.database}.{schema}.db"))
+
+    def create_engine(self, pool_size=5, max_overflow=10, pool_recycle=1800, pool_pre_ping=True):
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = os.path.join(self.directory, f"{self.database}.")
+        for path in glob.glob(f"{glob.escape(prefix)}*.db"):
+            self._schemas.add(os.path.basename(path)[len(self.database) + 1:-3])
+
+        engine = create_engine(
+            self.url,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=pool_pre_ping,
+            connect_args={'timeout': 30, 'check_same_thread': False},
+        )
+
+        @event.listens_for(engine, 'connect')
+        def _on_connect(dbapi_conn, record):
+            dbapi_conn.execute('PRAGMA journal_mode=WAL')
+            record.info['attached'] = set()
+
+        @event.listens_for(engine, 'checkout')
+        def _on_checkout(dbapi_conn, record, proxy):
+            # Attach schemas created since this connection was opened
+            attached = record.info.setdefault('attached', set())
+            with self._lock:
+                missing = self._schemas - attached
+            for schema in missing:
+                self._attach(dbapi_conn, schema)
+                attached.add(schema)
+
+        return engine
+
+    def _attach(self, dbapi_conn, schema):
+        dbapi_conn.execute(f"ATTACH DATABASE ? AS {self.quote(schema)}", (self.schema_path(schema),))
+        dbapi_conn.execute(f"PRAGMA {self.quote(schema)}.journal_mode=WAL")
+
+    def create_schema(self, conn, schema):
+        dbapi_conn = conn.connection.dbapi_connection
+        self._attach(dbapi_conn, schema)
+        conn.connection.info.setdefault('attached', set()).add(schema)
+        with self._lock:
+            self._schemas.add(schema)
+
+    def create_table(self, conn, schema, table, spec):
+        # No clustered or columnstore storage in SQLite: plain indexes on the
+        # natural keys and on the partition column give the same access paths
+        cols = ', '.join(f'"{name}" {self.type_sql(kind)}' for name, kind in spec['columns'])
+        keys = ', '.join(f'"{k}"' for k in spec['keys'])
+        conn.execute(text(f"CREATE TABLE {self.qualified(schema, table)} ({cols})"))
+        conn.execute(text(f'CREATE INDEX {self.qualified(schema, f"ix_{table}_keys")} ON "{table}" ({keys})'))
+        partition = spec.get('partition_column')
+        if partition:
+            conn.execute(text(f'CREATE INDEX {self.qualified(schema, f"ix_{table}_{partition}")} ON "{table}" ("{partition}")'))
+
+    def create_staging(self, conn, schema, table, staging, columns, staging_schema=None):
+        col_list = ', '.join(self.quote(c) for c in columns)
+        create = "CREATE TEMP TABLE" if staging_schema is None else "CREATE TABLE"
+        conn.execute(text(
+            f"{create} {self.qualified(staging_schema, staging)} AS SELECT {col_list} FROM {self.qualified(schema, table)} WHERE 0"
+        ))
+
+    def merge(self, conn, schema, table, staging, columns, keys, staging_schema=None):
+        target = self.qualified(schema, table)
+        source = self.qualified(staging_schema, staging)
+        on = ' AND '.join(f'tgt."{k}" = src."{k}"' for k in keys)
+        values = [c for c in columns if c not in keys]
+        cols = ', '.join(self.quote(c) for c in columns)
+        affected = 0
+
+        if values:
+            # IS NOT compares NULLs as equal, so unchanged rows are not rewritten
+            changed = ' OR '.join(f'tgt."{c}" IS NOT src."{c}"' for c in values)
+            sets = ', '.join(f'"{c}" = src."{c}"' for c in values)
+            affected += conn.execute(text(
+                f'UPDATE {target} AS tgt SET {sets} FROM {source} AS src WHERE {on} AND ({changed})'
+            )).rowcount
+        affected += conn.execute(text(
+            f'INSERT INTO {target} ({cols}) SELECT {", ".join(f"src.{self.quote(c)}" for c in columns)} '
+            f'FROM {source} AS src WHERE NOT EXISTS (SELECT 1 FROM {target} AS tgt WHERE {on})'
+        )).rowcount
+        return affected
+
+
+BACKENDS = {
+    SqlServerBackend.name: SqlServerBackend,
+    SqliteBackend.name: SqliteBackend,
+}
+
+
+def get_backend(name=None, database='zebrinha_azul'):
+    """
+    Build the storage backend selected by name or by the STORAGE_BACKEND variable.
+
+    Args:
+        name (str, optional): 'mssql' (default) or 'sqlite'.
+        database (str): The database name.
+
+    Returns:
+        StorageBackend: The backend instance.
+    """
+    name = name or os.getenv('STORAGE_BACKEND', SqlServerBackend.name)
+    try:
+        return BACKENDS[name](database=database)
+    except KeyError:
+        raise ValueError(f"Unknown storage backend '{name}'. Options: {', '.join(BACKENDS)}")
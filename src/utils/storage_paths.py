@@ -0,0 +1,26 @@
+import os
+
+# Raiz dos arquivos locais (bronze, métricas, perfis), relativa a src/ por padrão
+DEFAULT_STORAGE_ROOT = os.path.join('..', 'data')
+
+
+def storage_root(root=None):
+    """
+    Resolve the local storage root: the given path, the STORAGE_ROOT variable, or ../data.
+    """
+    return root or os.getenv('STORAGE_ROOT') or DEFAULT_STORAGE_ROOT
+
+
+def bronze_dir(ref_month, ref_day, root=None):
+    """
+    Directory holding the bronze Parquet files of a reference day.
+
+    Args:
+        ref_month (int): Reference month.
+        ref_day (int): Reference day.
+        root (str, optional): Storage root. See storage_root().
+
+    Returns:
+        str: <root>/bronze/<month>/<day>, built for the current platform.
+    """
+    return os.path.join(storage_root(root), 'bronze', str(ref_month), str(ref_day))
@@ -0,0 +1,107 @@
+"""
+Declared DDL of the bronze and silver tables.
+
+Each table lists its columns with a portable type, its natural keys (indexed
+and used by upserts), its storage layout and, for tables that grow with every
+run, the ingestion date column it is partitioned by. The storage backends turn
+these declarations into CREATE TABLE / CREATE INDEX statements.
+
+Portable types: 'int', 'bigint', 'float', 'date', 'datetime' and 'str(n)'.
+Storage: 'columnstore' for fact tables, 'rowstore' (clustered on the keys)
+for small per-city tables.
+"""
+
+TABLES = {
+    ('bronze', 'city_information'): {
+        'columns': [
+            ('city', 'str(100)'), ('lon', 'float'), ('lat', 'float'), ('sigla', 'str(2)'),
+            ('id_city', 'int'), ('sunrise', 'bigint'), ('sunset', 'bigint'), ('timezone', 'int'),
+        ],
+        'keys': ['id_city'],
+        'storage': 'rowstore',
+    },
+    ('bronze', 'temperatures_information'): {
+        'columns': [
+            ('id_city', 'int'), ('temp', 'float'), ('feels_like', 'float'), ('temp_min', 'float'),
+            ('temp_max', 'float'), ('pressure', 'int'), ('id', 'int'), ('dt', 'bigint'),
+        ],
+        'keys': ['id_city', 'dt'],
+        'storage': 'columnstore',
+    },
+    ('bronze', 'weather_of_the_day'): {
+        'columns': [
+            ('id_city', 'int'), ('id', 'int'), ('main', 'str(50)'), ('description', 'str(100)'),
+            ('dt', 'bigint'), ('rain', 'float'),
+        ],
+        'keys': ['id_city', 'dt'],
+        'storage': 'columnstore',
+    },
+    ('bronze', 'wind_information'): {
+        'columns': [
+            ('speed', 'float'), ('deg', 'int'), ('gust', 'float'), ('id_city', 'int'), ('dt', 'bigint'),
+        ],
+        'keys': ['id_city', 'dt'],
+        'storage': 'columnstore',
+    },
+    ('bronze', 'traffic_direction'): {
+        'columns': [
+            ('start_address', 'str(255)'), ('end_address', 'str(255)'), ('distance', 'str(50)'),
+            ('duration', 'str(50)'), ('id_city_origem', 'int'), ('id_city_destino', 'int'),
+            ('dt_ingestao', 'date'),
+        ],
+        'keys': ['id_city_origem', 'id_city_destino', 'dt_ingestao'],
+        'storage': 'columnstore',
+        'partition_column': 'dt_ingestao',
+    },
+    ('silver', 'city_information'): {
+        'columns': [
+            ('city', 'str(100)'), ('lon', 'float'), ('lat', 'float'), ('sigla', 'str(2)'),
+            ('id_city', 'int'), ('sunrise', 'str(8)'), ('sunset', 'str(8)'), ('timezone', 'str(8)'),
+            ('ref', 'str(7)'),
+        ],
+        'keys': ['id_city'],
+        'storage': 'rowstore',
+    },
+    ('silver', 'temperatures_information'): {
+        'columns': [
+            ('id_city', 'int'), ('temp_celsius', 'float'), ('temp_fahrenheit', 'float'),
+            ('feels_like_celsius', 'float'), ('feels_like_fahrenheit', 'float'),
+            ('temp_min_celsius', 'float'), ('temp_max_celsius', 'float'),
+            ('temp_min_fahrenheit', 'float'), ('temp_max_fahrenheit', 'float'),
+            ('pressure', 'int'), ('id', 'int'), ('dt', 'bigint'), ('dt_ingestao', 'date'),
+        ],
+        'keys': ['id_city', 'dt'],
+        'storage': 'columnstore',
+        'partition_column': 'dt_ingestao',
+    },
+    ('silver', 'weather_of_the_day'): {
+        'columns': [
+            ('id_city', 'int'), ('id', 'int'), ('main', 'str(50)'), ('description', 'str(100)'),
+            ('rain', 'float'), ('date', 'datetime'),
+        ],
+        'keys': ['id_city', 'date'],
+        'storage': 'columnstore',
+    },
+    ('silver', 'wind_information'): {
+        'columns': [
+            ('id_city', 'int'), ('dt', 'bigint'), ('speed_km_h', 'float'), ('speed_mph', 'float'),
+            ('gust_km_h', 'float'), ('gust_mph', 'float'),
+        ],
+        'keys': ['id_city', 'dt'],
+        'storage': 'columnstore',
+    },
+}
+
+
+def get_table(schema, table):
+    """
+    Return the declaration of a table, or None if it is not declared.
+    """
+    return TABLES.get((schema, table))
+
+
+def natural_keys(schema):
+    """
+    Return the natural keys of every declared table of a schema, by table name.
+    """
+    return {table: spec['keys'] for (sch, table), spec in TABLES.items() if sch == schema}
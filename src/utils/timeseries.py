@@ -0,0 +1,187 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.storage_paths import storage_root
+
+# Medições da camada silver guardadas por cidade (uma série float64 por medida)
+DEFAULT_METRICS = ('temp_celsius', 'feels_like_celsius', 'temp_min_celsius', 'temp_max_celsius', 'pressure',
+                   'speed_km_h', 'gust_km_h', 'rain')
+
+# Armazenamentos abertos no processo, um por diretório
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class TimeSeriesStore:
+    """
+    Local per-city time series of the silver measurements, in memory-mapped files.
+
+    Each city has a directory <path>/<id_city>/ with one append-only,
+    fixed-width file per column: dt.i8 (observation time, epoch seconds,
+    int64) is the time index, and <metric>.f8 holds one float64 per row. The
+    row count is the size of dt.i8 / 8, so an append writes the new rows at
+    the end of each file (metrics first, dt last) and never rewrites what is
+    there; a metric file left longer by a crash mid-append is cut back on the
+    next append. The time index only grows: rows not newer than the city's
+    last dt (a re-run of the same day) are skipped.
+
+    Reads map the files and return numpy views: a time range is located
+    with a binary search on dt and sliced without copying.
+
+    Appends are serialized within the process; one process should write to
+    a store at a time.
+
+    Usage:
+        store = TimeSeriesStore(path)
+        store.append_frame(df)  # columns id_city, dt and the metrics
+        series = store.read(3448439, start=datetime(2024, 5, 1), metrics=['temp_celsius'])
+    """
+    def __init__(self, path, metrics=DEFAULT_METRICS):
+        self.path = path
+        self.metrics = tuple(metrics)
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _file(self, id_city, column):
+        return os.path.join(self.path, str(int(id_city)), 'dt.i8' if column == 'dt' else f'{column}.f8')
+
+    def _rows(self, id_city):
+        try:
+            return os.path.getsize(self._file(id_city, 'dt')) // 8
+        except FileNotFoundError:
+            return 0
+
+    def _map(self, id_city, column, rows):
+        """
+        Read-only map of the first rows of a column (an empty array for none).
+        """
+        dtype = np.int64 if column == 'dt' else np.float64
+        path = self._file(id_city, column)
+        available = os.path.getsize(path) // 8 if os.path.exists(path) else 0
+        if not rows:
+            return np.empty(0, dtype=dtype)
+        if available < rows:
+            # Medida sem todas as linhas (ainda não gravada nelas): o restante sai como NaN, em uma cópia
+            head = np.memmap(path, dtype=dtype, mode='r', shape=(available,)) if available else np.empty(0)
+            return np.concatenate([head, np.full(rows - available, np.nan)])
+        return np.memmap(path, dtype=dtype, mode='r', shape=(rows,))
+
+    def last_dt(self, id_city):
+        """
+        Time of the city's latest row, in epoch seconds, or None for a city with no rows.
+        """
+        rows = self._rows(id_city)
+        return int(self._map(id_city, 'dt', rows)[-1]) if rows else None
+
+    def cities(self):
+        """
+        Ids of the cities with rows in the store.
+        """
+        return sorted(int(name) for name in os.listdir(self.path) if name.isdigit() and self._rows(name))
+
+    def append(self, id_city, dt, values):
+        """
+        Append rows to one city's series.
+
+        Args:
+            id_city (int): City id.
+            dt (array-like): Observation times in epoch seconds, ascending.
+            values (dict): Metric -> array-like of the same length; missing metrics are stored as NaN.
+
+        Returns:
+            int: Rows appended (rows not newer than the last stored dt are skipped).
+        """
+        dt = np.asarray(dt, dtype=np.int64)
+        with self._lock:
+            rows = self._rows(id_city)
+            last = self.last_dt(id_city)
+            keep = np.ones(len(dt), dtype=bool) if last is None else dt > last
+            if not keep.any():
+                return 0
+            if np.any(np.diff(dt[keep]) <= 0):
+                raise ValueError(f'Observation times of city {id_city} must be strictly ascending')
+            os.makedirs(os.path.dirname(self._file(id_city, 'dt')), exist_ok=True)
+            for metric in self.metrics:
+                column = np.asarray(values.get(metric, np.full(len(dt), np.nan)), dtype=np.float64)[keep]
+                with open(self._file(id_city, metric), 'ab') as f:
+                    # Alinha a medida ao índice: corta sobras de uma gravação interrompida ou completa com NaN
+                    size = f.tell() // 8
+                    if size > rows:
+                        f.truncate(rows * 8)
+                    elif size < rows:
+                        f.write(np.full(rows - size, np.nan).tobytes())
+                    f.write(column.tobytes())
+            with open(self._file(id_city, 'dt'), 'ab') as f:
+                f.write(dt[keep].tobytes())
+            return int(keep.sum())
+
+    def append_frame(self, df):
+        """
+        Append rows of several cities.
+
+        Args:
+            df (DataFrame): Columns id_city, dt (epoch seconds) and any of the store's metrics.
+
+        Returns:
+            int: Rows appended.
+        """
+        appended = 0
+        df = df.dropna(subset=['id_city', 'dt']).sort_values(['id_city', 'dt'], kind='stable')
+        for id_city, rows in df.groupby('id_city', sort=False):
+            rows = rows.drop_duplicates('dt', keep='last')
+            appended += self.append(id_city, rows['dt'].to_numpy(),
+                                    {metric: rows[metric].to_numpy() for metric in self.metrics if metric in rows})
+        return appended
+
+    @staticmethod
+    def _timestamp(value):
+        if isinstance(value, (int, np.integer)):
+            return int(value)
+        value = pd.Timestamp(value)
+        return int((value.tz_localize('UTC') if value.tzinfo is None else value).timestamp())
+
+    def read(self, id_city, start=None, end=None, metrics=None):
+        """
+        One city's series in a time range, as zero-copy views of the mapped files.
+
+        Args:
+            id_city (int): City id.
+            start (datetime or int, optional): Keep rows with dt >= start (epoch seconds if int, UTC if naive).
+            end (datetime or int, optional): Keep rows with dt < end.
+            metrics (list, optional): Metrics to return. Defaults to all.
+
+        Returns:
+            dict: 'dt' and each metric -> numpy array (read-only view); empty arrays for an unknown city.
+        """
+        rows = self._rows(id_city)
+        dt = self._map(id_city, 'dt', rows)
+        first = 0 if start is None else int(np.searchsorted(dt, self._timestamp(start), 'left'))
+        last = rows if end is None else int(np.searchsorted(dt, self._timestamp(end), 'left'))
+        series = {'dt': dt[first:last]}
+        for metric in metrics or self.metrics:
+            if metric not in self.metrics:
+                raise KeyError(f"Unknown metric '{metric}'")
+            series[metric] = self._map(id_city, metric, rows)[first:last]
+        return series
+
+    def read_frame(self, id_city, start=None, end=None, metrics=None):
+        """
+        Same as read(), as a DataFrame indexed by the observation time (UTC). The data is copied.
+        """
+        series = self.read(id_city, start, end, metrics)
+        index = pd.to_datetime(np.asarray(series.pop('dt')), unit='s', utc=True).rename('dt')
+        return pd.DataFrame({metric: np.asarray(values) for metric, values in series.items()}, index=index)
+
+
+def get_store(root=None):
+    """
+    The process-wide TimeSeriesStore under a storage root (<root>/timeseries), opened on first use.
+    """
+    path = os.path.join(storage_root(root), 'timeseries')
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = TimeSeriesStore(path)
+        return _stores[path]
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# As etapas e utilitários são importados a partir de src, como em pipeline.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """
+    Raiz local temporária com o backend SQLite: bronze, checkpoints, fila de
+    falhas, cota das APIs, métricas e o banco ficam em tmp_path.
+    """
+    monkeypatch.setenv('STORAGE_ROOT', str(tmp_path))
+    monkeypatch.setenv('STORAGE_BACKEND', 'sqlite')
+    monkeypatch.setenv('SQLITE_DIR', str(tmp_path / 'sqlite'))
+    monkeypatch.delenv('METRICS_PATH', raising=False)
+    monkeypatch.delenv('DB_BATCH_SIZE', raising=False)
+    yield tmp_path
+    from utils.database_operations import dispose_engines
+    dispose_engines()
@@ -0,0 +1,59 @@
+import os
+import time
+
+import pandas as pd
+
+from utils import bronze_store
+
+
+def vento(cidades, dt=1700000000):
+    return pd.DataFrame({'speed': [3.0] * len(cidades), 'deg': [90] * len(cidades), 'gust': [None] * len(cidades),
+                         'id_city': cidades, 'dt': [dt] * len(cidades)})
+
+
+def escrever_partes(caminho, lotes):
+    for cidades in lotes:
+        bronze_store.append_part(vento(cidades), caminho, table='wind_information')
+
+
+def nomes(partes):
+    return [os.path.basename(parte) for parte in partes]
+
+
+def test_compactacao_substitui_as_partes_e_espera_a_carencia(tmp_path):
+    caminho = str(tmp_path / 'wind_information.parquet')
+    escrever_partes(caminho, [[3, 1], [2], [5, 4]])
+
+    resultado = bronze_store.compact(caminho, table='wind_information', grace_seconds=60)
+
+    assert resultado['arquivos_antes'] == 3 and resultado['linhas'] == 5 and resultado['partes_removidas'] == 0
+    # As partes substituídas continuam no disco durante a carência, mas não são mais lidas
+    assert nomes(bronze_store.list_parts(caminho)) == [
+        'part-00000-00002.parquet', 'part-00000.parquet', 'part-00001.parquet', 'part-00002.parquet']
+    assert nomes(bronze_store.live_parts(caminho)) == ['part-00000-00002.parquet']
+    assert bronze_store.read(caminho)['id_city'].tolist() == [1, 2, 3, 4, 5]
+
+    # Menos de min_parts partes vivas: nada a compactar, e a carência ainda não passou
+    assert bronze_store.compact(caminho, table='wind_information', grace_seconds=60) is None
+    assert len(bronze_store.list_parts(caminho)) == 4
+
+    # Passada a carência, a compactação seguinte remove as partes substituídas
+    antigo = time.time() - 120
+    os.utime(os.path.join(caminho, 'part-00000-00002.parquet'), (antigo, antigo))
+    assert bronze_store.compact(caminho, table='wind_information', grace_seconds=60) is None
+    assert nomes(bronze_store.list_parts(caminho)) == ['part-00000-00002.parquet']
+    assert bronze_store.read(caminho)['id_city'].tolist() == [1, 2, 3, 4, 5]
+
+
+def test_nova_compactacao_herda_as_partes_substituidas(tmp_path):
+    caminho = str(tmp_path / 'wind_information.parquet')
+    escrever_partes(caminho, [[1], [2]])
+    bronze_store.compact(caminho, table='wind_information', grace_seconds=60)
+    escrever_partes(caminho, [[3]])  # Parte gravada depois da compactação
+
+    resultado = bronze_store.compact(caminho, table='wind_information', grace_seconds=0)
+
+    assert resultado['arquivos_antes'] == 2
+    assert resultado['partes_removidas'] == 4  # As duas partes originais, o primeiro compactado e a parte nova
+    assert nomes(bronze_store.list_parts(caminho)) == ['part-00000-00002.parquet']
+    assert bronze_store.read(caminho)['id_city'].tolist() == [1, 2, 3]
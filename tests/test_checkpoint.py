@@ -0,0 +1,86 @@
+import json
+import os
+from collections import Counter
+from datetime import date
+
+import requests
+
+import pipeline
+from features.feat_bronze_clima import ClimateData
+from utils.checkpoint import Checkpoint
+from utils.scheduler import Scheduler
+
+
+class Resposta:
+    def __init__(self, dados):
+        self.status_code = 200
+        self._dados = dados
+
+    def json(self):
+        return self._dados
+
+
+def clima(city_id):
+    return {'coord': {'lon': -46.0, 'lat': -23.0}, 'weather': [{'id': 800, 'main': 'Clear', 'description': 'clear sky'}],
+            'main': {'temp': 300.0, 'feels_like': 301.0, 'temp_min': 299.0, 'temp_max': 302.0, 'pressure': 1012},
+            'wind': {'speed': 3.0, 'deg': 90, 'gust': 5.0}, 'dt': 1700000000,
+            'sys': {'country': 'BR', 'sunrise': 1699990000, 'sunset': 1700030000},
+            'timezone': -10800, 'id': city_id, 'name': f'Cidade {city_id}'}
+
+
+def test_checkpoint_de_outra_execucao_e_descartado(storage):
+    anterior = Checkpoint('bronze_clima', '2024-01-01', run_id='ciclo-1')
+    anterior.save_state(cidades=[1, 2])
+    anterior.save_response('1', {'id': 1})
+    anterior.close()
+
+    mesma = Checkpoint('bronze_clima', '2024-01-01', run_id='ciclo-1')
+    assert mesma.resumed and mesma.state['cidades'] == [1, 2] and mesma.responses() == {'1': {'id': 1}}
+
+    seguinte = Checkpoint('bronze_clima', '2024-01-01', run_id='ciclo-2')
+    assert not seguinte.resumed and seguinte.responses() == {}
+
+    # Sem identificador, a retomada continua valendo para qualquer execução anterior
+    sem_id = Checkpoint('bronze_clima', '2024-01-01')
+    sem_id.save_state(cidades=[3])
+    assert Checkpoint('bronze_clima', '2024-01-01').state['cidades'] == [3]
+
+
+def test_ciclo_do_daemon_apos_falha_busca_tudo_de_novo(storage, monkeypatch):
+    cidades = storage / 'cities.json'
+    cidades.write_text(json.dumps([{'id': 1000 + i, 'name': f'Cidade {i}', 'country': 'BR',
+                                    'coord': {'lon': -46 + i * .01, 'lat': -23 + i * .01}} for i in range(4)]))
+
+    chamadas = Counter()  # Requisições à API de clima em cada ciclo
+    ciclo = {'atual': 0}
+
+    def fake_get(self, url, *args, **kwargs):
+        chamadas[ciclo['atual']] += 1
+        return Resposta(clima(int(url.split('id=')[1].split('&')[0])))
+
+    monkeypatch.setattr(requests.Session, 'get', fake_get)
+
+    # O primeiro ciclo falha na carga, depois de coletar e gravar o checkpoint
+    insert_stage = ClimateData.insert_stage
+    checkpoints = []
+
+    def insert_stage_falha_uma_vez(self, *args, **kwargs):
+        ciclo['atual'] += 1
+        if ciclo['atual'] == 1:
+            checkpoints.append(self.checkpoint.resumed)
+            return False
+        return insert_stage(self, *args, **kwargs)
+
+    monkeypatch.setattr(ClimateData, 'insert_stage', insert_stage_falha_uma_vez)
+    monkeypatch.setattr(Scheduler, 'install_signal_handlers', lambda self: None)
+    run = Scheduler.run
+    monkeypatch.setattr(Scheduler, 'run', lambda self, max_runs=None: run(self, max_runs=2))
+
+    args = pipeline.parse_args(['--daemon', '--etapas', 'bronze_clima', '--amostra', '2', '--cidades', str(cidades),
+                                '--intervalo-clima', '0.01', '--storage-root', str(storage)])
+    assert pipeline.daemon(args) == 1  # Um ciclo falhou
+
+    assert checkpoints == [True]
+    assert chamadas[0] == 2  # Primeiro ciclo: as duas cidades sorteadas
+    assert chamadas[1] == 2  # Segundo ciclo: descarta o checkpoint e busca as duas de novo
+    assert not os.path.exists(storage / 'checkpoints' / str(date.today()) / 'bronze_clima')
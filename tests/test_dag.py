@@ -0,0 +1,46 @@
+import pytest
+
+from utils.dag import DagExecutor
+
+
+def test_etapas_abaixo_de_uma_falha_sao_puladas():
+    executadas = []
+
+    def etapa(nome, resultado=None):
+        def func():
+            executadas.append(nome)
+            return resultado
+        return func
+
+    def falha():
+        raise RuntimeError('API fora do ar')
+
+    dag = DagExecutor(max_workers=2)
+    dag.add('bronze_clima', etapa('bronze_clima', False))
+    dag.add('silver_clima', etapa('silver_clima'), inputs=['bronze_clima'])
+    dag.add('serie', etapa('serie'), inputs=['silver_clima'])
+    dag.add('bronze_transito', falha)
+    dag.add('relatorio', etapa('relatorio'), inputs=['bronze_transito', 'outra'])
+    dag.add('outra', etapa('outra'))
+
+    stages = dag.run()
+
+    assert {nome: stage.status for nome, stage in stages.items()} == {
+        'bronze_clima': 'failed', 'silver_clima': 'skipped', 'serie': 'skipped',
+        'bronze_transito': 'failed', 'relatorio': 'skipped', 'outra': 'ok',
+    }
+    assert isinstance(stages['bronze_transito'].error, RuntimeError)
+    assert sorted(executadas) == ['bronze_clima', 'outra']
+
+
+def test_dependencias_invalidas_sao_rejeitadas():
+    dag = DagExecutor()
+    dag.add('a', lambda: None, inputs=['b'])
+    dag.add('b', lambda: None, inputs=['a'])
+    with pytest.raises(ValueError, match='cycle'):
+        dag.run()
+
+    dag = DagExecutor()
+    dag.add('a', lambda: None, inputs=['inexistente'])
+    with pytest.raises(ValueError, match='unknown'):
+        dag.run()
@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from utils.database_operations import DatabaseOps
+from utils.storage_backends import SqliteBackend
+
+
+def vento(velocidades, dt=1700000000):
+    return pd.DataFrame({'speed': velocidades, 'deg': [90] * len(velocidades), 'gust': [5.0] * len(velocidades),
+                         'id_city': range(1000, 1000 + len(velocidades)), 'dt': [dt] * len(velocidades)})
+
+
+def linhas(db, tabela):
+    return db.run_query(f'SELECT * FROM bronze.{tabela} ORDER BY id_city, dt')
+
+
+def test_upsert_e_idempotente(storage):
+    db = DatabaseOps()
+    chaves = ['id_city', 'dt']
+
+    assert db.upsert(vento([3.0, 4.0]), 'bronze', 'wind_information', chaves) == 2
+    assert db.upsert(vento([3.0, 4.0]), 'bronze', 'wind_information', chaves) == 0  # Nada mudou
+    assert db.upsert(vento([3.0, 7.5]), 'bronze', 'wind_information', chaves) == 1  # Só a linha alterada
+
+    tabela = linhas(db, 'wind_information')
+    assert len(tabela) == 2
+    assert tabela['speed'].tolist() == [3.0, 7.5]
+
+
+def test_load_stage_upsert_e_idempotente(storage):
+    db = DatabaseOps()
+    chaves = {'wind_information': ['id_city', 'dt']}
+
+    for _ in range(2):
+        db.load_stage([('bronze', 'wind_information', vento([3.0, 4.0]))], if_exists='upsert', keys=chaves)
+    db.load_stage([('bronze', 'wind_information', vento([1.0], dt=1700003600))], if_exists='upsert', keys=chaves)
+
+    assert len(linhas(db, 'wind_information')) == 3
+
+
+def test_load_stage_desfaz_todas_as_tabelas_quando_uma_falha(storage, monkeypatch):
+    db = DatabaseOps()
+    clima = pd.DataFrame({'id_city': [1000], 'id': [800], 'main': ['Clear'], 'description': ['clear sky'],
+                          'dt': [1700000000], 'rain': [None]})
+    db.load_stage([('bronze', 'wind_information', vento([3.0]))])
+
+    # A aplicação da segunda tabela falha depois que a primeira já foi aplicada na transação
+    append = SqliteBackend.append
+    aplicadas = []
+
+    def append_falha_na_segunda(self, conn, schema, table, *args, **kwargs):
+        aplicadas.append(table)
+        if len(aplicadas) == 2:
+            raise OperationalError('INSERT', {}, Exception('disco cheio'))
+        return append(self, conn, schema, table, *args, **kwargs)
+
+    monkeypatch.setattr(SqliteBackend, 'append', append_falha_na_segunda)
+    with pytest.raises(OperationalError):
+        db.load_stage([('bronze', 'wind_information', vento([4.0, 5.0], dt=1700003600)),
+                       ('bronze', 'weather_of_the_day', clima)], max_workers=1)
+
+    assert aplicadas == ['wind_information', 'weather_of_the_day']
+    assert len(linhas(db, 'wind_information')) == 1  # A primeira tabela também foi desfeita
+    assert linhas(db, 'weather_of_the_day').empty
+    # As tabelas de staging são removidas mesmo com a falha
+    restantes = db.run_query("SELECT name FROM bronze.sqlite_master WHERE type = 'table'")['name'].tolist()
+    assert sorted(restantes) == ['weather_of_the_day', 'wind_information']
+
+
+def test_colunas_que_a_tabela_nao_tem_sao_rejeitadas(storage):
+    db = DatabaseOps()
+    extra = vento([3.0]).assign(umidade=[80])
+
+    with pytest.raises(ValueError, match='umidade'):
+        db.upsert(extra, 'bronze', 'wind_information', ['id_city', 'dt'])
+    with pytest.raises(ValueError, match='umidade'):
+        db.load_stage([('bronze', 'wind_information', extra)])
+    assert linhas(db, 'wind_information').empty
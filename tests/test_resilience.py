@@ -0,0 +1,75 @@
+import pytest
+
+from utils import resilience
+from utils.resilience import CircuitBreaker, CircuitOpenError
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def monotonic(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(resilience, 'time', relogio)
+    return relogio
+
+
+def chamar(breaker, sucesso):
+    breaker.before()
+    breaker.record(sucesso)
+
+
+def test_circuito_abre_apos_falhas_consecutivas(relogio):
+    breaker = CircuitBreaker('clima', failure_threshold=3, reset_timeout=30)
+
+    chamar(breaker, False)
+    chamar(breaker, False)
+    chamar(breaker, True)  # Um sucesso zera a sequência de falhas
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+
+    for _ in range(3):
+        chamar(breaker, False)
+    assert breaker.state == CircuitBreaker.OPEN and breaker.opens == 1
+
+    relogio.agora = 29
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    assert breaker.rejected == 1
+
+
+def test_meio_aberto_permite_um_teste_que_fecha_ou_reabre(relogio):
+    breaker = CircuitBreaker('clima', failure_threshold=1, reset_timeout=30)
+    chamar(breaker, False)
+
+    relogio.agora = 30
+    breaker.before()  # Requisição de teste
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before()  # Apenas um teste por vez
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN and breaker.opens == 2
+
+    relogio.agora = 45
+    with pytest.raises(CircuitOpenError):
+        breaker.before()  # Reaberto: espera outro reset_timeout a partir da falha do teste
+
+    relogio.agora = 60
+    chamar(breaker, True)
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+
+
+def test_release_devolve_o_teste_sem_decidir(relogio):
+    breaker = CircuitBreaker('clima', failure_threshold=1, reset_timeout=30)
+    chamar(breaker, False)
+
+    relogio.agora = 30
+    breaker.before()
+    breaker.release()  # Barrada pela cota, sem tocar na rede
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    chamar(breaker, True)
+    assert breaker.state == CircuitBreaker.CLOSED